@@ -3,14 +3,27 @@ from tkinter import ttk, scrolledtext, messagebox, filedialog
 import serial
 import serial.tools.list_ports
 import threading
+import os
 import time
-import csv
-import queue
-from datetime import datetime
-import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import numpy as np
+from icm20948_engine import CONFIG_PRESETS, AcquisitionEngine, parse_config_line
+from icm20948_pyramid import HistoryPyramid
+from icm20948_plot import PlotRenderer
+from icm20948_decimate import METHODS as DECIMATION_METHODS
+from icm20948_loss import format_loss
+from icm20948_console import ConsoleBuffer
+from icm20948_queue import POLICIES, BatchQueue
+from icm20948_samples import CSV_HEADER, format_csv_rows
+from icm20948_session import HEADER_NAME, is_session_path, write_session
+from icm20948_replay import ReplayPort, load_replay_source
+
+# Default address of esp32_simulator.py
+SIMULATOR_URL = "socket://localhost:9090"
+
+# Plot window choices on the monitor tab (seconds of device time)
+PLOT_WINDOWS = {"2 s": 2, "10 s": 10, "60 s": 60, "5 min": 300,
+                "30 min": 1800, "2 h": 7200, "12 h": 43200}
 
 class ICM20948Controller:
     def __init__(self, root):
@@ -18,16 +31,39 @@ class ICM20948Controller:
         self.root.title("ICM20948 Parameter Controller")
         self.root.geometry("1200x900")
         
-        # Serial connection
-        self.serial_connection = None
-        self.connected = False
-        self.data_queue = queue.Queue()
-        self.streaming = False
+        # Acquisition engine (serial port, reader thread, parsing, logging).
+        # Its sample and line listeners run on the reader thread and hand
+        # over to the Tk thread through data_queue. Status messages can also
+        # come from the Tk thread itself (send_command), so they go straight
+        # to the thread-safe console and never wait on a full queue.
+        self.engine = AcquisitionEngine()
+        # Bounded hand-off to the Tk thread; a live view drops the oldest
+        # batches rather than fall behind (selectable on the monitor tab)
+        self.data_queue = BatchQueue('drop_oldest', max_items=1000, max_samples=200000,
+                                     block_timeout=1.0, on_drop=self.on_queue_drop)
+        self.engine.add_sample_listener(lambda batch: self.queue_put(('samples', batch)))
+        self.engine.add_line_listener(lambda line: self.queue_put(('line', line)))
+        self.engine.add_status_listener(self.console_print)
         
         # Data storage
-        self.data_log = []
-        self.max_plot_points = 500
-        self.last_plot_update = 0  # Rate limiting for plot updates
+        # Preallocated columnar history of recent samples (5 minutes at 1 kHz),
+        # with min/max/mean levels reaching back hours for zoomed-out views
+        self.history_size = 300000
+        self.data_log = HistoryPyramid(self.history_size)
+        self.last_plot_update = 0  # perf_counter() of the last display refresh
+        self.display_dirty = False  # New samples since the last refresh
+        self.frame_budget = 0.012  # Seconds per tick spent draining the data queue
+        self.drain_chunk = 64  # Queue entries taken at a time within the budget
+        self.plot_window = 2  # Seconds shown per trace (decimated to the plot width)
+        self.plot_end = None  # Device ms at the right edge when scrolled back (None: live)
+        self.plot_drag = None  # (pixel x, plot_end, axes width) where a pan started
+        self.plot_interval = 1.0 / 30  # Seconds between plot refreshes (30 FPS)
+        
+        # Console messages from any thread, written to the widget once per frame
+        self.console = ConsoleBuffer()
+        self.console_lines = 0  # Lines currently in the console widget
+        self.console_max_lines = 1000
+        self.console_interval = 50  # Milliseconds between console flushes
         
         # Configuration mappings
         self.accel_ranges = {
@@ -43,6 +79,15 @@ class ICM20948Controller:
         
         self.create_widgets()
         self.update_port_list()
+        self.flush_console()
+    
+    @property
+    def connected(self):
+        return self.engine.connected
+    
+    @property
+    def streaming(self):
+        return self.engine.streaming
         
     def create_widgets(self):
         # Create main frame with tabs
@@ -74,9 +119,9 @@ class ICM20948Controller:
         port_frame = ttk.LabelFrame(self.conn_frame, text="Serial Connection")
         port_frame.pack(fill=tk.X, padx=10, pady=5)
         
-        ttk.Label(port_frame, text="Port:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(port_frame, text="Port / URL:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
         self.port_var = tk.StringVar()
-        self.port_combo = ttk.Combobox(port_frame, textvariable=self.port_var, width=15)
+        self.port_combo = ttk.Combobox(port_frame, textvariable=self.port_var, width=28)
         self.port_combo.grid(row=0, column=1, padx=5, pady=2)
         
         ttk.Button(port_frame, text="Refresh", command=self.update_port_list).grid(row=0, column=2, padx=5, pady=2)
@@ -93,6 +138,14 @@ class ICM20948Controller:
         self.status_label = ttk.Label(port_frame, text="Disconnected", foreground="red")
         self.status_label.grid(row=2, column=2, padx=5, pady=5)
         
+        # Replay a recording instead of a live device
+        ttk.Label(port_frame, text="Replay Speed:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=2)
+        self.replay_speed_var = tk.StringVar(value="1x")
+        replay_combo = ttk.Combobox(port_frame, textvariable=self.replay_speed_var,
+                                    values=["1x", "2x", "5x", "10x", "Max"], width=15)
+        replay_combo.grid(row=3, column=1, padx=5, pady=2)
+        ttk.Button(port_frame, text="Replay File...", command=self.replay_file).grid(row=3, column=2, padx=5, pady=2)
+        
         # Console output
         console_frame = ttk.LabelFrame(self.conn_frame, text="Console Output")
         console_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
@@ -146,6 +199,9 @@ class ICM20948Controller:
         ttk.Button(param_frame, text="Set",
                   command=lambda: self.send_command(f"SET_SAMPLE_RATE={self.sample_rate_var.get()}")).grid(row=3, column=2, padx=5, pady=2)
         
+        # Sends only the parameters that differ from the device's configuration
+        ttk.Button(param_frame, text="Apply All", command=self.apply_all).grid(row=4, column=1, padx=5, pady=5)
+        
         # Sensor enables
         enable_frame = ttk.LabelFrame(self.config_frame, text="Sensor Enable/Disable")
         enable_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -185,25 +241,53 @@ class ICM20948Controller:
         
         ttk.Button(stream_frame, text="Clear Data", command=self.clear_data).pack(side=tk.LEFT, padx=5, pady=5)
         
+        # Packed binary frames carry about three times as many samples per second
+        self.binary_format_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(stream_frame, text="Binary Format", variable=self.binary_format_var,
+                      command=lambda: self.send_command(
+                          "SET_FORMAT=BIN" if self.binary_format_var.get() else "SET_FORMAT=TEXT")).pack(side=tk.LEFT, padx=5, pady=5)
+        
+        # What happens when the display falls behind (see icm20948_queue)
+        ttk.Label(stream_frame, text="Display Queue:").pack(side=tk.LEFT, padx=5, pady=5)
+        self.queue_policy_var = tk.StringVar(value=self.data_queue.policy)
+        policy_combo = ttk.Combobox(stream_frame, textvariable=self.queue_policy_var,
+                                    values=list(POLICIES), width=12, state="readonly")
+        policy_combo.pack(side=tk.LEFT, padx=5, pady=5)
+        policy_combo.bind("<<ComboboxSelected>>", self.set_queue_policy)
+        
         # Real-time plot
         plot_frame = ttk.LabelFrame(self.monitor_frame, text="Real-time Data Plot")
         plot_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
-        self.fig = Figure(figsize=(12, 6), dpi=80)
-        self.ax1 = self.fig.add_subplot(221)
-        self.ax2 = self.fig.add_subplot(222)
-        self.ax3 = self.fig.add_subplot(223)
-        self.ax4 = self.fig.add_subplot(224)
+        # Window length and decimation of long windows (see icm20948_decimate)
+        plot_control = ttk.Frame(plot_frame)
+        plot_control.pack(fill=tk.X)
+        ttk.Label(plot_control, text="Window:").pack(side=tk.LEFT, padx=5)
+        self.plot_window_var = tk.StringVar(value="2 s")
+        window_combo = ttk.Combobox(plot_control, textvariable=self.plot_window_var,
+                                    values=list(PLOT_WINDOWS), width=8, state="readonly")
+        window_combo.pack(side=tk.LEFT, padx=5)
+        window_combo.bind("<<ComboboxSelected>>", self.set_plot_window)
+        ttk.Label(plot_control, text="Decimation:").pack(side=tk.LEFT, padx=5)
+        self.decimation_var = tk.StringVar(value=DECIMATION_METHODS[0])
+        decimation_combo = ttk.Combobox(plot_control, textvariable=self.decimation_var,
+                                        values=list(DECIMATION_METHODS), width=8, state="readonly")
+        decimation_combo.pack(side=tk.LEFT, padx=5)
+        decimation_combo.bind("<<ComboboxSelected>>", self.set_plot_window)
+        ttk.Button(plot_control, text="Live", command=self.plot_live).pack(side=tk.LEFT, padx=5)
+        ttk.Label(plot_control, text="Wheel zooms, drag scrolls back").pack(side=tk.LEFT, padx=5)
         
+        self.fig = Figure(figsize=(12, 6), dpi=80)
         self.canvas = FigureCanvasTkAgg(self.fig, plot_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
-        # Initialize plot data
-        self.time_data = []
-        self.accel_data = {'x': [], 'y': [], 'z': []}
-        self.gyro_data = {'x': [], 'y': [], 'z': []}
-        self.mag_data = {'x': [], 'y': [], 'z': []}
-        self.temp_data = []
+        # Axes and line artists are created once; refreshes only blit new data
+        self.plot_renderer = PlotRenderer(self.fig, self.canvas)
+        self.fig.tight_layout()
+        self.canvas.mpl_connect('scroll_event', self.on_plot_scroll)
+        self.canvas.mpl_connect('button_press_event', self.on_plot_press)
+        self.canvas.mpl_connect('motion_notify_event', self.on_plot_drag)
+        self.canvas.mpl_connect('button_release_event', self.on_plot_release)
         
     def create_logging_widgets(self):
         # Logging controls
@@ -211,7 +295,8 @@ class ICM20948Controller:
         log_control_frame.pack(fill=tk.X, padx=10, pady=5)
         
         self.log_enabled_var = tk.BooleanVar(value=False)
-        tk.Checkbutton(log_control_frame, text="Enable Logging", variable=self.log_enabled_var).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Checkbutton(log_control_frame, text="Enable Logging", variable=self.log_enabled_var,
+                      command=self.toggle_logging).pack(side=tk.LEFT, padx=5, pady=5)
         
         ttk.Button(log_control_frame, text="Select Log File", command=self.select_log_file).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(log_control_frame, text="Export Current Data", command=self.export_data).pack(side=tk.LEFT, padx=5, pady=5)
@@ -229,10 +314,18 @@ class ICM20948Controller:
         self.logging_status_label = ttk.Label(summary_frame, text="Logging: Disabled")
         self.logging_status_label.pack(side=tk.LEFT, padx=10, pady=5)
         
+        # Received/lost/malformed/duplicate/dropped sample counters
+        self.loss_label = ttk.Label(summary_frame, text="Loss: -")
+        self.loss_label.pack(side=tk.LEFT, padx=10, pady=5)
+        
+        self.lag_label = ttk.Label(summary_frame, text="Display lag: -")
+        self.lag_label.pack(side=tk.LEFT, padx=10, pady=5)
+        
     def update_port_list(self):
         """Update the list of available COM ports"""
         ports = [port.device for port in serial.tools.list_ports.comports()]
-        self.port_combo['values'] = ports
+        # URLs can be typed in too (socket://, rfcomm://, pty://); offer the simulator's
+        self.port_combo['values'] = ports + [SIMULATOR_URL]
         if ports and not self.port_var.get():
             self.port_var.set(ports[0])
     
@@ -243,89 +336,60 @@ class ICM20948Controller:
         else:
             self.disconnect()
     
-    def connect(self):
-        """Connect to serial port"""
+    def connect(self, connection=None):
+        """Connect to serial port (or to an already open port-like connection)"""
         try:
-            port = self.port_var.get()
-            baud = int(self.baud_var.get())
-            
-            self.console_print(f"Attempting to connect to {port} at {baud} baud...")
-            
-            # First, ensure any existing connection is properly closed
-            if self.serial_connection:
-                try:
-                    self.serial_connection.close()
-                    time.sleep(0.5)  # Give time for port to be released
-                except:
-                    pass
-                self.serial_connection = None
+            if connection is None:
+                self.engine.port = self.port_var.get()
+                self.engine.baudrate = int(self.baud_var.get())
             
-            # Create serial connection with proper timeouts
-            self.serial_connection = serial.Serial(
-                port=port,                                
-                baudrate=baud, 
-                timeout=1,           # Read timeout
-                write_timeout=2,     # Write timeout 
-                bytesize=8,
-                parity='N',
-                stopbits=1
-            )
+            # Opening the port reboots the ESP32 and restarts its millis()
+            self.clear_data()
             
-            # Verify connection is open
-            if not self.serial_connection.is_open:
-                raise Exception("Failed to open serial port")
+            # Opens the port, waits for the ESP32 to settle and starts the reader thread
+            self.engine.start(connection)
             
-            # Clear any existing data
-            self.serial_connection.reset_input_buffer()
-            self.serial_connection.reset_output_buffer()
-            
-            time.sleep(2)  # Wait for connection to establish
-            
-            self.connected = True
             self.connect_btn.config(text="Disconnect")
             self.status_label.config(text="Connected", foreground="green")
             
-            # Start reading thread
-            self.reading_thread = threading.Thread(target=self.read_serial_data, daemon=True)
-            self.reading_thread.start()
-            
             # Start data processing loop
             self.process_serial_data()
             
-            self.console_print(f"Connected to {port} at {baud} baud")
-            
             # Request initial configuration after a delay
             self.root.after(1000, lambda: self.send_command("CONFIG"))
             
         except Exception as e:
             messagebox.showerror("Connection Error", f"Failed to connect: {str(e)}")
             self.console_print(f"Connection failed: {str(e)}")
-            self.connected = False
-            if self.serial_connection:
-                try:
-                    self.serial_connection.close()
-                except:
-                    pass
-                self.serial_connection = None
+            self.engine.stop()
+    
+    def replay_file(self):
+        """Connect to a recorded session played back through ReplayPort"""
+        if self.connected:
+            messagebox.showwarning("Warning", "Disconnect before replaying a recording")
+            return
+        filename = filedialog.askopenfilename(
+            filetypes=[("Session files", "session.json"), ("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        if filename.endswith(HEADER_NAME):
+            filename = os.path.dirname(filename)  # Sessions are picked by their header file
+        
+        speed = self.replay_speed_var.get()
+        try:
+            session = load_replay_source(filename)
+            speed = 0 if speed == "Max" else float(speed.rstrip('x'))
+        except Exception as e:
+            messagebox.showerror("Replay Error", f"Failed to open recording: {str(e)}")
+            return
+        self.console_print(f"Replaying {len(session)} samples from {filename}")
+        self.connect(ReplayPort(session, speed=speed))
     
     def disconnect(self):
         """Disconnect from serial port"""
         self.console_print("Disconnecting...")
-        self.connected = False
-        
-        # Wait for reading thread to stop
-        if hasattr(self, 'reading_thread') and self.reading_thread.is_alive():
-            self.console_print("Waiting for reading thread to stop...")
-            time.sleep(0.5)
-        
-        if self.serial_connection:
-            try:
-                self.serial_connection.close()
-                self.console_print("Serial connection closed")
-            except Exception as e:
-                self.console_print(f"Error closing serial: {e}")
-            finally:
-                self.serial_connection = None
+        self.engine.stop()
         
         self.connect_btn.config(text="Connect")
         self.status_label.config(text="Disconnected", foreground="red")
@@ -333,91 +397,34 @@ class ICM20948Controller:
     
     def test_connection(self):
         """Test if connection is working by checking basic properties"""
-        if not self.connected or not self.serial_connection:
+        serial_connection = self.engine.serial_connection
+        if not self.connected or not serial_connection:
             self.console_print("Not connected!")
             return
             
         try:
-            self.console_print(f"Port: {self.serial_connection.port}")
-            self.console_print(f"Baudrate: {self.serial_connection.baudrate}")
-            self.console_print(f"Is open: {self.serial_connection.is_open}")
-            self.console_print(f"Bytes waiting: {self.serial_connection.in_waiting}")
-            self.console_print(f"Timeout: {self.serial_connection.timeout}")
-            
-            # Try to send a simple character and wait longer
-            self.console_print("Sending test character...")
-            self.serial_connection.write(b'\r\n')
-            self.serial_connection.flush()
-            
-            # Wait longer and check multiple times
-            for i in range(10):
-                time.sleep(0.5)
-                waiting = self.serial_connection.in_waiting
-                self.console_print(f"Bytes waiting after {(i+1)*0.5}s: {waiting}")
-                if waiting > 0:
-                    # Try to read what's there
-                    data = self.serial_connection.read(waiting)
-                    self.console_print(f"Received data: {data}")
-                    break
-            
-            # Try sending a specific command
+            self.console_print(f"Port: {serial_connection.port}")
+            self.console_print(f"Baudrate: {serial_connection.baudrate}")
+            self.console_print(f"Is open: {serial_connection.is_open}")
+            self.console_print(f"Bytes waiting: {serial_connection.in_waiting}")
+            self.console_print(f"Timeout: {serial_connection.timeout}")
+            self.console_print(f"Samples: {format_loss(self.engine.loss.snapshot())}")
+            
+            # Send a HELP command; the reply shows up through the reader thread
             self.console_print("Sending HELP command for test...")
-            self.serial_connection.write(b'HELP\r\n')
-            self.serial_connection.flush()
-            
-            time.sleep(2)
-            waiting = self.serial_connection.in_waiting
-            self.console_print(f"Bytes waiting after HELP: {waiting}")
-            if waiting > 0:
-                data = self.serial_connection.read(waiting)
-                self.console_print(f"HELP response: {data}")
+            self.engine.send_command("HELP")
             
         except Exception as e:
             self.console_print(f"Connection test failed: {str(e)}")
     
     def send_command(self, command):
         """Send command to ESP32"""
-        if not self.connected or not self.serial_connection:
+        if not self.connected:
             messagebox.showwarning("Not Connected", "Please connect to a device first")
             return
         
         try:
-            self.console_print(f"=== SENDING COMMAND: {command} ===")
-            
-            # Check if port is still open
-            if not self.serial_connection.is_open:
-                self.console_print("Serial port is closed. Attempting to reconnect...")
-                self.disconnect()
-                return
-            
-            # Clear any pending input before sending command
-            try:
-                if self.serial_connection.in_waiting > 0:
-                    waiting_bytes = self.serial_connection.in_waiting
-                    self.console_print(f"Clearing {waiting_bytes} waiting bytes...")
-                    self.serial_connection.reset_input_buffer()
-            except Exception as buffer_error:
-                self.console_print(f"Buffer clear error: {buffer_error}")
-            
-            # Send command with proper encoding and termination
-            command_bytes = (command + '\r\n').encode('utf-8')
-            self.console_print(f"Sending {len(command_bytes)} bytes: {command_bytes}")
-            
-            # Use write timeout to prevent hanging
-            old_timeout = self.serial_connection.write_timeout
-            self.serial_connection.write_timeout = 1.0  # 1 second write timeout
-            
-            bytes_written = self.serial_connection.write(command_bytes)
-            self.serial_connection.flush()  # Ensure data is sent
-            
-            # Restore original timeout
-            self.serial_connection.write_timeout = old_timeout
-            
-            self.console_print(f"Successfully sent {bytes_written} bytes: {command}")
-            
-            # Give a moment for the ESP32 to process
-            time.sleep(0.1)
-            
+            self.engine.send_command(command)
         except serial.SerialTimeoutException:
             self.console_print(f"Timeout sending command: {command}")
             messagebox.showerror("Timeout Error", f"Timeout sending command: {command}")
@@ -429,200 +436,169 @@ class ICM20948Controller:
                 self.console_print("Port access error detected. Disconnecting...")
                 self.disconnect()
     
-    def read_serial_data(self):
-        """Read data from serial port with improved error handling"""
-        while self.connected and self.serial_connection:
-            try:
-                # Use a longer sleep to prevent excessive CPU usage
-                time.sleep(0.02)  # 20ms sleep - less aggressive polling
-                
-                if self.serial_connection and self.serial_connection.in_waiting > 0:
-                    try:
-                        # Read with timeout to prevent hanging
-                        raw_line = self.serial_connection.readline()
-                        if raw_line:
-                            try:
-                                line = raw_line.decode('utf-8').strip()
-                            except UnicodeDecodeError:
-                                # Fallback to latin-1 which can decode any byte sequence
-                                line = raw_line.decode('latin-1').strip()
-                                if len(self.data_log) % 100 == 0:  # Reduced spam
-                                    self.console_print(f"Debug: Received latin-1 data")
-                            
-                            if line and len(line) > 0:
-                                # Use a limited queue size to prevent memory issues
-                                if self.data_queue.qsize() < 1000:  # Limit queue size
-                                    self.data_queue.put(line)
-                                else:
-                                    # Queue is full, remove old items
-                                    try:
-                                        self.data_queue.get_nowait()
-                                        self.data_queue.put(line)
-                                    except queue.Empty:
-                                        pass
-                    except Exception as decode_error:
-                        # If all else fails, skip this line
-                        if len(self.data_log) % 100 == 0:  # Reduced error spam
-                            self.console_print(f"Debug: Skipped undecodable data")
-                        continue
-                        
-            except Exception as e:
-                if self.connected:
-                    self.console_print(f"Read error: {str(e)}")
-                    # If we get repeated errors, disconnect to prevent hanging
-                    if "access is denied" in str(e).lower():
-                        self.console_print("Serial port access error - disconnecting")
-                        self.root.after(10, self.disconnect)
-                break
-        
-        self.console_print("Serial reading thread stopped")
+    def queue_put(self, item):
+        """Queue an item from the engine's reader thread for the GUI thread"""
+        self.data_queue.put(*item)
+    
+    def on_queue_drop(self, kind, item):
+        """Count samples the queue policy discarded"""
+        if kind == 'samples':
+            self.engine.loss.record_drop('gui_queue', len(item))
+    
+    def set_queue_policy(self, event=None):
+        """Apply the display queue policy selected on the monitor tab"""
+        self.data_queue.policy = self.queue_policy_var.get()
+        self.console_print(f"Display queue policy: {self.data_queue.policy}")
+    
+    def set_plot_window(self, event=None):
+        """Apply the plot window and decimation selected on the monitor tab"""
+        self.plot_window = PLOT_WINDOWS[self.plot_window_var.get()]
+        self.plot_renderer.decimation = self.decimation_var.get()
+        self.redraw_plot()
+    
+    def redraw_plot(self, throttle=False):
+        """Refresh the plot after a view change (at most once per frame if throttled)"""
+        self.display_dirty = True
+        if not throttle:
+            self.last_plot_update = 0
+        self.refresh_display()
+    
+    def plot_live(self):
+        """Follow the newest samples again after scrolling back"""
+        self.plot_end = None
+        self.plot_drag = None
+        self.redraw_plot()
+    
+    def on_plot_scroll(self, event):
+        """Zoom the time axis: wheel up halves the window, down doubles it"""
+        if event.inaxes is None:
+            return
+        self.plot_window = min(max(self.plot_window * (0.5 if event.button == 'up' else 2.0), 0.05),
+                               max(PLOT_WINDOWS.values()))
+        self.plot_window_var.set(f"{self.plot_window:g} s")
+        self.redraw_plot(throttle=True)
+    
+    def on_plot_press(self, event):
+        if event.inaxes is None or event.button != 1 or not len(self.data_log):
+            return
+        if event.dblclick:
+            self.plot_live()
+            return
+        end = self.plot_end if self.plot_end is not None else int(self.data_log.last(1)['timestamp'][0])
+        self.plot_drag = (event.x, end, event.inaxes.bbox.width)
+    
+    def on_plot_drag(self, event):
+        """Scroll the view with the mouse: dragging right moves back in time"""
+        if self.plot_drag is None:
+            return
+        start_x, start_end, width = self.plot_drag
+        shift_ms = (event.x - start_x) / width * self.plot_window * 1000
+        newest = int(self.data_log.last(1)['timestamp'][0])
+        end = start_end - shift_ms
+        self.plot_end = None if end >= newest else int(end)
+        self.redraw_plot(throttle=True)
+    
+    def on_plot_release(self, event):
+        if self.plot_drag is not None:
+            self.plot_drag = None
+            self.redraw_plot()
     
     def process_serial_data(self):
-        """Process received serial data"""
+        """Drain the data queue for up to frame_budget seconds, then refresh the display once
+        
+        Whole batches are taken per tick, so throughput does not depend on the
+        sample rate; label and plot updates are coalesced into one pass per frame.
+        """
+        deadline = time.perf_counter() + self.frame_budget
         try:
-            data_processed = False
-            # Process multiple messages at once but limit to prevent blocking
-            message_count = 0
-            max_messages_per_cycle = 10  # Limit messages processed per cycle
-            
-            while not self.data_queue.empty() and message_count < max_messages_per_cycle:
-                line = self.data_queue.get_nowait()
-                data_processed = True
-                message_count += 1
-                
-                # Only show every 10th data message to reduce console spam
-                if line.startswith("DATA:"):
-                    if len(self.data_log) % 10 == 0:  # Show every 10th data point
-                        self.console_print(f"Processing DATA... (point #{len(self.data_log)})")
-                    self.parse_data_line(line)
-                elif line.startswith("CONFIG:"):
-                    self.console_print("Processing CONFIG line...")
-                    self.parse_config_line(line)
-                elif line.startswith("DEBUG:"):
-                    self.console_print(f"ESP32 Debug: {line}")
-                elif line.startswith("I2C device found"):
-                    self.console_print(f"I2C Scan: {line}")
-                elif "Available commands:" in line or line.startswith("  "):
-                    self.console_print(f"Help: {line}")
-                elif any(word in line.lower() for word in ["started", "stopped", "applied", "enabled", "disabled", "scanning", "rate set"]):
-                    self.console_print(f"ESP32 Status: {line}")
-                elif line.strip() == "":
-                    # Ignore empty lines
-                    pass
-                else:
-                    # Only show "Unknown format" for truly unexpected lines
-                    if len(line.strip()) > 0:  # Don't show for empty lines
-                        self.console_print(f"ESP32 Message: {line}")
-                    
-        except queue.Empty:
-            pass
+            while time.perf_counter() < deadline:
+                entries = self.data_queue.drain(self.drain_chunk)
+                if not entries:
+                    break
+                for kind, item in entries:
+                    if kind == 'samples':
+                        self.data_log.append(item)
+                        self.display_dirty = True
+                    else:
+                        self.handle_line(item)
         except Exception as e:
             self.console_print(f"Data processing error: {str(e)}")
         
+        self.refresh_display()
+        
         # Schedule next update with adaptive timing
         if self.connected:
-            # Use longer interval when streaming to prevent GUI blocking
-            interval = 200 if self.streaming else 100
+            if not self.data_queue.empty():
+                interval = 1  # Still behind: come back as soon as Tk has handled its events
+            else:
+                # Poll once per plot frame while streaming
+                interval = int(self.plot_interval * 1000) if self.streaming else 100
             self.root.after(interval, self.process_serial_data)
+        else:
+            self.connect_btn.config(text="Connect")
+            self.status_label.config(text="Disconnected", foreground="red")
     
-    def parse_data_line(self, line):
-        """Parse incoming data line"""
-        try:
-            # Format: DATA:timestamp,ax,ay,az,gx,gy,gz,mx,my,mz,temp
-            parts = line.split(':')[1].split(',')
-            
-            if len(parts) >= 11:
-                timestamp = int(parts[0])
-                ax, ay, az = float(parts[1]), float(parts[2]), float(parts[3])
-                gx, gy, gz = float(parts[4]), float(parts[5]), float(parts[6])
-                mx, my, mz = float(parts[7]), float(parts[8]), float(parts[9])
-                temp = float(parts[10])
-                
-                # Store data
-                current_time = time.time()
-                data_point = {
-                    'timestamp': timestamp,
-                    'time': current_time,
-                    'accel': {'x': ax, 'y': ay, 'z': az},
-                    'gyro': {'x': gx, 'y': gy, 'z': gz},
-                    'mag': {'x': mx, 'y': my, 'z': mz},
-                    'temp': temp
-                }
-                
-                self.data_log.append(data_point)
-                
-                # Limit data size to prevent memory issues
-                if len(self.data_log) > self.max_plot_points:
-                    self.data_log.pop(0)
-                
-                # Update plots with more aggressive rate limiting (max 5 FPS when streaming)
-                current_time = time.time()
-                update_interval = 0.2 if self.streaming else 0.1  # 5 FPS when streaming, 10 FPS otherwise
-                if current_time - self.last_plot_update > update_interval:
-                    # Schedule plot update in next GUI cycle to prevent blocking
-                    self.root.after_idle(self.update_plots)
-                    self.last_plot_update = current_time
-                
-                # Log to file if enabled
-                if self.log_enabled_var.get() and hasattr(self, 'log_file'):
-                    self.write_to_log(data_point)
-                
-                # Update data count less frequently to reduce GUI overhead
-                if len(self.data_log) % 5 == 0:  # Update every 5 data points
-                    self.data_count_label.config(text=f"Data points: {len(self.data_log)}")
-            else:
-                if len(self.data_log) % 50 == 0:  # Only show occasional parsing errors
-                    self.console_print(f"Invalid data format - expected 11 parts, got {len(parts)}")
-                
-        except Exception as e:
-            if len(self.data_log) % 50 == 0:  # Only show occasional parsing errors
-                self.console_print(f"Data parsing error: {str(e)}")
-                self.console_print(f"Problematic line: {line}")
-                current_time = time.time()
-                if current_time - self.last_plot_update > 0.1:  # 100ms = 10 FPS
-                    self.update_plots()
-                    self.last_plot_update = current_time
-                
-                # Log to file if enabled
-                if self.log_enabled_var.get() and hasattr(self, 'log_file'):
-                    self.write_to_log(data_point)
-                
-                # Update data count
-                self.data_count_label.config(text=f"Data points: {len(self.data_log)}")
-            else:
-                self.console_print(f"Invalid data format - expected 11 parts, got {len(parts)}")
-                
-        except Exception as e:
-            self.console_print(f"Data parsing error: {str(e)}")
-            self.console_print(f"Problematic line: {line}")
+    def handle_line(self, line):
+        """Show a non-DATA line from the device in the console"""
+        if line.startswith("CONFIG:"):
+            self.console_print("Processing CONFIG line...")
+            self.parse_config_line(line)
+        elif line.startswith("DEBUG:"):
+            self.console_print(f"ESP32 Debug: {line}")
+        elif line.startswith("I2C device found"):
+            self.console_print(f"I2C Scan: {line}")
+        elif "Available commands:" in line or line.startswith("  "):
+            self.console_print(f"Help: {line}")
+        elif any(word in line.lower() for word in ["started", "stopped", "applied", "enabled", "disabled", "scanning", "rate set", "format set"]):
+            self.console_print(f"ESP32 Status: {line}")
+        elif line.strip():
+            self.console_print(f"ESP32 Message: {line}")
+    
+    def refresh_display(self):
+        """Update the plot and the summary labels, at most once per plot frame"""
+        now = time.perf_counter()
+        if not self.display_dirty or now - self.last_plot_update < self.plot_interval:
+            return
+        self.display_dirty = False
+        self.last_plot_update = now
+        
+        self.update_plots()
+        self.data_count_label.config(text=f"Data points: {len(self.data_log)}")
+        if self.engine.log_writer:
+            self.logging_status_label.config(text=f"Logging: Enabled (backlog {self.engine.log_backlog})")
+        loss = self.engine.loss.snapshot()
+        self.loss_label.config(text=f"Lost: {loss['lost']}  Malformed: {loss['malformed'] + loss['crc_errors']}  "
+                                    f"Duplicates: {loss['duplicates']}  Dropped: {sum(loss['dropped'].values())}")
+        # Age of the newest sample on screen (when it was taken to now)
+        if len(self.data_log):
+            lag = time.time() - float(self.data_log.last(1)['time'][0])
+            self.lag_label.config(text=f"Display lag: {lag * 1000:.0f} ms")
     
     def parse_config_line(self, line):
         """Parse configuration response"""
         try:
-            # Format: CONFIG:ACCEL_RANGE=1,GYRO_RANGE=0,MAG_RATE=2,SAMPLE_RATE=100,...
             self.console_print(f"Parsing CONFIG line: {line}")
-            config_str = line.split(':')[1]
-            config_pairs = config_str.split(',')
-            self.console_print(f"Found {len(config_pairs)} config parameters")
-            
-            for pair in config_pairs:
-                key, value = pair.split('=')
-                if key == "ACCEL_RANGE":
-                    self.accel_range_var.set(int(value))
-                elif key == "GYRO_RANGE":
-                    self.gyro_range_var.set(int(value))
-                elif key == "MAG_RATE":
-                    self.mag_rate_var.set(int(value))
-                elif key == "SAMPLE_RATE":
-                    self.sample_rate_var.set(int(value))
-                elif key == "EN_ACCEL":
-                    self.enable_accel_var.set(bool(int(value)))
-                elif key == "EN_GYRO":
-                    self.enable_gyro_var.set(bool(int(value)))
-                elif key == "EN_MAG":
-                    self.enable_mag_var.set(bool(int(value)))
-                elif key == "EN_TEMP":
-                    self.enable_temp_var.set(bool(int(value)))
+            config = parse_config_line(line)
+            self.console_print(f"Found {len(config)} config parameters")
+            
+            if 'accel_range' in config:
+                self.accel_range_var.set(config['accel_range'])
+            if 'gyro_range' in config:
+                self.gyro_range_var.set(config['gyro_range'])
+            if 'mag_rate' in config:
+                self.mag_rate_var.set(config['mag_rate'])
+            if 'sample_rate' in config:
+                self.sample_rate_var.set(config['sample_rate'])
+            if 'enable_accel' in config:
+                self.enable_accel_var.set(bool(config['enable_accel']))
+            if 'enable_gyro' in config:
+                self.enable_gyro_var.set(bool(config['enable_gyro']))
+            if 'enable_mag' in config:
+                self.enable_mag_var.set(bool(config['enable_mag']))
+            if 'enable_temp' in config:
+                self.enable_temp_var.set(bool(config['enable_temp']))
+            if 'binary' in config:
+                self.binary_format_var.set(bool(config['binary']))
             
             self.console_print("✅ Configuration successfully updated from device!")
             
@@ -630,74 +606,20 @@ class ICM20948Controller:
             self.console_print(f"Config parsing error: {str(e)} - Line was: {line}")
     
     def update_plots(self):
-        """Update real-time plots with thread safety and performance optimization"""
-        if not self.data_log:
+        """Refresh the real-time plots from the most recent samples"""
+        if len(self.data_log) < 2:
             return
         
         try:
-            # Extract recent data (use fewer points for better performance)
-            recent_data = self.data_log[-30:]  # Only last 30 points for smooth performance
-            if len(recent_data) < 2:
-                return
-                
-            times = [d['time'] - recent_data[0]['time'] for d in recent_data]
-            
-            # Clear plots
-            self.ax1.clear()
-            self.ax2.clear()
-            self.ax3.clear()
-            self.ax4.clear()
-            
-            # Plot accelerometer data with reduced line complexity
-            accel_x = [d['accel']['x'] for d in recent_data]
-            accel_y = [d['accel']['y'] for d in recent_data]
-            accel_z = [d['accel']['z'] for d in recent_data]
-            
-            self.ax1.plot(times, accel_x, 'r-', label='X', linewidth=1, alpha=0.8)
-            self.ax1.plot(times, accel_y, 'g-', label='Y', linewidth=1, alpha=0.8)
-            self.ax1.plot(times, accel_z, 'b-', label='Z', linewidth=1, alpha=0.8)
-            self.ax1.set_title('Accelerometer (m/s²)', fontsize=10)
-            self.ax1.legend(fontsize=8)
-            self.ax1.grid(True, alpha=0.3)
-            
-            # Plot gyroscope data
-            gyro_x = [d['gyro']['x'] for d in recent_data]
-            gyro_y = [d['gyro']['y'] for d in recent_data]
-            gyro_z = [d['gyro']['z'] for d in recent_data]
-            
-            self.ax2.plot(times, gyro_x, 'r-', label='X', linewidth=1, alpha=0.8)
-            self.ax2.plot(times, gyro_y, 'g-', label='Y', linewidth=1, alpha=0.8)
-            self.ax2.plot(times, gyro_z, 'b-', label='Z', linewidth=1, alpha=0.8)
-            self.ax2.set_title('Gyroscope (rad/s)', fontsize=10)
-            self.ax2.legend(fontsize=8)
-            self.ax2.grid(True, alpha=0.3)
-            
-            # Plot magnetometer data
-            mag_x = [d['mag']['x'] for d in recent_data]
-            mag_y = [d['mag']['y'] for d in recent_data]
-            mag_z = [d['mag']['z'] for d in recent_data]
-            
-            self.ax3.plot(times, mag_x, 'r-', label='X', linewidth=1, alpha=0.8)
-            self.ax3.plot(times, mag_y, 'g-', label='Y', linewidth=1, alpha=0.8)
-            self.ax3.plot(times, mag_z, 'b-', label='Z', linewidth=1, alpha=0.8)
-            self.ax3.set_title('Magnetometer (µT)', fontsize=10)
-            self.ax3.legend(fontsize=8)
-            self.ax3.grid(True, alpha=0.3)
-            
-            # Plot temperature
-            temps = [d['temp'] for d in recent_data]
-            self.ax4.plot(times, temps, 'orange', linewidth=2, alpha=0.8)
-            self.ax4.set_title('Temperature (°C)', fontsize=10)
-            self.ax4.grid(True, alpha=0.3)
-            
-            # Use draw_idle() for non-blocking update
-            self.canvas.draw_idle()
-            
+            # Window in device time from the history level that matches the
+            # zoom; the time axis stays relative to the newest sample
+            points = self.plot_renderer.max_points()
+            _, window = self.data_log.window(self.plot_window * 1000, points, self.plot_end)
+            self.plot_renderer.update(window, origin=int(self.data_log.last(1)['timestamp'][0]))
         except Exception as e:
             # Don't let plot errors crash the GUI, but log less frequently
             if len(self.data_log) % 100 == 0:
                 self.console_print(f"Plot update error: {str(e)}")
-            pass
     
     def start_streaming(self):
         """Start data streaming (non-blocking)"""
@@ -715,14 +637,12 @@ class ICM20948Controller:
         # Use threading to prevent GUI freeze
         def start_stream_thread():
             try:
-                self.send_command("START")
-                self.streaming = True
-                # Update GUI elements in main thread
-                self.root.after(10, lambda: self.console_print("Streaming started successfully"))
+                self.engine.start_streaming().result()  # Wait for the device to acknowledge
+                self.console_print("Streaming started successfully")
             except Exception as e:
-                self.streaming = False
+                self.engine.streaming = False
+                self.console_print(f"Error starting stream: {e}")
                 self.root.after(10, lambda: [
-                    self.console_print(f"Error starting stream: {e}"),
                     self.start_btn.config(state="normal"),
                     self.stop_btn.config(state="disabled")
                 ])
@@ -736,18 +656,17 @@ class ICM20948Controller:
         self.console_print("Stopping data streaming...")
         
         # Update GUI immediately to show responsiveness
-        self.streaming = False
+        self.engine.streaming = False
         self.start_btn.config(state="normal")
         self.stop_btn.config(state="disabled")
         
         # Use threading to prevent GUI freeze
         def stop_stream_thread():
             try:
-                self.send_command("STOP")
-                # Update GUI elements in main thread
-                self.root.after(10, lambda: self.console_print("Streaming stopped successfully"))
+                self.engine.stop_streaming().result()
+                self.console_print("Streaming stopped successfully")
             except Exception as e:
-                self.root.after(10, lambda: self.console_print(f"Error stopping stream: {e}"))
+                self.console_print(f"Error stopping stream: {e}")
         
         # Start in separate thread to prevent blocking
         threading.Thread(target=stop_stream_thread, daemon=True).start()
@@ -756,119 +675,116 @@ class ICM20948Controller:
     def clear_data(self):
         """Clear all collected data"""
         self.data_log.clear()
+        self.plot_end = None
         self.data_count_label.config(text="Data points: 0")
         
         # Clear plots
-        self.ax1.clear()
-        self.ax2.clear()
-        self.ax3.clear()
-        self.ax4.clear()
-        self.canvas.draw()
+        self.plot_renderer.clear()
     
-    def preset_golf_swing(self):
-        """Apply golf swing preset"""
-        self.accel_range_var.set(3)  # ±16g
-        self.gyro_range_var.set(3)   # ±2000°/s
-        self.mag_rate_var.set(5)     # 100Hz
-        self.sample_rate_var.set(500) # 500Hz
+    def reconcile_config(self, settings, label):
+        """Send only the settings the device does not already have (one SET_CONFIG at most)"""
+        if not self.connected:
+            messagebox.showwarning("Not Connected", "Please connect to a device first")
+            return
         
-        self.send_command("SET_ACCEL_RANGE=3")
-        self.send_command("SET_GYRO_RANGE=3")
-        self.send_command("SET_MAG_RATE=5")
-        self.send_command("SET_SAMPLE_RATE=500")
+        def report(future):
+            error = future.exception()
+            if error is not None:
+                message = f"Failed to apply {label}: {error}"
+            elif future.result():
+                message = f"Applied {label}: changed {', '.join(future.result())}"
+            else:
+                message = f"Applied {label}: device already up to date"
+            self.console_print(message)
         
-        self.console_print("Applied golf swing preset")
+        try:
+            self.engine.reconcile(**settings).add_done_callback(report)
+        except Exception as e:
+            self.console_print(f"Failed to apply {label}: {str(e)}")
     
-    def preset_slow_motion(self):
-        """Apply slow motion preset"""
-        self.accel_range_var.set(0)  # ±2g
-        self.gyro_range_var.set(0)   # ±250°/s
-        self.mag_rate_var.set(2)     # 10Hz
-        self.sample_rate_var.set(50) # 50Hz
-        
-        self.send_command("SET_ACCEL_RANGE=0")
-        self.send_command("SET_GYRO_RANGE=0")
-        self.send_command("SET_MAG_RATE=2")
-        self.send_command("SET_SAMPLE_RATE=50")
-        
-        self.console_print("Applied slow motion preset")
+    def apply_all(self):
+        """Apply every parameter on this tab, sending only what changed"""
+        self.reconcile_config({
+            'accel_range': self.accel_range_var.get(),
+            'gyro_range': self.gyro_range_var.get(),
+            'mag_rate': self.mag_rate_var.get(),
+            'sample_rate': self.sample_rate_var.get(),
+            'enable_accel': self.enable_accel_var.get(),
+            'enable_gyro': self.enable_gyro_var.get(),
+            'enable_mag': self.enable_mag_var.get(),
+            'enable_temp': self.enable_temp_var.get(),
+        }, "configuration")
     
+    def apply_preset(self, name, label):
+        """Apply a CONFIG_PRESETS entry"""
+        preset = CONFIG_PRESETS[name]
+        self.accel_range_var.set(preset['accel_range'])
+        self.gyro_range_var.set(preset['gyro_range'])
+        self.mag_rate_var.set(preset['mag_rate'])
+        self.sample_rate_var.set(preset['sample_rate'])
+        
+        self.reconcile_config(preset, f"{label} preset")
+
+    def preset_golf_swing(self):
+        """Apply golf swing preset (±16g, ±2000°/s, mag 100Hz, 500Hz)"""
+        self.apply_preset('golf_swing', "golf swing")
+
+    def preset_slow_motion(self):
+        """Apply slow motion preset (±2g, ±250°/s, mag 10Hz, 50Hz)"""
+        self.apply_preset('slow_motion', "slow motion")
+
     def preset_balanced(self):
-        """Apply balanced preset"""
-        self.accel_range_var.set(1)  # ±4g
-        self.gyro_range_var.set(1)   # ±500°/s
-        self.mag_rate_var.set(3)     # 20Hz
-        self.sample_rate_var.set(100) # 100Hz
-        
-        self.send_command("SET_ACCEL_RANGE=1")
-        self.send_command("SET_GYRO_RANGE=1")
-        self.send_command("SET_MAG_RATE=3")
-        self.send_command("SET_SAMPLE_RATE=100")
-        
-        self.console_print("Applied balanced preset")
-    
+        """Apply balanced preset (±4g, ±500°/s, mag 20Hz, 100Hz)"""
+        self.apply_preset('balanced', "balanced")
+
     def select_log_file(self):
         """Select log file for data recording"""
         filename = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            filetypes=[("CSV files", "*.csv"), ("ICM20948 sessions", "*.icms"), ("All files", "*.*")],
             title="Select log file"
         )
         
         if filename:
-            self.log_file = filename
+            try:
+                # Create CSV with headers
+                self.engine.set_log_file(filename)
+            except Exception as e:
+                messagebox.showerror("Log File Error", f"Failed to create log file: {str(e)}")
+                return
             self.log_file_label.config(text=f"Log file: {filename}")
-            
-            # Create CSV with headers
-            with open(filename, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Timestamp', 'System_Time', 'Accel_X', 'Accel_Y', 'Accel_Z',
-                               'Gyro_X', 'Gyro_Y', 'Gyro_Z', 'Mag_X', 'Mag_Y', 'Mag_Z', 'Temperature'])
-    
-    def write_to_log(self, data_point):
-        """Write data point to log file"""
-        try:
-            with open(self.log_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    data_point['timestamp'],
-                    data_point['time'],
-                    data_point['accel']['x'], data_point['accel']['y'], data_point['accel']['z'],
-                    data_point['gyro']['x'], data_point['gyro']['y'], data_point['gyro']['z'],
-                    data_point['mag']['x'], data_point['mag']['y'], data_point['mag']['z'],
-                    data_point['temp']
-                ])
-        except Exception as e:
-            self.console_print(f"Logging error: {str(e)}")
+            self.toggle_logging()
+    
+    def toggle_logging(self):
+        """Enable or disable logging in the engine"""
+        self.engine.log_enabled = self.log_enabled_var.get()
+        enabled = self.engine.log_enabled and self.engine.log_file
+        self.logging_status_label.config(text="Logging: Enabled" if enabled else "Logging: Disabled")
     
     def export_data(self):
         """Export current data to file"""
-        if not self.data_log:
+        if len(self.data_log) == 0:
             messagebox.showwarning("No Data", "No data to export")
             return
         
         filename = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            filetypes=[("CSV files", "*.csv"), ("ICM20948 sessions", "*.icms"), ("All files", "*.*")],
             title="Export data"
         )
         
-        if filename:
+        if filename and is_session_path(filename):
+            try:
+                write_session(filename, self.data_log.to_array(), self.engine.device_config)
+                messagebox.showinfo("Export Complete", f"Session exported to {filename}")
+                self.console_print(f"Session exported to {filename}")
+            except Exception as e:
+                messagebox.showerror("Export Error", f"Failed to export session: {str(e)}")
+        elif filename:
             try:
                 with open(filename, 'w', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['Timestamp', 'System_Time', 'Accel_X', 'Accel_Y', 'Accel_Z',
-                                   'Gyro_X', 'Gyro_Y', 'Gyro_Z', 'Mag_X', 'Mag_Y', 'Mag_Z', 'Temperature'])
-                    
-                    for data_point in self.data_log:
-                        writer.writerow([
-                            data_point['timestamp'],
-                            data_point['time'],
-                            data_point['accel']['x'], data_point['accel']['y'], data_point['accel']['z'],
-                            data_point['gyro']['x'], data_point['gyro']['y'], data_point['gyro']['z'],
-                            data_point['mag']['x'], data_point['mag']['y'], data_point['mag']['z'],
-                            data_point['temp']
-                        ])
+                    f.write(','.join(CSV_HEADER) + '\n')
+                    f.write(format_csv_rows(self.data_log.to_array()))
                 
                 messagebox.showinfo("Export Complete", f"Data exported to {filename}")
                 self.console_print(f"Data exported to {filename}")
@@ -877,26 +793,30 @@ class ICM20948Controller:
                 messagebox.showerror("Export Error", f"Failed to export data: {str(e)}")
     
     def console_print(self, message):
-        """Print message to console with timestamp - optimized for performance"""
+        """Print message to console with timestamp (safe from any thread; shown on the next flush)"""
+        self.console.post(message)
+    
+    def flush_console(self):
+        """Write the pending console messages in one insert and trim the oldest lines"""
         try:
-            timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]  # Include milliseconds
-            formatted_message = f"[{timestamp}] {message}\n"
-            
-            # Use insert and see operations efficiently
-            self.console_text.insert(tk.END, formatted_message)
-            
-            # Only auto-scroll if we're near the bottom (to not interrupt user reading)
-            if self.console_text.yview()[1] > 0.9:
-                self.console_text.see(tk.END)
-            
-            # Limit console size more efficiently - check less frequently
-            lines = int(self.console_text.index('end-1c').split('.')[0])
-            if lines > 150:  # Allow more lines before cleanup
-                # Remove multiple lines at once for efficiency
-                self.console_text.delete("1.0", "26.0")  # Remove 25 lines at once
-        except Exception as e:
+            lines = self.console.drain()
+            if lines:
+                # Only auto-scroll if we're near the bottom (to not interrupt user reading)
+                follow = self.console_text.yview()[1] > 0.9
+                text = ''.join(lines)
+                self.console_text.insert(tk.END, text)
+                # Messages may span several lines; the trim below counts widget lines
+                self.console_lines += text.count('\n')
+                excess = self.console_lines - self.console_max_lines
+                if excess > 0:
+                    self.console_text.delete("1.0", f"{excess + 1}.0")
+                    self.console_lines -= excess
+                if follow:
+                    self.console_text.see(tk.END)
+        except Exception:
             # Don't let console errors crash the app
             pass
+        self.root.after(self.console_interval, self.flush_console)
 
 def main():
     root = tk.Tk()
@@ -2,35 +2,166 @@
 """
 ESP32 Simulator for testing the GUI when hardware isn't available
 This simulates the ESP32 responses so you can test the improved GUI
+
+Implements the full command set of src/main.cpp. Samples are generated in
+NumPy blocks and sent on an absolute schedule (sample n is due at
+start + n / rate), so the rate does not drift and can go up to
+MAX_SAMPLE_RATE, well beyond the firmware's 1 kHz, for load testing.
+
+For soak testing the link can be degraded with a fault profile (see
+FAULT_PROFILES): Bluetooth SPP stalls followed by a burst of the backlog,
+bursty delivery, dropped samples, corrupted bytes, timestamp jitter and
+device resets that replay the startup banner mid-stream. Samples can also
+come from a recording (--trace) instead of random noise.
 """
 
+import argparse
+import os
 import socket
 import threading
 import time
-import random
-import math
+
+import numpy as np
+
+from icm20948_binary import ACCEL_LSB, GYRO_LSB, encode_frames, make_flags
+from icm20948_framing import LineFramer
+from icm20948_replay import load_replay_source
+from icm20948_samples import AXIS_FIELDS, SAMPLE_DTYPE, format_data_lines
+
+MAX_SAMPLE_RATE = 10000  # Hz; the firmware itself accepts 1-1000
+BLOCK_SIZE = 4096        # Samples generated per NumPy block
+SEND_TICK = 0.002        # Seconds of samples sent together at high rates
+
+# Fault injection settings; every profile starts from these
+DEFAULT_FAULTS = {
+    'stall_rate': 0.0,             # Link stalls per second (data queues up, then arrives at once)
+    'stall_duration': (0.2, 1.0),  # Stall length range in seconds
+    'burst_period': 0.0,           # Deliver only every this many seconds (0 = as sampled)
+    'drop_rate': 0.0,              # Fraction of samples lost
+    'corrupt_rate': 0.0,           # Fraction of sent bytes corrupted
+    'jitter_ms': 0.0,              # Std dev of device timestamp jitter
+    'reset_interval': 0.0,         # Mean seconds between device resets (0 = never)
+    'resume_after_reset': True,    # Keep streaming after a reset, as if the host sent START again
+}
+
+FAULT_PROFILES = {
+    'none': {},
+    'bluetooth': {'stall_rate': 0.1, 'stall_duration': (0.2, 1.5), 'burst_period': 0.04,
+                  'drop_rate': 0.0005, 'corrupt_rate': 1e-6},
+    'noisy': {'drop_rate': 0.01, 'corrupt_rate': 1e-4, 'jitter_ms': 2.0},
+    'soak': {'stall_rate': 0.05, 'stall_duration': (0.2, 2.0), 'burst_period': 0.02,
+             'drop_rate': 0.001, 'corrupt_rate': 1e-5, 'jitter_ms': 1.0, 'reset_interval': 300.0},
+}
+
+# Firmware value ranges for SET_* commands (inclusive)
+SETTING_LIMITS = {
+    'accel_range': (0, 3),
+    'gyro_range': (0, 3),
+    'mag_rate': (0, 8),
+    'sample_rate': (1, MAX_SAMPLE_RATE),
+}
+
+# SET_CONFIG field names (as in the CONFIG line) and the settings they change
+CONFIG_FIELDS = {
+    'ACCEL_RANGE': 'accel_range',
+    'GYRO_RANGE': 'gyro_range',
+    'MAG_RATE': 'mag_rate',
+    'SAMPLE_RATE': 'sample_rate',
+    'EN_ACCEL': 'enable_accel',
+    'EN_GYRO': 'enable_gyro',
+    'EN_MAG': 'enable_mag',
+    'EN_TEMP': 'enable_temp',
+}
+
+# Channels zeroed when a sensor is disabled
+SENSOR_FIELDS = {
+    'enable_accel': ('accel_x', 'accel_y', 'accel_z'),
+    'enable_gyro': ('gyro_x', 'gyro_y', 'gyro_z'),
+    'enable_mag': ('mag_x', 'mag_y', 'mag_z'),
+    'enable_temp': ('temp',),
+}
+SENSOR_NAMES = {
+    'enable_accel': 'Accelerometer',
+    'enable_gyro': 'Gyroscope',
+    'enable_mag': 'Magnetometer',
+    'enable_temp': 'Temperature',
+}
+
+DEFAULT_CONFIG = {
+    'accel_range': 1,  # ±4g
+    'gyro_range': 0,   # ±250°/s
+    'mag_rate': 2,     # 10Hz
+    'sample_rate': 100,
+    'enable_accel': True,
+    'enable_gyro': True,
+    'enable_mag': True,
+    'enable_temp': True,
+    'binary_format': False
+}
+
+# (center, half-width of uniform noise) per channel, in physical units
+CHANNEL_MODEL = {
+    'accel_x': (0.0, 0.5), 'accel_y': (0.0, 0.5), 'accel_z': (9.81, 0.5),
+    'gyro_x': (0.0, 0.1), 'gyro_y': (0.0, 0.1), 'gyro_z': (0.0, 0.1),
+    'mag_x': (25.0, 5.0), 'mag_y': (15.0, 5.0), 'mag_z': (-40.0, 5.0),
+    'temp': (22.5, 2.0),
+}
+
+
+class PtyEndpoint:
+    """Socket-like wrapper around the master side of a pseudo-terminal"""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def recv(self, size):
+        return os.read(self.fd, size)
+
+    def sendall(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def close(self):
+        os.close(self.fd)
+
 
 class ESP32Simulator:
-    def __init__(self, host='localhost', port=9090):
+    def __init__(self, host='localhost', port=9090, seed=None, faults=None, trace=None):
         self.host = host
         self.port = port
         self.running = False
         self.streaming = False
         self.server_socket = None
         self.client_socket = None
-        
+        self.send_lock = threading.Lock()
+        self.stream_thread = None
+        self.boot_time = time.perf_counter()  # millis() counts from here
+        self.rng = np.random.default_rng(seed)
+
         # Simulated sensor configuration
-        self.config = {
-            'accel_range': 1,  # ±4g
-            'gyro_range': 0,   # ±250°/s  
-            'mag_rate': 2,     # 10Hz
-            'sample_rate': 100,
-            'enable_accel': True,
-            'enable_gyro': True,
-            'enable_mag': True,
-            'enable_temp': True
-        }
-        
+        self.config = dict(DEFAULT_CONFIG)
+        self.frame_sequence = 0
+        self.schedule_changed = False  # Set when the sample rate changes mid-stream
+
+        # Pregenerated block of sensor values, consumed from block_pos
+        self.block = None
+        self.block_pos = 0
+
+        # Fault injection: a profile name or a dict of DEFAULT_FAULTS overrides
+        if isinstance(faults, str):
+            faults = FAULT_PROFILES[faults]
+        self.faults = dict(DEFAULT_FAULTS, **(faults or {}))
+        self.fault_stats = {'stalls': 0, 'dropped': 0, 'corrupted_bytes': 0, 'resets': 0}
+        self.stall_until = 0.0
+        self.next_reset = None
+
+        # Trace playback: sensor values come from a recording instead of noise
+        self.trace = load_replay_source(trace) if trace else None
+        self.trace_pos = 0
+        if self.trace is not None and 'sample_rate' in self.trace.device_config:
+            self.config['sample_rate'] = int(self.trace.device_config['sample_rate'])
+
     def start_server(self):
         """Start the TCP server to simulate serial communication"""
         try:
@@ -38,163 +169,423 @@ class ESP32Simulator:
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind((self.host, self.port))
             self.server_socket.listen(1)
-            
+
             print(f"ESP32 Simulator listening on {self.host}:{self.port}")
-            print("Modify your Python GUI to connect to 'socket://localhost:9090' instead of COM3")
+            print(f"Modify your Python GUI to connect to 'socket://{self.host}:{self.port}' instead of COM3")
             print("-" * 60)
-            
+
             self.running = True
-            
+
             while self.running:
                 try:
                     self.client_socket, addr = self.server_socket.accept()
+                    self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                     print(f"Client connected from {addr}")
                     self.send_startup_messages()
                     self.handle_client()
                 except Exception as e:
                     if self.running:
                         print(f"Connection error: {e}")
-                        
+
         except Exception as e:
             print(f"Server error: {e}")
-            
+
+    def start_pty(self):
+        """Serve on a pseudo-terminal instead of TCP (Linux/macOS)
+
+        The host opens the printed slave path like a serial port, either
+        directly or as pty://<path>.
+        """
+        import pty
+        import tty
+        master, slave = pty.openpty()
+        tty.setraw(slave)  # No echo or newline translation
+        # Keep the slave open so the master never sees a hangup between host sessions
+        self.pty_slave = slave
+        path = os.ttyname(slave)
+        print(f"ESP32 Simulator on pseudo-terminal {path}")
+        print(f"Connect your Python GUI to '{path}' or 'pty://{path}'")
+        print("-" * 60)
+
+        self.running = True
+        self.client_socket = PtyEndpoint(master)
+        self.send_startup_messages()
+        self.handle_client()
+
     def send_startup_messages(self):
         """Send initial startup messages like the real ESP32"""
         messages = [
             "ICM20948 Configurable Data Logger",
-            "I2C initialized", 
+            "I2C initialized",
             "Scanning I2C bus...",
             "I2C device found at address 0x69!",
             "Found 1 device(s)",
             "Initializing ICM20948...",
             "ICM20948 found at address 0x69",
+            "Applying configuration...",
             "Configuration applied successfully",
             "Ready! Type HELP for commands",
             self.get_config_string()
         ]
-        
+
         for msg in messages:
             self.send_message(msg)
             time.sleep(0.1)
-            
+
     def send_message(self, message):
         """Send a message to the client"""
-        if self.client_socket:
+        self.send_bytes((message + '\r\n').encode('utf-8'))
+
+    def send_bytes(self, data):
+        """Send raw bytes to the client"""
+        client = self.client_socket
+        if client:
             try:
-                self.client_socket.send((message + '\n').encode('utf-8'))
-            except:
+                # Stream blocks and command responses must not interleave mid-line
+                with self.send_lock:
+                    client.sendall(data)
+            except OSError:
                 pass
-                
+
     def get_config_string(self):
         """Generate CONFIG response"""
-        return f"CONFIG:ACCEL_RANGE={self.config['accel_range']},GYRO_RANGE={self.config['gyro_range']},MAG_RATE={self.config['mag_rate']},SAMPLE_RATE={self.config['sample_rate']},EN_ACCEL={int(self.config['enable_accel'])},EN_GYRO={int(self.config['enable_gyro'])},EN_MAG={int(self.config['enable_mag'])},EN_TEMP={int(self.config['enable_temp'])},STREAMING={int(self.streaming)}"
-        
-    def generate_sensor_data(self):
-        """Generate realistic sensor data"""
-        timestamp = int(time.time() * 1000) % 1000000
-        
-        # Simulate accelerometer (with gravity and some noise)
-        ax = 0.0 + random.uniform(-0.5, 0.5)  # X axis
-        ay = 0.0 + random.uniform(-0.5, 0.5)  # Y axis  
-        az = 9.81 + random.uniform(-0.5, 0.5) # Z axis (gravity)
-        
-        # Simulate gyroscope (mostly zero with small drift)
-        gx = random.uniform(-0.1, 0.1)
-        gy = random.uniform(-0.1, 0.1)
-        gz = random.uniform(-0.1, 0.1)
-        
-        # Simulate magnetometer (Earth's magnetic field with noise)
-        mx = 25.0 + random.uniform(-5, 5)
-        my = 15.0 + random.uniform(-5, 5)
-        mz = -40.0 + random.uniform(-5, 5)
-        
-        # Simulate temperature
-        temp = 22.5 + random.uniform(-2, 2)
-        
-        return f"DATA:{timestamp},{ax:.3f},{ay:.3f},{az:.3f},{gx:.3f},{gy:.3f},{gz:.3f},{mx:.3f},{my:.3f},{mz:.3f},{temp:.1f}"
-        
+        return f"CONFIG:ACCEL_RANGE={self.config['accel_range']},GYRO_RANGE={self.config['gyro_range']},MAG_RATE={self.config['mag_rate']},SAMPLE_RATE={self.config['sample_rate']},EN_ACCEL={int(self.config['enable_accel'])},EN_GYRO={int(self.config['enable_gyro'])},EN_MAG={int(self.config['enable_mag'])},EN_TEMP={int(self.config['enable_temp'])},STREAMING={int(self.streaming)},BINARY={int(self.config['binary_format'])}"
+
+    def generate_block(self, count=BLOCK_SIZE):
+        """Generate `count` samples of sensor values (timestamps filled in when sent)"""
+        samples = np.empty(count, dtype=SAMPLE_DTYPE)
+        samples['timestamp'] = 0
+        samples['time'] = 0.0
+        for name in AXIS_FIELDS:
+            center, spread = CHANNEL_MODEL[name]
+            samples[name] = self.rng.uniform(center - spread, center + spread, count)
+        return samples
+
+    def next_samples(self, count):
+        """Take `count` samples from the pregenerated blocks (or the trace), shaped by the current config"""
+        parts = []
+        while count:
+            if self.trace is not None:
+                # Loop over the recording
+                if self.trace_pos >= len(self.trace):
+                    self.trace_pos = 0
+                take = min(count, len(self.trace) - self.trace_pos)
+                parts.append(self.trace.to_array(self.trace_pos, self.trace_pos + take))
+                self.trace_pos += take
+                count -= take
+                continue
+            if self.block is None or self.block_pos >= len(self.block):
+                self.block = self.generate_block()
+                self.block_pos = 0
+            take = min(count, len(self.block) - self.block_pos)
+            parts.append(self.block[self.block_pos:self.block_pos + take])
+            self.block_pos += take
+            count -= take
+        samples = parts[0].copy() if len(parts) == 1 else np.concatenate(parts)
+
+        # Saturate at the configured full scale, zero disabled sensors
+        accel_limit = ACCEL_LSB[self.config['accel_range']] * 32767
+        gyro_limit = GYRO_LSB[self.config['gyro_range']] * 32767
+        for name in SENSOR_FIELDS['enable_accel']:
+            np.clip(samples[name], -accel_limit, accel_limit, out=samples[name])
+        for name in SENSOR_FIELDS['enable_gyro']:
+            np.clip(samples[name], -gyro_limit, gyro_limit, out=samples[name])
+        for key, fields in SENSOR_FIELDS.items():
+            if not self.config[key]:
+                for name in fields:
+                    samples[name] = 0.0
+        return samples
+
+    def encode_samples(self, samples, keep=None):
+        """Encode samples as DATA: lines or binary frames, per the current format
+
+        keep is an optional mask of the samples that survive the link; the
+        dropped ones still use up a frame sequence number.
+        """
+        seqs = np.arange(self.frame_sequence, self.frame_sequence + len(samples))
+        self.frame_sequence = (self.frame_sequence + len(samples)) & 0xFFFF
+        if keep is not None:
+            samples, seqs = samples[keep], seqs[keep]
+        if not self.config['binary_format']:
+            return format_data_lines(samples).encode('ascii')
+        flags = make_flags(self.config['accel_range'], self.config['gyro_range'],
+                           self.config['enable_accel'], self.config['enable_gyro'],
+                           self.config['enable_mag'], self.config['enable_temp'])
+        values = np.column_stack([samples[name] for name in AXIS_FIELDS])
+        return encode_frames(seqs, samples['timestamp'], values, flags)
+
+    def deliver(self, samples):
+        """Send a block of samples through the (possibly faulty) link"""
+        faults = self.faults
+        keep = None
+        if faults['drop_rate']:
+            keep = self.rng.random(len(samples)) >= faults['drop_rate']
+            self.fault_stats['dropped'] += int(len(samples) - keep.sum())
+        if faults['jitter_ms']:
+            jitter = self.rng.normal(0.0, faults['jitter_ms'], len(samples))
+            samples['timestamp'] = np.maximum(samples['timestamp'] + np.round(jitter).astype(np.int64), 0)
+
+        data = self.encode_samples(samples, keep)
+        if faults['corrupt_rate'] and data:
+            hits = self.rng.binomial(len(data), faults['corrupt_rate'])
+            if hits:
+                data = bytearray(data)
+                positions = self.rng.integers(0, len(data), hits)
+                for position, flip in zip(positions, self.rng.integers(1, 256, hits)):
+                    data[position] ^= int(flip)
+                self.fault_stats['corrupted_bytes'] += int(hits)
+        self.send_bytes(bytes(data))
+
+    def link_blocked(self, now, elapsed):
+        """True while the link holds data back (stall or waiting for the next burst)"""
+        faults = self.faults
+        if now < self.stall_until:
+            return True
+        if faults['stall_rate'] and self.rng.random() < faults['stall_rate'] * elapsed:
+            self.stall_until = now + self.rng.uniform(*faults['stall_duration'])
+            self.fault_stats['stalls'] += 1
+            return True
+        return False
+
+    def reset_device(self):
+        """Simulate a device reset: millis() restarts, config is lost, banner is replayed"""
+        self.fault_stats['resets'] += 1
+        self.streaming = False
+        self.boot_time = time.perf_counter()
+        self.config = dict(DEFAULT_CONFIG)
+        self.frame_sequence = 0
+        self.send_startup_messages()
+        if self.faults['resume_after_reset']:
+            # The banner's CONFIG: line says STREAMING=0 as on the real device;
+            # report the resumed stream so the host does not think it stopped
+            self.streaming = True
+            self.send_message(self.get_config_string())
+
     def handle_client(self):
         """Handle client commands"""
-        data_thread = None
-        
+        framer = LineFramer()
+
         try:
             while self.running and self.client_socket:
                 try:
-                    data = self.client_socket.recv(1024).decode('utf-8').strip()
+                    data = self.client_socket.recv(4096)
                     if not data:
                         break
-                        
-                    print(f"Received command: {data}")
-                    self.process_command(data)
-                    
+
+                    # Several commands can arrive in one read (or one across reads)
+                    for command in framer.feed(data):
+                        print(f"Received command: {command}")
+                        self.send_message(f"DEBUG: Processing command: '{command}'")
+                        self.process_command(command)
+
                 except socket.timeout:
                     continue
                 except Exception as e:
                     print(f"Client handling error: {e}")
                     break
-                    
+
         except Exception as e:
             print(f"Client handler error: {e}")
         finally:
+            self.streaming = False
             if self.client_socket:
                 self.client_socket.close()
                 self.client_socket = None
             print("Client disconnected")
-            
+            if any(self.faults[key] for key in DEFAULT_FAULTS
+                   if key not in ('stall_duration', 'resume_after_reset')):
+                print(f"Injected faults: {self.fault_stats}")
+
+    def set_value(self, key, text):
+        """Parse and range-check a SET_* value; None if rejected (ignored like the firmware)"""
+        try:
+            value = int(text)
+        except ValueError:
+            return None
+        low, high = SETTING_LIMITS[key]
+        return value if low <= value <= high else None
+
+    def apply_configuration(self):
+        self.send_message("Applying configuration...")
+        self.send_message("Configuration applied successfully")
+
+    def set_configuration(self, fields):
+        """SET_CONFIG: validate every field, then apply them all at once (or none)"""
+        config = dict(self.config)
+        for field in fields.split(','):
+            name, _, text = field.partition('=')
+            key = CONFIG_FIELDS.get(name)
+            if key in SETTING_LIMITS:
+                value = self.set_value(key, text)
+            elif key and text.strip() in ("0", "1"):
+                value = text.strip() == "1"
+            else:
+                value = None
+            if value is None:
+                self.send_message(f"Invalid configuration: {field}")
+                return
+            config[key] = value
+
+        if config['sample_rate'] != self.config['sample_rate']:
+            self.schedule_changed = True
+        self.config = config
+        self.apply_configuration()
+        self.send_message(self.get_config_string())
+
     def process_command(self, command):
         """Process incoming commands"""
         command = command.upper().strip()
-        
+
         if command == "SCAN":
-            self.send_message("DEBUG: SCAN command received")
             self.send_message("Scanning I2C bus...")
             self.send_message("I2C device found at address 0x69!")
             self.send_message("Found 1 device(s)")
-            
+
         elif command == "CONFIG":
-            self.send_message("DEBUG: CONFIG command received")
             self.send_message(self.get_config_string())
-            
+
         elif command == "START":
             self.send_message("DEBUG: START command received")
             self.streaming = True
             self.send_message("Started streaming")
-            # Start data streaming thread
-            threading.Thread(target=self.stream_data, daemon=True).start()
-            
+            # Start data streaming thread (one at a time)
+            if not (self.stream_thread and self.stream_thread.is_alive()):
+                self.stream_thread = threading.Thread(target=self.stream_data, daemon=True)
+                self.stream_thread.start()
+
         elif command == "STOP":
             self.send_message("DEBUG: STOP command received")
             self.streaming = False
             self.send_message("Stopped streaming")
-            
+
+        elif command.startswith("SET_ACCEL_RANGE="):
+            value = self.set_value('accel_range', command[len("SET_ACCEL_RANGE="):])
+            if value is not None:
+                self.config['accel_range'] = value
+                self.apply_configuration()
+
+        elif command.startswith("SET_GYRO_RANGE="):
+            value = self.set_value('gyro_range', command[len("SET_GYRO_RANGE="):])
+            if value is not None:
+                self.config['gyro_range'] = value
+                self.apply_configuration()
+
+        elif command.startswith("SET_MAG_RATE="):
+            value = self.set_value('mag_rate', command[len("SET_MAG_RATE="):])
+            if value is not None:
+                self.config['mag_rate'] = value
+                self.apply_configuration()
+
+        elif command.startswith("SET_SAMPLE_RATE="):
+            value = self.set_value('sample_rate', command[len("SET_SAMPLE_RATE="):])
+            if value is not None:
+                self.config['sample_rate'] = value
+                self.schedule_changed = True
+                self.send_message(f"Sample rate set to {value} Hz")
+
+        elif command.startswith("ENABLE_"):
+            sensor, _, value = command.partition("=")
+            key = sensor.lower()
+            if key in SENSOR_NAMES and value:
+                self.config[key] = value.strip() == "1"
+                state = "enabled" if self.config[key] else "disabled"
+                self.send_message(f"{SENSOR_NAMES[key]} {state}")
+            else:
+                self.send_message(f"Unknown command: {command} (Type HELP for commands)")
+
+        elif command.startswith("SET_CONFIG="):
+            self.set_configuration(command[len("SET_CONFIG="):])
+
+        elif command.startswith("SET_FORMAT="):
+            data_format = command[len("SET_FORMAT="):]
+            if data_format in ("BIN", "TEXT"):
+                self.config['binary_format'] = data_format == "BIN"
+                self.frame_sequence = 0
+                self.send_message(f"Data format set to {data_format}")
+            else:
+                self.send_message(f"Invalid configuration: FORMAT={data_format}")
+
         elif command == "HELP":
             help_lines = [
                 "Available commands:",
                 "  SCAN - Scan I2C bus",
-                "  CONFIG - Show current configuration", 
+                "  CONFIG - Show current configuration",
                 "  START - Start data streaming",
                 "  STOP - Stop data streaming",
+                "  SET_ACCEL_RANGE=<0-3> - Set accelerometer range",
+                "  SET_GYRO_RANGE=<0-3> - Set gyroscope range",
+                "  SET_MAG_RATE=<0-8> - Set magnetometer data rate",
+                f"  SET_SAMPLE_RATE=<1-{MAX_SAMPLE_RATE}> - Set sample rate in Hz",
+                "  ENABLE_ACCEL=<0/1> - Enable/disable accelerometer",
+                "  ENABLE_GYRO=<0/1> - Enable/disable gyroscope",
+                "  ENABLE_MAG=<0/1> - Enable/disable magnetometer",
+                "  ENABLE_TEMP=<0/1> - Enable/disable temperature",
+                "  SET_CONFIG=<KEY=VALUE,...> - Apply several settings at once",
+                "    (keys as in CONFIG: ACCEL_RANGE, GYRO_RANGE, MAG_RATE, SAMPLE_RATE, EN_*)",
+                "  SET_FORMAT=<BIN/TEXT> - Binary frames or DATA: text lines",
                 "  HELP - Show this help"
             ]
             for line in help_lines:
                 self.send_message(line)
-                
+
         else:
             self.send_message(f"Unknown command: {command} (Type HELP for commands)")
-            
+
     def stream_data(self):
-        """Stream sensor data while streaming is enabled"""
-        interval = 1.0 / self.config['sample_rate']  # Convert Hz to seconds
-        
+        """Stream sensor data while streaming is enabled
+
+        Sample n of the current schedule is due at start + n / rate. Every
+        wake-up sends all samples that are due (a few ms worth at high rates)
+        in one write, then sleeps until the next one is due, so late wake-ups
+        are caught up instead of accumulating as drift.
+        """
+        rate = start = None
+        sent = 0
+        faults = self.faults
+        last_wake = last_delivery = time.perf_counter()
+        if faults['reset_interval'] and self.next_reset is None:
+            self.next_reset = last_wake + self.rng.exponential(faults['reset_interval'])
+
         while self.streaming and self.running and self.client_socket:
             try:
-                data = self.generate_sensor_data()
-                self.send_message(data)
-                time.sleep(interval)
+                now = time.perf_counter()
+                if self.next_reset is not None and now >= self.next_reset:
+                    self.next_reset = now + self.rng.exponential(faults['reset_interval'])
+                    self.reset_device()
+                    rate = None
+                    continue
+                if rate is None or self.schedule_changed:
+                    # (Re)start the schedule at the current rate
+                    self.schedule_changed = False
+                    rate = self.config['sample_rate']
+                    start, sent = now, 0
+
+                # Samples keep being taken while the link is blocked and go out
+                # together once it clears, as over a stalled SPP link
+                blocked = self.link_blocked(now, now - last_wake) or (
+                    faults['burst_period'] and now - last_delivery < faults['burst_period'])
+                last_wake = now
+
+                due = int((now - start) * rate) + 1
+                if due > sent and not blocked:
+                    samples = self.next_samples(due - sent)
+                    offsets = np.arange(sent, due) / rate
+                    samples['timestamp'] = ((start - self.boot_time + offsets) * 1000).astype(np.int64)
+                    self.deliver(samples)
+                    sent = due
+                    last_delivery = now
+
+                # Sleep until the next sample, or gather a few ms of samples at high rates
+                wake = start + (sent + max(0, int(rate * SEND_TICK) - 1)) / rate
+                if blocked:
+                    wake = min(max(wake, now + 0.001), now + 0.01)
+                delay = wake - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
             except Exception as e:
                 print(f"Streaming error: {e}")
                 break
-                
+
     def stop(self):
         """Stop the simulator"""
         self.running = False
@@ -202,14 +593,44 @@ class ESP32Simulator:
         if self.server_socket:
             self.server_socket.close()
 
+
 def main():
-    simulator = ESP32Simulator()
-    
+    parser = argparse.ArgumentParser(description="Simulate the ICM20948 ESP32 logger over TCP or a pty")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9090)
+    parser.add_argument('--pty', action='store_true', help="Serve on a pseudo-terminal instead of TCP")
+    parser.add_argument('--sample-rate', type=int, help=f"Initial sample rate (1-{MAX_SAMPLE_RATE} Hz)")
+    parser.add_argument('--faults', choices=sorted(FAULT_PROFILES), default='none', help="Fault profile")
+    parser.add_argument('--fault', action='append', default=[], metavar='KEY=VALUE',
+                        help=f"Override one fault setting ({', '.join(DEFAULT_FAULTS)})")
+    parser.add_argument('--trace', help="Stream values from a recording (.icms session or CSV)")
+    parser.add_argument('--seed', type=int, help="Random seed for repeatable runs")
+    args = parser.parse_args()
+
+    faults = dict(FAULT_PROFILES[args.faults])
+    for override in args.fault:
+        key, _, value = override.partition('=')
+        if key not in DEFAULT_FAULTS:
+            parser.error(f"Unknown fault setting: {key}")
+        if key == 'stall_duration':
+            faults[key] = tuple(float(part) for part in value.split(','))
+        elif key == 'resume_after_reset':
+            faults[key] = value.lower() in ('1', 'true', 'yes')
+        else:
+            faults[key] = float(value)
+
+    simulator = ESP32Simulator(args.host, args.port, seed=args.seed, faults=faults, trace=args.trace)
+    if args.sample_rate:
+        simulator.config['sample_rate'] = max(1, min(args.sample_rate, MAX_SAMPLE_RATE))
+
     try:
-        simulator.start_server()
+        if args.pty:
+            simulator.start_pty()
+        else:
+            simulator.start_server()
     except KeyboardInterrupt:
         print("\nShutting down simulator...")
         simulator.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
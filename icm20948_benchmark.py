@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for every ingestion stage
+
+Each stage is run over a synthetic stream at the given sample rates, fed the
+way the acquisition thread sees it: one batch per serial read (read_interval
+seconds of data). Per-batch latencies give the percentiles; `load` is the
+fraction of real time the stage needs at that rate, so a stage saturates when
+load reaches 1.0. Plot refresh is measured per frame at plot_fps with a window
+of up to plot_points samples, decimated with plot_decimation ('none' draws
+every sample), and its throughput is in frames per second.
+
+    python icm20948_benchmark.py --rates 100 500 1000 5000 --json report.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from icm20948_binary import StreamDecoder, encode_frames, make_flags
+from icm20948_buffer import SampleRingBuffer
+from icm20948_decimate import METHODS
+from icm20948_framing import LineFramer
+from icm20948_logger import LogWriter
+from icm20948_samples import AXIS_FIELDS, SAMPLE_DTYPE, format_data_lines, parse_data_lines
+from icm20948_session import SessionWriter
+
+DEFAULT_RATES = (100, 500, 1000, 5000)
+STAGES = ('framing', 'binary_decode', 'parse', 'buffer', 'csv_log', 'session_log', 'plot')
+
+
+def synthetic_samples(rate, duration, seed=0):
+    """A plausible sensor stream: slow motion plus noise, device timestamps at `rate`"""
+    count = int(rate * duration)
+    rng = np.random.default_rng(seed)
+    t = np.arange(count) / rate
+    samples = np.empty(count, dtype=SAMPLE_DTYPE)
+    samples['timestamp'] = np.round(t * 1000)
+    samples['time'] = t
+    for column, name in enumerate(AXIS_FIELDS):
+        base = 25.0 if name == 'temp' else 9.81 if name == 'accel_z' else 0.0
+        samples[name] = base + np.sin(t * (column + 1)) + rng.normal(0, 0.05, count)
+    return samples
+
+
+def split_batches(samples, rate, read_interval):
+    per_read = max(1, int(round(rate * read_interval)))
+    return [samples[i:i + per_read] for i in range(0, len(samples), per_read)]
+
+
+def summarize(stage, rate, latencies, items, budget, unit='samples'):
+    """Throughput and latency percentiles for one stage/rate
+
+    items is the number of samples (or plot frames) processed and budget the
+    real time they cover, in seconds.
+    """
+    latencies = np.asarray(latencies)
+    total = float(latencies.sum())
+    return {
+        'stage': stage,
+        'rate_hz': rate,
+        'calls': len(latencies),
+        'items': items,
+        'unit': unit,
+        'throughput': items / total if total else float('inf'),
+        'latency_ms': {
+            'mean': float(latencies.mean() * 1000),
+            'p50': float(np.percentile(latencies, 50) * 1000),
+            'p90': float(np.percentile(latencies, 90) * 1000),
+            'p99': float(np.percentile(latencies, 99) * 1000),
+            'max': float(latencies.max() * 1000),
+        },
+        'load': total / budget,
+    }
+
+
+def timed(function, items):
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_framing(batches):
+    framer = LineFramer()
+    chunks = [format_data_lines(batch).encode('ascii') for batch in batches]
+    return timed(framer.feed, chunks)
+
+
+def bench_binary_decode(batches):
+    decoder = StreamDecoder()
+    flags = make_flags(3, 3)
+    chunks = [encode_frames(np.arange(len(batch)), batch['timestamp'],
+                            np.column_stack([batch[name] for name in AXIS_FIELDS]), flags)
+              for batch in batches]
+    return timed(decoder.feed, chunks)
+
+
+def bench_parse(batches):
+    blocks = [format_data_lines(batch).split('\r\n')[:-1] for batch in batches]
+    return timed(parse_data_lines, blocks)
+
+
+def bench_buffer(batches, capacity=60000):
+    buffer = SampleRingBuffer(capacity)
+    return timed(buffer.append, batches)
+
+
+def bench_writer(writer, batches):
+    # Time the work the writer thread does per batch (format + write) rather
+    # than the non-blocking enqueue; the writer is built without its thread,
+    # so nothing else touches it. The final flush counts towards the last batch.
+    try:
+        latencies = timed(lambda batch: writer.write_batches([batch]), batches)
+        start = time.perf_counter()
+        writer.flush()
+        latencies[-1] += time.perf_counter() - start
+        return latencies
+    finally:
+        writer.close()
+
+
+def bench_plot(samples, frames, plot_points, decimation='minmax'):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from icm20948_plot import PlotRenderer
+
+    figure = Figure(figsize=(12, 8))
+    canvas = FigureCanvasAgg(figure)
+    renderer = PlotRenderer(figure, canvas, decimation=None if decimation == 'none' else decimation)
+    buffer = SampleRingBuffer(max(plot_points, 1))
+    buffer.append(samples)
+    window = buffer.last(plot_points)
+    canvas.draw()  # First full draw caches the background
+    renderer.update(window)
+    canvas.draw()
+    return timed(renderer.update, [window] * frames)
+
+
+def run(rates=DEFAULT_RATES, duration=10.0, read_interval=0.01, stages=STAGES,
+        plot_fps=30, plot_points=2000, plot_decimation='minmax', log=print):
+    """Run the selected stages at every rate and return the report dict"""
+    results = []
+    temp_dir = tempfile.mkdtemp(prefix='icm20948_bench_')
+    try:
+        for rate in rates:
+            samples = synthetic_samples(rate, duration)
+            batches = split_batches(samples, rate, read_interval)
+            for stage in stages:
+                items, unit = len(samples), 'samples'
+                if stage == 'framing':
+                    latencies = bench_framing(batches)
+                elif stage == 'binary_decode':
+                    latencies = bench_binary_decode(batches)
+                elif stage == 'parse':
+                    latencies = bench_parse(batches)
+                elif stage == 'buffer':
+                    latencies = bench_buffer(batches)
+                elif stage == 'csv_log':
+                    filename = os.path.join(temp_dir, f'log_{rate}.csv')
+                    latencies = bench_writer(LogWriter(filename, write_header=True, threaded=False), batches)
+                elif stage == 'session_log':
+                    path = os.path.join(temp_dir, f'log_{rate}.icms')
+                    latencies = bench_writer(SessionWriter(path, threaded=False), batches)
+                elif stage == 'plot':
+                    items, unit = int(duration * plot_fps), 'frames'
+                    latencies = bench_plot(samples, items, plot_points, plot_decimation)
+                else:
+                    raise ValueError(f"Unknown stage: {stage}")
+                results.append(summarize(stage, rate, latencies, items, duration, unit))
+                log(format_result(results[-1]))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return {
+        'created': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'settings': {
+            'duration_s': duration,
+            'read_interval_s': read_interval,
+            'plot_fps': plot_fps,
+            'plot_points': plot_points,
+            'plot_decimation': plot_decimation,
+        },
+        'results': results,
+    }
+
+
+def format_result(result):
+    latency = result['latency_ms']
+    return (f"{result['stage']:<14}{result['rate_hz']:>7} Hz  "
+            f"{result['throughput']:>12.0f} {result['unit'] + '/s':<10}"
+            f"p50 {latency['p50']:8.3f} ms  p99 {latency['p99']:8.3f} ms  "
+            f"max {latency['max']:8.3f} ms  load {result['load']:7.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ICM20948 ingestion pipeline")
+    parser.add_argument('--rates', type=int, nargs='+', default=list(DEFAULT_RATES),
+                        help="Sample rates to simulate (Hz)")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of synthetic data per rate")
+    parser.add_argument('--read-interval', type=float, default=0.01,
+                        help="Seconds of data delivered per serial read")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--plot-fps', type=int, default=30)
+    parser.add_argument('--plot-points', type=int, default=2000)
+    parser.add_argument('--plot-decimation', choices=METHODS + ('none',), default='minmax')
+    parser.add_argument('--json', help="Write the machine-readable report to this file")
+    args = parser.parse_args()
+
+    report = run(args.rates, args.duration, args.read_interval, args.stages,
+                 args.plot_fps, args.plot_points, args.plot_decimation)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
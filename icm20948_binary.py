@@ -0,0 +1,242 @@
+"""
+Compact binary streaming format (SET_FORMAT=BIN) and its stream decoder
+
+Each sample is one packed little-endian frame of FRAME_SIZE (31) bytes:
+
+    offset  size  field
+    0       2     sync marker 0xA5 0x5A
+    2       2     sequence number (uint16, wraps)
+    4       4     device millis() (uint32)
+    8       1     flags: bits 0-1 accel range, bits 2-3 gyro range,
+                  bits 4-7 accel/gyro/mag/temp enabled
+    9       20    int16 accel x/y/z, gyro x/y/z, mag x/y/z, temp
+    29      2     CRC-16/CCITT-FALSE over bytes 2-28
+
+Accelerometer and gyroscope values are in sensor LSBs at the range given in
+the flags, so the frame carries the full 16-bit sensor resolution. The
+magnetometer uses the AK09916 native 0.15 uT/LSB, temperature is in 0.01 C.
+
+Command responses stay plain text lines in binary mode, so the decoder splits
+the stream into text lines and frames and resynchronises on the sync marker
+after corruption. In text mode it behaves exactly like LineFramer.
+"""
+
+import math
+import re
+import time
+
+import numpy as np
+
+from icm20948_framing import LineFramer
+from icm20948_samples import AXIS_FIELDS, SAMPLE_DTYPE
+
+SYNC = b'\xa5\x5a'
+FRAME_DTYPE = np.dtype([
+    ('sync', '<u2'),
+    ('seq', '<u2'),
+    ('timestamp', '<u4'),
+    ('flags', 'u1'),
+    ('values', '<i2', (len(AXIS_FIELDS),)),
+    ('crc', '<u2'),
+])
+FRAME_SIZE = FRAME_DTYPE.itemsize  # 31 bytes
+CRC_START, CRC_END = 2, FRAME_SIZE - 2
+
+# Anything outside printable ASCII is frame debris, not firmware text
+NON_TEXT = re.compile(rb'[^\t\n\r\x20-\x7e]')
+
+STANDARD_GRAVITY = 9.80665
+# Physical units per LSB, indexed by range code 0-3
+ACCEL_LSB = np.array([STANDARD_GRAVITY * (2 << r) / 32768.0 for r in range(4)])    # m/s^2
+GYRO_LSB = np.array([math.radians(250 << r) / 32768.0 for r in range(4)])          # rad/s
+MAG_LSB = 0.15    # uT
+TEMP_LSB = 0.01   # C
+
+
+def _crc_table():
+    table = np.zeros(256, dtype=np.uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[byte] = crc & 0xFFFF
+    return table
+
+
+CRC_TABLE = _crc_table()
+
+
+def crc16_rows(rows):
+    """CRC-16/CCITT-FALSE of every row of a (n, k) uint8 array, vectorized over rows"""
+    crc = np.full(len(rows), 0xFFFF, dtype=np.uint16)
+    for column in rows.T:
+        crc = (crc << 8) ^ CRC_TABLE[(crc >> 8) ^ column]
+    return crc
+
+
+def make_flags(accel_range, gyro_range, enable_accel=True, enable_gyro=True,
+               enable_mag=True, enable_temp=True):
+    """Build the frame flags byte"""
+    return ((accel_range & 3) | (gyro_range & 3) << 2 | bool(enable_accel) << 4
+            | bool(enable_gyro) << 5 | bool(enable_mag) << 6 | bool(enable_temp) << 7)
+
+
+def encode_frames(seqs, timestamps, values, flags):
+    """Encode samples as binary frames
+
+    values is an (n, 10) array in physical units (m/s^2, rad/s, uT, C) in
+    AXIS_FIELDS order; flags is a single flags byte for all frames.
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(-1, len(AXIS_FIELDS))
+    count = len(values)
+    scale = np.empty(len(AXIS_FIELDS))
+    scale[0:3] = ACCEL_LSB[flags & 3]
+    scale[3:6] = GYRO_LSB[(flags >> 2) & 3]
+    scale[6:9] = MAG_LSB
+    scale[9] = TEMP_LSB
+
+    frames = np.zeros(count, dtype=FRAME_DTYPE)
+    frames['sync'] = 0x5AA5
+    frames['seq'] = np.asarray(seqs) & 0xFFFF
+    frames['timestamp'] = np.asarray(timestamps) & 0xFFFFFFFF
+    frames['flags'] = flags
+    frames['values'] = np.clip(np.round(values / scale), -32768, 32767)
+
+    rows = frames.view(np.uint8).reshape(count, FRAME_SIZE)
+    frames['crc'] = crc16_rows(rows[:, CRC_START:CRC_END])
+    return frames.tobytes()
+
+
+def frames_to_samples(frames, host_time):
+    """Convert a FRAME_DTYPE array into a SAMPLE_DTYPE array"""
+    samples = np.empty(len(frames), dtype=SAMPLE_DTYPE)
+    samples['timestamp'] = frames['timestamp']
+    samples['time'] = host_time
+
+    flags = frames['flags']
+    values = frames['values'].astype(np.float32)
+    accel_lsb = ACCEL_LSB[flags & 3]
+    gyro_lsb = GYRO_LSB[(flags >> 2) & 3]
+    for column, name in enumerate(AXIS_FIELDS):
+        if column < 3:
+            samples[name] = values[:, column] * accel_lsb
+        elif column < 6:
+            samples[name] = values[:, column] * gyro_lsb
+        elif column < 9:
+            samples[name] = values[:, column] * MAG_LSB
+        else:
+            samples[name] = values[:, column] * TEMP_LSB
+    return samples
+
+
+class StreamDecoder:
+    """Split a mixed stream into text lines and binary sample frames"""
+
+    def __init__(self, max_pending=65536):
+        self.buffer = bytearray()
+        self.text = LineFramer()
+        self.max_pending = max_pending  # Bytes kept while waiting for a line end
+
+        self.frame_count = 0
+        self.crc_errors = 0        # Candidate frames rejected by the CRC check
+        self.discarded_bytes = 0   # Bytes thrown away while resynchronising
+        self.sequence_gaps = 0     # Frames missing according to the sequence number
+        self.sequence_duplicates = 0  # Frames repeating the previous sequence number
+        self.last_seq = None
+
+    def reset(self):
+        del self.buffer[:]
+        self.text.reset()
+        self.last_seq = None
+
+    def feed(self, data, host_time=None):
+        """Add raw bytes; return (text lines, SAMPLE_DTYPE array of decoded frames)"""
+        if host_time is None:
+            host_time = time.time()
+        self.buffer += data
+        # Work on an immutable copy so the bytearray can be trimmed afterwards
+        stream = bytes(self.buffer)
+        raw = np.frombuffer(stream, dtype=np.uint8)
+        size = len(stream)
+
+        text_parts = []
+        blocks = []
+        pos = 0
+        while pos < size:
+            sync = stream.find(SYNC, pos)
+            if sync < 0:
+                # Pure text from here on; keep a trailing partial line (or a
+                # lone first sync byte) for the next read
+                end = stream.rfind(b'\n', pos) + 1
+                if end > pos:
+                    text_parts.append(stream[pos:end])
+                    pos = end
+                break
+            if sync > pos:
+                # Text always ends in a newline before the next frame; a tail
+                # without one is the remnant of a damaged frame
+                end = stream.rfind(b'\n', pos, sync) + 1
+                if end > pos:
+                    text_parts.append(stream[pos:end])
+                self.discarded_bytes += sync - max(end, pos)
+                pos = sync
+            if size - pos < FRAME_SIZE:
+                break
+
+            # Take the run of back-to-back frames starting here in one go
+            count = (size - pos) // FRAME_SIZE
+            rows = raw[pos:pos + count * FRAME_SIZE].reshape(count, FRAME_SIZE)
+            synced = (rows[:, 0] == 0xA5) & (rows[:, 1] == 0x5A)
+            if not synced.all():
+                count = int(np.argmin(synced))
+                rows = rows[:count]
+            valid = crc16_rows(rows[:, CRC_START:CRC_END]) == rows[:, CRC_END:].copy().view('<u2')[:, 0]
+            good = count if valid.all() else int(np.argmin(valid))
+            if good:
+                blocks.append(rows[:good])
+                pos += good * FRAME_SIZE
+            if good < count:
+                # Corrupt frame: skip its sync marker and search again from the next byte
+                self.crc_errors += 1
+                self.discarded_bytes += 1
+                pos += 1
+
+        del self.buffer[:pos]
+        if len(self.buffer) > self.max_pending:
+            self.discarded_bytes += len(self.buffer)
+            del self.buffer[:]
+
+        lines = []
+        for part in text_parts:
+            # Drop only the lines holding non-text bytes (every part ends in a newline)
+            start = 0
+            for debris in NON_TEXT.finditer(part):
+                if debris.start() < start:
+                    continue  # On a line already dropped
+                line_start = part.rfind(b'\n', start, debris.start()) + 1
+                line_end = part.find(b'\n', debris.end()) + 1 or len(part)
+                lines.extend(self.text.feed(part[start:line_start]))
+                # The damaged line may have begun in an earlier read
+                self.text.reset()
+                self.discarded_bytes += line_end - line_start
+                start = line_end
+            lines.extend(self.text.feed(part[start:]))
+
+        if not blocks:
+            return lines, np.zeros(0, dtype=SAMPLE_DTYPE)
+
+        frames = np.concatenate(blocks).view(FRAME_DTYPE).reshape(-1)
+        self.frame_count += len(frames)
+        self.count_sequence_gaps(frames['seq'])
+        return lines, frames_to_samples(frames, host_time)
+
+    def count_sequence_gaps(self, seqs):
+        if self.last_seq is not None:
+            seqs = np.concatenate(([self.last_seq], seqs))
+        steps = np.diff(seqs.astype(np.int32)) & 0xFFFF
+        self.sequence_duplicates += int(np.count_nonzero(steps == 0))
+        # A step of half the range or more is a restarted counter (device
+        # reset, SET_FORMAT), not tens of thousands of missing frames
+        forward = steps[(steps > 0) & (steps < 0x8000)]
+        self.sequence_gaps += int(np.sum(forward - 1))
+        self.last_seq = int(seqs[-1])
@@ -0,0 +1,120 @@
+"""
+Fixed-capacity columnar ring buffer for ICM20948 samples
+
+Each SAMPLE_DTYPE field is kept in its own preallocated array. Every array is
+twice the capacity and each sample is written to both halves, so any window of
+up to `capacity` recent samples is one contiguous slice and can be returned as
+a view without copying.
+
+Device timestamps restart when the ESP32 reboots (opening the port resets
+it). Time windows only look at the samples since the latest restart.
+"""
+
+import numpy as np
+
+from icm20948_loss import RESTART_JUMP_MS
+from icm20948_samples import SAMPLE_DTYPE
+
+
+def last_restart(timestamps, previous=None):
+    """Index of the last sample that starts a new device boot (None if none does)
+
+    previous is the timestamp before the first one, if any.
+    """
+    if not len(timestamps):
+        return None
+    steps = np.diff(timestamps, prepend=timestamps[0] if previous is None else previous)
+    restarts = np.flatnonzero(steps < -RESTART_JUMP_MS)
+    return int(restarts[-1]) if len(restarts) else None
+
+
+class SampleRingBuffer:
+    """Ring buffer of the most recent `capacity` samples, stored column by column"""
+
+    def __init__(self, capacity, dtype=SAMPLE_DTYPE):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.dtype = dtype
+        self.columns = {name: np.zeros(2 * capacity, dtype=dtype[name]) for name in dtype.names}
+        self.head = 0          # Next write position in [0, capacity)
+        self.size = 0          # Number of valid samples
+        self.total_appended = 0
+        self.boot_start = 0    # total_appended count where the current device boot began
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+        self.boot_start = self.total_appended
+
+    def append(self, samples):
+        """Append a structured array (or a single record) of samples"""
+        samples = np.atleast_1d(samples)
+        count = len(samples)
+        if count == 0:
+            return
+        if 'timestamp' in self.columns:
+            previous = int(self.columns['timestamp'][self.head + self.capacity - 1]) if self.size else None
+            restart = last_restart(samples['timestamp'], previous)
+            if restart is not None:
+                self.boot_start = self.total_appended + restart
+        self.total_appended += count
+
+        # Only the newest `capacity` samples can survive
+        if count > self.capacity:
+            samples = samples[-self.capacity:]
+            count = self.capacity
+
+        capacity = self.capacity
+        start = self.head
+        end = start + count
+        for name, column in self.columns.items():
+            values = samples[name]
+            column[start:end] = values
+            # Mirror into the other half
+            if end <= capacity:
+                column[start + capacity:end + capacity] = values
+            else:
+                split = capacity - start
+                column[start + capacity:] = values[:split]
+                column[:end - capacity] = values[split:]
+
+        self.head = end % capacity
+        self.size = min(self.size + count, capacity)
+
+    def last(self, count=None):
+        """Return zero-copy column views of the most recent `count` samples (default: all)"""
+        if count is None or count > self.size:
+            count = self.size
+        end = self.head + self.capacity
+        return {name: column[end - count:end] for name, column in self.columns.items()}
+
+    def last_seconds(self, seconds, field='time'):
+        """Return zero-copy column views covering the last `seconds` of `field`
+
+        Only samples since the latest device restart are considered.
+
+        `field` is 'time' (host seconds) or 'timestamp' (device milliseconds,
+        in which case pass the window in milliseconds).
+        """
+        window = self.last(self.total_appended - self.boot_start)
+        values = window[field]
+        if len(values) == 0:
+            return window
+        start = np.searchsorted(values, values[-1] - seconds, side='left')
+        return {name: column[start:] for name, column in window.items()}
+
+    def to_array(self, count=None):
+        """Copy the most recent `count` samples (default: all) into a structured array"""
+        window = self.last(count)
+        samples = np.empty(len(window['time']), dtype=self.dtype)
+        for name, column in window.items():
+            samples[name] = column
+        return samples
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
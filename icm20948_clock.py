@@ -0,0 +1,140 @@
+"""
+Host/device clock synchronization
+
+Samples arrive with the device millis() timestamp and the host time of the
+read that delivered them. Arrival time is send time plus a delay that is
+never negative and is often large: the serial/Bluetooth link delivers in
+bursts, and reads are polled. ClockModel fits host time to device time as
+
+    host = device + offset + drift * device
+
+on the lower envelope of (arrival - device): the smallest lag in each
+bucket of device time is the sample that got through fastest. Buckets
+hit by a burst sit above the line and are dropped before the final fit.
+The result is a host-domain timestamp for every sample that follows the
+device's own sample clock. The constant minimum latency of the link
+remains in the offset.
+
+millis() wraps after 2^32 ms (about 49.7 days); a wrap is unwrapped. A
+backwards jump smaller than that is a device reset and starts a new model.
+"""
+
+import collections
+
+import numpy as np
+
+from icm20948_loss import RESTART_JUMP_MS
+
+WRAP_MS = 1 << 32
+
+
+class ClockModel:
+    """Online offset + drift fit from device timestamps to host time"""
+
+    def __init__(self, window=60.0, bucket=0.5, min_span=2.0):
+        self.window = window      # Seconds of device time the fit looks back over
+        self.bucket = bucket      # Seconds of device time per envelope point
+        self.min_span = min_span  # Device seconds of data before drift is estimated
+        self.resets = 0
+        self.wraps = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the fit (new device boot)"""
+        self.last_raw = None
+        self.wrap_base = 0
+        self.envelope = collections.OrderedDict()  # bucket -> (device s, lag s)
+        self.offset = None  # Host minus device seconds at device time 0
+        self.drift = 0.0    # Host seconds gained per device second
+        self.residual = 0.0  # RMS distance of the kept envelope points from the fit (s)
+
+    @property
+    def synchronized(self):
+        return self.offset is not None
+
+    def to_host(self, device_ms):
+        """Host time for device millis() values of the current boot (already unwrapped)"""
+        device = np.asarray(device_ms, dtype=np.float64) / 1000.0
+        return device + self.offset + self.drift * device
+
+    def update(self, timestamps, arrival):
+        """Add samples (device millis(), host arrival time) and return their host-domain times
+
+        arrival is the host time.time() of the read, a scalar or per-sample array.
+        """
+        raw = np.asarray(timestamps, dtype=np.int64) & (WRAP_MS - 1)
+        arrival = np.broadcast_to(np.asarray(arrival, dtype=np.float64), raw.shape)
+        if not len(raw):
+            return np.zeros(0)
+
+        steps = np.diff(raw, prepend=raw[0] if self.last_raw is None else self.last_raw)
+        wraps = steps < -(WRAP_MS // 2)
+        resets = (steps < -RESTART_JUMP_MS) & ~wraps
+        self.last_raw = int(raw[-1])
+
+        times = np.empty(len(raw))
+        bounds = np.unique(np.concatenate(([0], np.flatnonzero(resets), [len(raw)])))
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            if resets[begin]:
+                self.resets += 1
+                self.reset()
+                self.last_raw = int(raw[-1])
+            wrapped = np.cumsum(wraps[begin:end]) * WRAP_MS
+            if wraps[begin:end].any():
+                self.wraps += int(wraps[begin:end].sum())
+            device_ms = raw[begin:end] + self.wrap_base + wrapped
+            self.wrap_base = int(device_ms[-1] - raw[end - 1])
+            self.fit(device_ms / 1000.0, arrival[begin:end])
+            times[begin:end] = self.to_host(device_ms)
+        return times
+
+    def fit(self, device, arrival):
+        # Lowest lag per bucket of this batch, merged into the envelope
+        lag = arrival - device
+        buckets = np.floor(device / self.bucket).astype(np.int64)
+        bounds = np.flatnonzero(np.diff(buckets)) + 1
+        for segment in np.split(np.arange(len(device)), bounds):
+            best = segment[np.argmin(lag[segment])]
+            key = int(buckets[best])
+            point = (float(device[best]), float(lag[best]))
+            if key not in self.envelope or point[1] < self.envelope[key][1]:
+                self.envelope[key] = point
+
+        newest = max(self.envelope)
+        oldest_kept = newest - int(self.window / self.bucket)
+        for key in list(self.envelope):
+            if key >= oldest_kept:
+                break
+            del self.envelope[key]
+
+        points = np.array(list(self.envelope.values()))
+        x, y = points[:, 0], points[:, 1]
+        if len(points) < 4 or x[-1] - x[0] < self.min_span:
+            self.offset = float(y.min())
+            self.drift = 0.0
+            self.residual = 0.0
+            return
+
+        slope, intercept = np.polyfit(x, y, 1)
+        # Buckets above the line were delayed (bursts); refit on the lower half
+        residual = y - (intercept + slope * x)
+        lower = residual <= np.median(residual)
+        if lower.sum() >= 2:
+            slope, intercept = np.polyfit(x[lower], y[lower], 1)
+            residual = y[lower] - (intercept + slope * x[lower])
+        # Shift the line onto the envelope's floor so no sample predates its arrival
+        intercept += min(0.0, float(np.min(y - (intercept + slope * x))))
+        self.offset = float(intercept)
+        self.drift = float(slope)
+        self.residual = float(np.sqrt(np.mean(residual ** 2)))
+
+    def stats(self):
+        return {
+            'synchronized': self.synchronized,
+            'offset': self.offset,
+            'drift_ppm': self.drift * 1e6,
+            'residual_ms': self.residual * 1000.0,
+            'envelope_points': len(self.envelope),
+            'resets': self.resets,
+            'wraps': self.wraps,
+        }
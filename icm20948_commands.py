@@ -0,0 +1,268 @@
+"""
+Acknowledged command channel for the ESP32
+
+Commands are queued and written by a dedicated writer thread, so callers
+(including the Tk thread) never block on the port and the receive stream is
+never flushed. Every command gets a Future that resolves with the firmware's
+response line, or fails with CommandError (unknown or rejected) or
+CommandTimeout. The round-trip time from write to response is recorded.
+
+The firmware echoes "DEBUG: Processing command: '<cmd>'" right before it
+executes a command and prints its response, so:
+  - the writer sends the next command once the previous one was echoed (the
+    firmware would merge two commands that arrive in the same loop pass), and
+  - a command whose echo is followed by the next command's echo without a
+    response was ignored (e.g. an out-of-range value) and is rejected.
+"""
+
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+ECHO_PREFIX = "DEBUG: Processing command: '"
+# Lines that reject the command being processed
+ERROR_PREFIXES = ('Unknown command:', 'Invalid configuration:')
+SENSOR_RESPONSES = {
+    'ENABLE_ACCEL': 'Accelerometer',
+    'ENABLE_GYRO': 'Gyroscope',
+    'ENABLE_MAG': 'Magnetometer',
+    'ENABLE_TEMP': 'Temperature',
+}
+
+
+class CommandError(Exception):
+    """The device rejected a command or did not understand it"""
+
+
+class CommandTimeout(CommandError, TimeoutError):
+    """No response arrived within the command's timeout"""
+
+
+def response_matcher(command):
+    """Return a predicate recognising the firmware's response line to a command"""
+    name, _, value = command.partition('=')
+    if name == 'START':
+        return lambda line: line == 'Started streaming'
+    if name == 'STOP':
+        return lambda line: line == 'Stopped streaming'
+    if name in ('CONFIG', 'SET_CONFIG'):
+        return lambda line: line.startswith('CONFIG:')
+    if name == 'SCAN':
+        return lambda line: line.startswith('Found ') or line == 'No I2C devices found'
+    if name == 'HELP':
+        return lambda line: line.strip().startswith('HELP')
+    if name in ('SET_ACCEL_RANGE', 'SET_GYRO_RANGE', 'SET_MAG_RATE'):
+        return lambda line: line == 'Configuration applied successfully'
+    if name == 'SET_SAMPLE_RATE':
+        expected = f"Sample rate set to {value.strip()} Hz"
+        return lambda line: line == expected
+    if name in SENSOR_RESPONSES:
+        state = 'enabled' if value.strip() == '1' else 'disabled'
+        expected = f"{SENSOR_RESPONSES[name]} {state}"
+        return lambda line: line == expected
+    if name == 'SET_FORMAT':
+        expected = f"Data format set to {value.strip()}"
+        return lambda line: line == expected
+    # Anything else is unknown to the firmware and answered with "Unknown command:"
+    return None
+
+
+class PendingCommand:
+    def __init__(self, command, timeout):
+        self.command = command
+        self.key = command.strip().upper()
+        self.matcher = response_matcher(self.key)
+        self.timeout = timeout
+        self.future = Future()
+        self.sent_time = None   # perf_counter() when written
+        self.echoed = False
+
+
+class CommandChannel:
+    """Queue commands, write them from a writer thread and match their responses
+
+    write(bytes) is called on the writer thread; handle_line(line) must be
+    called with every text line from the device (on the reader thread).
+    """
+
+    def __init__(self, write, status=None, default_timeout=2.0, echo_timeout=0.5, history=256):
+        self.write = write
+        self.status = status or (lambda message: None)
+        self.default_timeout = default_timeout
+        self.echo_timeout = echo_timeout  # Longest wait for an echo before sending the next command
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.in_flight = collections.deque()  # Written, waiting for their response (oldest first)
+        self.echo_event = threading.Event()
+        self.echo_event.set()  # Nothing outstanding yet
+        self.thread = None
+        self.running = False
+
+        self.rtts = collections.deque(maxlen=history)  # Recent round-trip times (s)
+        self.sent_count = 0
+        self.timeout_count = 0
+        self.rejected_count = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='CommandChannel', daemon=True)
+        self.thread.start()
+
+    def stop(self, reason="Disconnected"):
+        """Stop the writer thread and fail every queued or unanswered command"""
+        self.running = False
+        self.queue.put(None)
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        self.thread = None
+
+        error = ConnectionError(reason)
+        while True:
+            try:
+                pending = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending:
+                pending.future.set_exception(error)
+        with self.lock:
+            finished = [(pending, None, error) for pending in self.in_flight]
+            self.in_flight.clear()
+        self.finish_all(finished)
+
+    def submit(self, command, timeout=None):
+        """Queue a command; returns a Future for its response line"""
+        pending = PendingCommand(command, self.default_timeout if timeout is None else timeout)
+        if not self.running:
+            pending.future.set_exception(ConnectionError("Not connected"))
+            return pending.future
+        self.queue.put(pending)
+        return pending.future
+
+    def stats(self):
+        rtts = np.array(self.rtts) * 1000.0
+        return {
+            'sent': self.sent_count,
+            'in_flight': len(self.in_flight),
+            'timeouts': self.timeout_count,
+            'rejected': self.rejected_count,
+            'rtt_last_ms': float(rtts[-1]) if len(rtts) else None,
+            'rtt_p50_ms': float(np.percentile(rtts, 50)) if len(rtts) else None,
+            'rtt_p90_ms': float(np.percentile(rtts, 90)) if len(rtts) else None,
+            'rtt_max_ms': float(rtts.max()) if len(rtts) else None,
+        }
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+    def run(self):
+        while self.running:
+            try:
+                pending = self.queue.get(timeout=0.05)
+            except queue.Empty:
+                self.expire()
+                continue
+            if pending is None:
+                break
+
+            # Let the previous command be picked up by the firmware first
+            self.echo_event.wait(self.echo_timeout)
+            self.echo_event.clear()
+
+            with self.lock:
+                pending.sent_time = time.perf_counter()
+                self.in_flight.append(pending)
+            try:
+                self.write((pending.command + '\r\n').encode('utf-8'))
+                self.sent_count += 1
+            except Exception as e:
+                with self.lock:
+                    if pending in self.in_flight:
+                        self.in_flight.remove(pending)
+                self.finish(pending, error=e)
+                self.status(f"Failed to send command '{pending.command}': {e}")
+                self.echo_event.set()
+            self.expire()
+
+    def expire(self):
+        """Fail commands whose timeout has passed"""
+        now = time.perf_counter()
+        finished = []
+        with self.lock:
+            for pending in list(self.in_flight):
+                if now - pending.sent_time > pending.timeout:
+                    self.in_flight.remove(pending)
+                    self.timeout_count += 1
+                    finished.append((pending, None, CommandTimeout(
+                        f"No response to '{pending.command}' within {pending.timeout:.1f} s")))
+                    self.echo_event.set()
+        self.finish_all(finished)
+
+    # ------------------------------------------------------------------
+    # Response matching (reader thread)
+    # ------------------------------------------------------------------
+    def handle_line(self, line):
+        """Match a device text line against the commands in flight"""
+        if not self.in_flight:
+            return
+        with self.lock:
+            finished = self.match_line(line)
+        # Futures run their callbacks when resolved, so never under the lock
+        self.finish_all(finished)
+
+    def match_line(self, line):
+        """Take the commands a line answers out of in_flight; returns their finish() arguments"""
+        if line.startswith(ECHO_PREFIX):
+            return self.handle_echo(line[len(ECHO_PREFIX):].rstrip("'").strip().upper())
+        if line.startswith(ERROR_PREFIXES):
+            for pending in self.in_flight:
+                if pending.echoed or pending is self.in_flight[0]:
+                    self.in_flight.remove(pending)
+                    self.rejected_count += 1
+                    return [(pending, None, CommandError(line))]
+        for pending in self.in_flight:
+            if pending.matcher and pending.matcher(line):
+                self.in_flight.remove(pending)
+                self.echo_event.set()
+                return [(pending, line, None)]
+        return []
+
+    def handle_echo(self, echoed):
+        # Commands echoed before this one without a response were ignored
+        finished = []
+        for pending in list(self.in_flight):
+            if pending.key == echoed and not pending.echoed:
+                pending.echoed = True
+                break
+            if pending.echoed:
+                self.in_flight.remove(pending)
+                self.rejected_count += 1
+                finished.append((pending, None,
+                                 CommandError(f"No response to '{pending.command}' (value rejected?)")))
+        self.echo_event.set()
+        return finished
+
+    def finish_all(self, finished):
+        for pending, response, error in finished:
+            self.finish(pending, response, error)
+
+    def finish(self, pending, response=None, error=None):
+        """Resolve a command's Future (never with self.lock held: callbacks run here)"""
+        if pending.future.done():
+            return
+        if error is None:
+            rtt = time.perf_counter() - pending.sent_time
+            self.rtts.append(rtt)
+            pending.future.rtt = rtt
+            pending.future.set_result(response)
+        else:
+            pending.future.set_exception(error)
+
+
+def wait_all(futures, timeout=None):
+    """Wait for several command futures; returns their responses, raising the first error"""
+    return [future.result(timeout) for future in futures]
@@ -0,0 +1,97 @@
+"""
+Console message buffer for the GUI
+
+post() may be called from any thread: it appends (time, text) to a bounded
+deque, whose append and popleft are atomic, so producers never touch Tk and
+only take a lock in the rare case of an overwrite. The Tk thread calls
+drain() once per frame and inserts the returned lines into the widget in one
+go.
+
+When producers outpace the display the oldest pending messages are
+overwritten; a post that finds the deque full counts one overwrite, and the
+count is reported as one line on the next drain. A message repeated more
+than repeat_limit times within repeat_window seconds is suppressed after
+that, and a single "repeated N more times" line follows once the window has
+passed.
+"""
+
+import collections
+import threading
+import time
+from datetime import datetime
+
+
+def format_console_line(timestamp, text):
+    """One console line with a millisecond wall-clock time"""
+    return f"[{datetime.fromtimestamp(timestamp).strftime('%H:%M:%S.%f')[:-3]}] {text}\n"
+
+
+class ConsoleBuffer:
+    """Message ring filled by any thread and drained by the GUI thread"""
+
+    def __init__(self, capacity=2000, repeat_limit=3, repeat_window=2.0):
+        self.messages = collections.deque(maxlen=capacity)
+        self.lock = threading.Lock()  # Guards overwritten
+        self.repeat_limit = repeat_limit    # Copies of one message shown per window
+        self.repeat_window = repeat_window  # Seconds
+        self.reported = 0  # Overwrites already reported in the console
+        self.recent = {}  # text -> [window start, count, suppressed]
+
+        # Metrics
+        self.overwritten = 0
+        self.suppressed = 0
+
+    def post(self, message):
+        """Queue a message for the console (any thread)"""
+        if len(self.messages) == self.messages.maxlen:
+            with self.lock:
+                self.overwritten += 1
+        self.messages.append((time.time(), str(message)))
+
+    def drain(self):
+        """Formatted lines for everything posted since the last call (GUI thread)"""
+        lines = []
+        now = time.time()
+        with self.lock:
+            lost = self.overwritten - self.reported
+            self.reported = self.overwritten
+        if lost:
+            lines.append(format_console_line(now, f"... {lost} console messages dropped"))
+        while True:
+            try:
+                timestamp, text = self.messages.popleft()
+            except IndexError:
+                break
+
+            entry = self.recent.get(text)
+            if entry is not None and timestamp - entry[0] >= self.repeat_window:
+                lines.extend(self.flush_repeats(text, entry, timestamp))
+                entry = None
+            if entry is None:
+                self.recent[text] = [timestamp, 1, 0]
+                lines.append(format_console_line(timestamp, text))
+            elif entry[1] < self.repeat_limit:
+                entry[1] += 1
+                lines.append(format_console_line(timestamp, text))
+            else:
+                entry[2] += 1
+                self.suppressed += 1
+
+        # Close the windows that have passed
+        for text, entry in list(self.recent.items()):
+            if now - entry[0] >= self.repeat_window:
+                lines.extend(self.flush_repeats(text, entry, now))
+        return lines
+
+    def flush_repeats(self, text, entry, timestamp):
+        del self.recent[text]
+        if not entry[2]:
+            return []
+        return [format_console_line(timestamp, f"{text} (repeated {entry[2]} more times)")]
+
+    def stats(self):
+        return {
+            'pending': len(self.messages),
+            'overwritten': self.overwritten,
+            'suppressed': self.suppressed,
+        }
@@ -0,0 +1,143 @@
+"""
+Decimation of long sample windows for plotting
+
+A plot cannot show more than a couple of points per horizontal pixel, so a
+window of 10^4 - 10^6 samples is reduced to about that many before it is
+handed to matplotlib. Both methods work on whole arrays (no Python loop per
+bucket) and return sorted indices into the input, so the time axis and any
+other column can be sliced with the same result.
+
+    minmax  the lowest and highest sample of each bucket, in time order. The
+            envelope of the signal is kept exactly: spikes, clipping and the
+            y-limits computed from the decimated data are the same as for
+            the raw window.
+    lttb    Largest-Triangle-Three-Buckets: one sample per bucket, the one
+            spanning the largest triangle with its neighbours. Keeps the
+            visual shape with half the points of minmax but may shave peaks.
+
+Buckets are equal runs of samples, which matches equal runs of pixels as
+long as the sample rate is steady. NaN samples are never chosen over finite
+ones.
+
+Data that is already a min/max envelope (HistoryPyramid blocks) is merged
+with envelope_bins() instead.
+"""
+
+import numpy as np
+
+METHODS = ('minmax', 'lttb')
+
+
+def buckets(values, count, fill):
+    """Reshape values into `count` equal rows, padding the last one with fill"""
+    size = -(-len(values) // count)
+    count = -(-len(values) // size)  # No row may be padding only
+    if len(values) == count * size:
+        return values.reshape(count, size), size
+    padded = np.full(count * size, fill, dtype=values.dtype)
+    padded[:len(values)] = values
+    return padded.reshape(count, size), size
+
+
+def minmax_indices(y, points):
+    """Indices of the per-bucket minimum and maximum of y, about `points` in total"""
+    y = np.asarray(y)
+    n = len(y)
+    if points < 4 or n <= points:
+        return np.arange(n)
+
+    rows, size = buckets(y, points // 2, np.nan)
+    base = np.arange(len(rows)) * size
+    lo = np.argmin(rows, axis=1)
+    hi = np.argmax(rows, axis=1)
+    # argmin/argmax stop at a NaN; redo only the rows where that happened
+    picked = np.arange(len(rows))
+    bad = np.flatnonzero(np.isnan(rows[picked, lo]) | np.isnan(rows[picked, hi]))
+    if len(bad):
+        nan = np.isnan(rows[bad])
+        lo[bad] = np.argmin(np.where(nan, np.inf, rows[bad]), axis=1)
+        hi[bad] = np.argmax(np.where(nan, -np.inf, rows[bad]), axis=1)
+
+    pairs = np.sort(np.stack((lo, hi), axis=1), axis=1) + base[:, None]
+    indices = pairs.ravel()
+    # Keep the window's end points so the trace spans the whole time axis
+    indices = np.concatenate(([0], indices[indices < n], [n - 1]))
+    return indices[np.concatenate(([True], np.diff(indices) > 0))]
+
+
+def lttb_indices(x, y, points):
+    """Largest-Triangle-Three-Buckets selection of about `points` indices of (x, y)
+
+    The reference algorithm is sequential: each bucket's pick depends on the
+    previous one. Here every bucket is resolved at once, first against the
+    mean of the previous bucket, then again against the pick that pass made,
+    which matches the sequential result on most buckets and is visually
+    indistinguishable from it.
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if points < 3 or n <= points:
+        return np.arange(n)
+    dtype = np.float64 if y.dtype == np.float64 else np.float32
+    x = np.asarray(x)
+    if x.dtype != dtype:
+        # Relative to the first sample, so large timestamps survive float32
+        x = (x - x[0]).astype(dtype)
+    y = y.astype(dtype, copy=False)
+
+    # First and last samples are always kept; the rest is bucketed
+    xs, size = buckets(x[1:-1], points - 2, np.nan)
+    ys, _ = buckets(y[1:-1], points - 2, np.nan)
+    base = 1 + np.arange(len(xs)) * size
+
+    # Bucket means, skipping NaN samples and the padding of the last bucket
+    finite = np.isfinite(ys)
+    weight = np.maximum(finite.sum(axis=1), 1).astype(dtype)
+    mean_x = np.where(finite, xs, 0).sum(axis=1) / weight
+    mean_y = np.where(finite, ys, 0).sum(axis=1) / weight
+    mean_y[~finite.any(axis=1)] = np.nan
+
+    # Right-hand vertex: mean of the next bucket (the last sample after the last bucket)
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    def pick(prev_x, prev_y):
+        # Twice the triangle area, written as a*y + b*x + c per bucket
+        a = prev_x - next_x
+        b = next_y - prev_y
+        c = -a * prev_y - b * prev_x
+        area = a[:, None] * ys
+        area += b[:, None] * xs
+        area += c[:, None]
+        np.abs(area, out=area)
+        area[np.isnan(area)] = -1
+        return np.argmax(area, axis=1) + base
+
+    chosen = pick(np.insert(mean_x[:-1], 0, x[0]), np.insert(mean_y[:-1], 0, y[0]))
+    chosen = pick(np.insert(x[chosen[:-1]], 0, x[0]), np.insert(y[chosen[:-1]], 0, y[0]))
+    return np.concatenate(([0], chosen, [n - 1]))
+
+
+def decimate_indices(y, points, method='minmax', x=None):
+    """Indices that reduce y to about `points` samples with the given method
+
+    x is the time axis (needed for lttb; sample positions are used if omitted).
+    """
+    if method == 'minmax':
+        return minmax_indices(y, points)
+    if method == 'lttb':
+        return lttb_indices(np.arange(len(y)) if x is None else x, y, points)
+    raise ValueError(f"Unknown decimation method: {method} (expected one of {', '.join(METHODS)})")
+
+
+def envelope_bins(lo, hi, points):
+    """Merge runs of (min, max) pairs into about points // 2 pairs
+
+    Returns the index of the first entry of each bin and the merged lo and hi.
+    """
+    n = len(lo)
+    if points < 4 or 2 * n <= points:
+        return np.arange(n), lo, hi
+    lows, size = buckets(np.asarray(lo), points // 2, np.nan)
+    highs, _ = buckets(np.asarray(hi), points // 2, np.nan)
+    return np.arange(len(lows)) * size, np.fmin.reduce(lows, axis=1), np.fmax.reduce(highs, axis=1)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Concurrent acquisition from several ICM20948/ESP32 units
+
+DeviceManager runs one AcquisitionEngine per device. Each engine has its own
+reader thread, so a stalled Bluetooth link only blocks its own reads. Each
+device keeps its own ring buffer, log and counters. Slow operations that
+touch every device (opening ports with their settle delay, sending commands)
+run on a small thread pool so N devices take as long as the slowest one, not
+the sum. status() gives a combined view.
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from icm20948_buffer import SampleRingBuffer
+from icm20948_engine import AcquisitionEngine
+
+
+class Device:
+    """One managed device: its engine, sample history and rate statistics"""
+
+    def __init__(self, name, engine, history_size=60000, connection=None):
+        self.name = name
+        self.engine = engine
+        self.connection = connection  # Optional port-like object passed to engine.start()
+        self.buffer = SampleRingBuffer(history_size)
+        self.lock = threading.Lock()  # Guards buffer between the reader thread and readers
+        self.last_message = ''
+        self.error = None
+
+        # Rate over the interval between two status() calls
+        self.rate = 0.0
+        self._rate_time = time.monotonic()
+        self._rate_count = 0
+
+        engine.add_sample_listener(self.on_samples)
+        engine.add_status_listener(self.on_status)
+
+    def on_samples(self, batch):
+        with self.lock:
+            self.buffer.append(batch)
+
+    def on_status(self, message):
+        self.last_message = message
+
+    def snapshot(self, count=None):
+        """Copy of the newest `count` samples (all buffered samples if None)"""
+        with self.lock:
+            return self.buffer.to_array(count)
+
+    def status(self):
+        engine = self.engine
+        now = time.monotonic()
+        elapsed = now - self._rate_time
+        if elapsed >= 0.1:
+            self.rate = (engine.sample_count - self._rate_count) / elapsed
+            self._rate_time, self._rate_count = now, engine.sample_count
+        return {
+            'name': self.name,
+            'port': engine.port,
+            'connected': engine.connected,
+            'streaming': engine.streaming,
+            'samples': engine.sample_count,
+            'rate': self.rate,
+            'malformed': engine.malformed_count,
+            'lost': engine.loss.lost,
+            'duplicates': engine.loss.duplicates,
+            'crc_errors': engine.decoder.crc_errors,
+            'buffered': len(self.buffer),
+            'log_file': engine.log_file if engine.log_enabled else None,
+            'log_backlog': engine.log_backlog,
+            'sample_rate': engine.device_config.get('sample_rate'),
+            'clock': engine.clock.stats(),
+            'error': str(self.error) if self.error else None,
+            'last_message': self.last_message,
+        }
+
+
+class DeviceManager:
+    """Start, stop, configure and monitor several devices at once"""
+
+    def __init__(self, history_size=60000, max_workers=8):
+        self.history_size = history_size
+        self.devices = {}  # name -> Device
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='device')
+
+    def add_device(self, name, port=None, baudrate=115200, log_file=None, connection=None, **engine_kwargs):
+        """Register a device; log_file (.csv or .icms) enables logging for it"""
+        if name in self.devices:
+            raise ValueError(f"Device {name} already exists")
+        engine = AcquisitionEngine(port, baudrate, **engine_kwargs)
+        device = Device(name, engine, self.history_size, connection)
+        if log_file:
+            engine.set_log_file(log_file)
+            engine.log_enabled = True
+        self.devices[name] = device
+        return device
+
+    def remove_device(self, name):
+        device = self.devices.pop(name)
+        device.engine.stop()
+
+    def __getitem__(self, name):
+        return self.devices[name]
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def __len__(self):
+        return len(self.devices)
+
+    def for_each(self, action, names=None):
+        """Run action(device) for the given devices (all by default) in parallel
+
+        Command Futures returned by the action are waited for, so a device
+        counts as failed if it did not acknowledge. Returns {name: exception}
+        for the devices where it failed.
+        """
+        devices = [self.devices[name] for name in names] if names else list(self.devices.values())
+        futures = {device.name: self.executor.submit(action, device) for device in devices}
+        errors = {}
+        for name, future in futures.items():
+            try:
+                result = future.result()
+                for command in result if isinstance(result, list) else [result]:
+                    if isinstance(command, Future):
+                        command.result()
+                self.devices[name].error = None
+            except Exception as e:
+                self.devices[name].error = e
+                errors[name] = e
+        return errors
+
+    def start_all(self, names=None):
+        """Connect to the devices (settle delays overlap) and restore their desired configuration"""
+        return self.for_each(lambda device: device.engine.start(device.connection), names)
+
+    def stop_all(self, names=None):
+        return self.for_each(lambda device: device.engine.stop(), names)
+
+    def send_all(self, command, names=None):
+        return self.for_each(lambda device: device.engine.send_command(command), names)
+
+    def configure_all(self, names=None, **settings):
+        return self.for_each(lambda device: device.engine.configure(**settings), names)
+
+    def reconcile_all(self, names=None, **settings):
+        """Set the desired configuration; each device is sent only the keys it lacks
+
+        Devices restore it by themselves when they reconnect (start_all).
+        """
+        return self.for_each(lambda device: device.engine.reconcile(**settings), names)
+
+    def start_streaming_all(self, names=None):
+        return self.for_each(lambda device: device.engine.start_streaming(), names)
+
+    def stop_streaming_all(self, names=None):
+        return self.for_each(lambda device: device.engine.stop_streaming(), names)
+
+    def status(self):
+        """Per-device status dicts plus a 'total' entry"""
+        devices = [device.status() for device in self.devices.values()]
+        total = {
+            'devices': len(devices),
+            'connected': sum(d['connected'] for d in devices),
+            'streaming': sum(d['streaming'] for d in devices),
+            'samples': sum(d['samples'] for d in devices),
+            'rate': sum(d['rate'] for d in devices),
+            'malformed': sum(d['malformed'] for d in devices),
+            'lost': sum(d['lost'] for d in devices),
+            'log_backlog': sum(d['log_backlog'] for d in devices),
+        }
+        return {'devices': devices, 'total': total}
+
+    def format_status(self):
+        """Combined status as a text table"""
+        status = self.status()
+        rows = [f"{'Device':<12}{'Port':<24}{'State':<11}{'Samples':>10}{'Rate/s':>9}"
+                f"{'Lost':>8}{'Malformed':>11}{'Backlog':>9}"]
+        for d in status['devices']:
+            state = 'error' if d['error'] else 'streaming' if d['streaming'] else \
+                'connected' if d['connected'] else 'stopped'
+            rows.append(f"{d['name']:<12}{str(d['port'])[:23]:<24}{state:<11}{d['samples']:>10}"
+                        f"{d['rate']:>9.0f}{d['lost']:>8}{d['malformed']:>11}{d['log_backlog']:>9}")
+        total = status['total']
+        rows.append(f"{'Total':<12}{'':<24}{total['streaming']:>2}/{total['devices']:<8}{total['samples']:>10}"
+                    f"{total['rate']:>9.0f}{total['lost']:>8}{total['malformed']:>11}{total['log_backlog']:>9}")
+        return '\n'.join(rows)
+
+    def close(self):
+        self.stop_all()
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record several ICM20948 devices at once")
+    parser.add_argument('--device', action='append', required=True, metavar='NAME=PORT',
+                        help="Device name and serial port, e.g. left=COM3 (repeat per device)")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--log-dir', help="Log each device to <log-dir>/<name><ext>")
+    parser.add_argument('--format', choices=('csv', 'icms'), default='icms', help="Log format")
+    parser.add_argument('--sample-rate', type=int, help="Set every device's sample rate (Hz)")
+    parser.add_argument('--duration', type=float, default=0, help="Seconds to record (0 = until Ctrl+C)")
+    args = parser.parse_args()
+
+    manager = DeviceManager()
+    for spec in args.device:
+        name, _, port = spec.partition('=')
+        if not port:
+            parser.error(f"Expected NAME=PORT, got {spec}")
+        log_file = None
+        if args.log_dir:
+            os.makedirs(args.log_dir, exist_ok=True)
+            log_file = os.path.join(args.log_dir, f"{name}.{args.format}")
+        manager.add_device(name, port, args.baud, log_file)
+
+    for name, error in manager.start_all().items():
+        print(f"{name}: failed to connect: {error}")
+    try:
+        if args.sample_rate:
+            manager.reconcile_all(sample_rate=args.sample_rate)
+        manager.start_streaming_all()
+
+        start_time = time.time()
+        while any(device.engine.connected for device in manager):
+            time.sleep(1.0)
+            print(manager.format_status() + '\n')
+            if args.duration and time.time() - start_time >= args.duration:
+                break
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        manager.stop_streaming_all()
+        manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,640 @@
+#!/usr/bin/env python3
+"""
+Headless acquisition engine for the ICM20948 data logger
+
+Owns the serial connection, the reader thread, DATA line parsing and CSV
+logging. Consumers (the Tk GUI, unattended rigs, scripts) subscribe to sample
+batches, text lines and status messages instead of reading the port themselves.
+Nothing in here imports tkinter or matplotlib.
+"""
+
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from icm20948_binary import StreamDecoder
+from icm20948_clock import ClockModel
+from icm20948_commands import CommandChannel
+from icm20948_logger import LogWriter
+from icm20948_loss import LossTracker, format_loss
+from icm20948_queue import BatchQueue
+from icm20948_samples import parse_data_lines
+from icm20948_session import SessionWriter, create_session, is_session_path
+from icm20948_transport import open_transport
+
+# Device configuration keys and the firmware command that sets each one
+CONFIG_COMMANDS = {
+    'accel_range': 'SET_ACCEL_RANGE',
+    'gyro_range': 'SET_GYRO_RANGE',
+    'mag_rate': 'SET_MAG_RATE',
+    'sample_rate': 'SET_SAMPLE_RATE',
+    'enable_accel': 'ENABLE_ACCEL',
+    'enable_gyro': 'ENABLE_GYRO',
+    'enable_mag': 'ENABLE_MAG',
+    'enable_temp': 'ENABLE_TEMP',
+}
+
+# CONFIG: response keys mapped to the configuration keys above
+CONFIG_RESPONSE_KEYS = {
+    'ACCEL_RANGE': 'accel_range',
+    'GYRO_RANGE': 'gyro_range',
+    'MAG_RATE': 'mag_rate',
+    'SAMPLE_RATE': 'sample_rate',
+    'EN_ACCEL': 'enable_accel',
+    'EN_GYRO': 'enable_gyro',
+    'EN_MAG': 'enable_mag',
+    'EN_TEMP': 'enable_temp',
+    'STREAMING': 'streaming',
+    'BINARY': 'binary',
+}
+
+# Configuration keys accepted by SET_CONFIG, by their field name in the command
+CONFIG_FIELDS = {key: field for field, key in CONFIG_RESPONSE_KEYS.items() if key in CONFIG_COMMANDS}
+
+# Named capture profiles, each applied with a single SET_CONFIG round trip
+CONFIG_PRESETS = {
+    'golf_swing': {'accel_range': 3, 'gyro_range': 3, 'mag_rate': 5, 'sample_rate': 500},
+    'slow_motion': {'accel_range': 0, 'gyro_range': 0, 'mag_rate': 2, 'sample_rate': 50},
+    'balanced': {'accel_range': 1, 'gyro_range': 1, 'mag_rate': 3, 'sample_rate': 100},
+}
+
+
+def parse_config_line(line):
+    """Parse a CONFIG: line into a dict of configuration key -> int"""
+    # Format: CONFIG:ACCEL_RANGE=1,GYRO_RANGE=0,MAG_RATE=2,SAMPLE_RATE=100,...
+    config = {}
+    for pair in line.split(':', 1)[1].split(','):
+        key, value = pair.split('=')
+        if key in CONFIG_RESPONSE_KEYS:
+            config[CONFIG_RESPONSE_KEYS[key]] = int(value)
+    return config
+
+
+def parse_command_config(command):
+    """Configuration keys changed by an acknowledged command, e.g. SET_SAMPLE_RATE=500
+
+    SET_CONFIG is not covered: the device answers it with a full CONFIG: line.
+    """
+    name, _, value = command.strip().upper().partition('=')
+    if name == 'START':
+        return {'streaming': 1}
+    if name == 'STOP':
+        return {'streaming': 0}
+    if name == 'SET_FORMAT':
+        return {'binary': int(value == 'BIN')}
+    for key, command_name in CONFIG_COMMANDS.items():
+        if name == command_name:
+            return {key: int(value)}
+    return {}
+
+
+def requested_config(command):
+    """Configuration keys (those of CONFIG_FIELDS) a command asks the device to set"""
+    name, _, value = command.strip().upper().partition('=')
+    if name == 'SET_CONFIG':
+        keys = {field: key for key, field in CONFIG_FIELDS.items()}
+        pairs = (pair.partition('=') for pair in value.split(','))
+        return {keys[field.strip()]: int(setting) for field, _, setting in pairs if field.strip() in keys}
+    return {key: value for key, value in parse_command_config(command).items() if key in CONFIG_FIELDS}
+
+
+class AcquisitionEngine:
+    """Serial acquisition pipeline shared by the GUI and headless consumers
+
+    Listeners are called on the reader thread, so they must be quick and must
+    not touch Tk widgets directly (hand the data to a queue instead).
+    """
+
+    def __init__(self, port=None, baudrate=115200, settle_time=2.0,
+                 read_timeout=0.05, read_chunk_size=65536):
+        self.port = port
+        self.baudrate = baudrate
+        self.settle_time = settle_time  # ESP32 resets when the port opens
+        self.read_timeout = read_timeout  # Longest a blocking read waits for the first byte
+        self.read_chunk_size = read_chunk_size  # Largest single read from the port
+        self.decoder = StreamDecoder()  # Text lines and SET_FORMAT=BIN frames
+        self.clock = ClockModel()  # Maps device millis() to host time for each sample
+
+        self.serial_connection = None
+        self.connected = False
+        self.streaming = False
+        self.reading_thread = None
+        self.write_lock = threading.Lock()
+        self.commands = CommandChannel(self.write_bytes, self.status)
+
+        # Last configuration reported (CONFIG: responses) or acknowledged by the device
+        self.device_config = {}
+        self.config_verified = False  # A CONFIG: line arrived since connecting
+        # Configuration the device should have: every acknowledged configuration
+        # command is merged in; reconcile() sends the difference and start()
+        # restores it after a reconnect
+        self.desired_config = {}
+
+        # Logging (written by a background LogWriter while enabled)
+        self.log_file = None
+        self._log_enabled = False
+        self.log_writer = None
+
+        # Counters
+        self.sample_count = 0
+        self.line_count = 0
+        self.malformed_count = 0
+        self.loss = LossTracker()  # Received/lost/malformed/duplicate samples
+        self.log_loss_baseline = None  # loss.snapshot() when the current log was opened
+
+        self._sample_listeners = []
+        self._line_listeners = []
+        self._status_listeners = []
+
+    # ------------------------------------------------------------------
+    # Subscriptions
+    # ------------------------------------------------------------------
+    def add_sample_listener(self, callback):
+        """Call callback(batch) with each SAMPLE_DTYPE array of parsed samples"""
+        self._sample_listeners.append(callback)
+
+    def remove_sample_listener(self, callback):
+        if callback in self._sample_listeners:
+            self._sample_listeners.remove(callback)
+
+    def add_line_listener(self, callback):
+        """Call callback(line) for every non-DATA line received from the device"""
+        self._line_listeners.append(callback)
+
+    def remove_line_listener(self, callback):
+        if callback in self._line_listeners:
+            self._line_listeners.remove(callback)
+
+    def add_status_listener(self, callback):
+        """Call callback(message) for host-side status and error messages"""
+        self._status_listeners.append(callback)
+
+    def remove_status_listener(self, callback):
+        if callback in self._status_listeners:
+            self._status_listeners.remove(callback)
+
+    def status(self, message):
+        """Report a status message to all status listeners"""
+        for callback in list(self._status_listeners):
+            try:
+                callback(message)
+            except Exception:
+                pass
+
+    def iter_samples(self, timeout=None, policy='spill', max_samples=1000000, spill_dir=None):
+        """Yield sample batches as they arrive
+
+        Stops when the engine disconnects, or when no batch arrives within
+        timeout seconds if a timeout is given. Batches wait in a BatchQueue
+        holding up to max_samples in memory; policy decides what happens
+        beyond that (icm20948_queue.POLICIES). The default spills to disk, so
+        a slow consumer loses nothing; drops are counted in self.loss.
+        """
+        batches = BatchQueue(policy, max_items=None, max_samples=max_samples, spill_dir=spill_dir,
+                             on_drop=lambda kind, batch: self.loss.record_drop('iter_samples', len(batch)))
+
+        def put(batch):
+            batches.put('samples', batch)
+        self.add_sample_listener(put)
+        try:
+            while self.connected or not batches.empty():
+                try:
+                    _, batch = batches.get(timeout=0.5 if timeout is None else timeout)
+                except queue.Empty:
+                    if timeout is not None:
+                        return
+                    continue
+                yield batch
+        finally:
+            self.remove_sample_listener(put)
+            batches.close()
+
+    # ------------------------------------------------------------------
+    # Connection
+    # ------------------------------------------------------------------
+    def start(self, connection=None):
+        """Open the port and start the reader thread
+
+        The port may be a serial device or any URL open_transport() accepts
+        (socket://, rfcomm://, pty://). connection replaces it with an
+        already open port-like object (e.g. icm20948_replay.ReplayPort); no
+        settle delay is applied.
+
+        If a desired configuration was set (reconcile()), the device's
+        configuration is read back and corrected; the Future of that
+        reconciliation is returned (None otherwise). Port-like connections
+        are not reconciled, since a replay cannot be reconfigured.
+        """
+        if self.connected:
+            return
+
+        if connection is not None:
+            self.serial_connection = connection
+            self.port = connection.port
+            self._start_threads()
+            self.status(f"Connected to {self.port}")
+            return
+
+        self.status(f"Attempting to connect to {self.port} at {self.baudrate} baud...")
+
+        # Open the transport; reads block briefly so stop() is noticed
+        self.serial_connection = open_transport(self.port, self.baudrate,
+                                                timeout=self.read_timeout, write_timeout=2)
+
+        try:
+            # Verify connection is open
+            if not self.serial_connection.is_open:
+                raise Exception("Failed to open serial port")
+
+            # Clear any existing data
+            self.serial_connection.reset_input_buffer()
+            self.serial_connection.reset_output_buffer()
+
+            if self.serial_connection.resets_on_open:
+                time.sleep(self.settle_time)  # Wait for the ESP32 to reboot
+        except Exception:
+            self._close_port()
+            raise
+
+        self._start_threads()
+        self.status(f"Connected to {self.port} at {self.baudrate} baud")
+
+        # The device may have rebooted or been reconfigured meanwhile
+        if self.desired_config:
+            return self.reconcile()
+
+    def _start_threads(self):
+        self.decoder.reset()
+        self.clock.reset()
+        self.loss.restart_stream()
+        self.config_verified = False
+        self.connected = True
+        self.commands.start()
+        self.reading_thread = threading.Thread(target=self.read_serial_data, daemon=True)
+        self.reading_thread.start()
+
+    def stop(self):
+        """Stop the reader thread and close the serial port"""
+        self.connected = False
+        self.streaming = False
+        self.commands.stop()
+
+        if self.reading_thread and self.reading_thread.is_alive() \
+                and self.reading_thread is not threading.current_thread():
+            self.status("Waiting for reading thread to stop...")
+            self.reading_thread.join(timeout=2.0)
+        self.reading_thread = None
+
+        self._close_port()
+        self.close_log()
+
+    def _close_port(self):
+        if self.serial_connection:
+            try:
+                self.serial_connection.close()
+                self.status("Serial connection closed")
+            except Exception as e:
+                self.status(f"Error closing serial: {e}")
+            finally:
+                self.serial_connection = None
+
+    # ------------------------------------------------------------------
+    # Commands and configuration
+    # ------------------------------------------------------------------
+    def send_command(self, command, timeout=None):
+        """Queue a command for the writer thread; returns a Future for the device's response
+
+        Never blocks and never discards received data. The Future fails with
+        CommandError/CommandTimeout if the device rejects or ignores the command.
+        """
+        if not self.connected or not self.serial_connection:
+            raise Exception("Not connected")
+
+        self.status(f"=== SENDING COMMAND: {command} ===")
+        future = self.commands.submit(command, timeout)
+        future.add_done_callback(lambda done: self.report_command(command, done))
+        return future
+
+    def report_command(self, command, future):
+        error = future.exception()
+        if error is not None:
+            self.status(f"Command '{command}' failed: {error}")
+        else:
+            self.device_config.update(parse_command_config(command))
+            self.desired_config.update(requested_config(command))
+            if command.strip().upper().startswith('SET_FORMAT='):
+                # The firmware restarts the frame sequence at 0 (acks arrive on the reader thread)
+                self.decoder.last_seq = None
+                self.loss.restart_stream()
+            self.status(f"Command '{command}' acknowledged in {future.rtt * 1000:.1f} ms")
+
+    def write_bytes(self, data):
+        """Write raw bytes to the port (called by the command writer thread)"""
+        with self.write_lock:
+            serial_connection = self.serial_connection
+            if not serial_connection or not serial_connection.is_open:
+                raise Exception("Serial port is closed")
+            serial_connection.write(data)
+            serial_connection.flush()
+
+    def configure(self, **settings):
+        """Send SET_*/ENABLE_* commands for the given configuration keys
+
+        Keys are those of CONFIG_COMMANDS, e.g. configure(sample_rate=500, enable_mag=False).
+        Returns the commands' Futures.
+        """
+        for key in settings:
+            if key not in CONFIG_COMMANDS:
+                raise ValueError(f"Unknown configuration key: {key}")
+        return [self.send_command(f"{CONFIG_COMMANDS[key]}={int(value)}")
+                for key, value in settings.items()]
+
+    def apply_config(self, **settings):
+        """Apply several configuration keys atomically with one SET_CONFIG command
+
+        The firmware validates every field before changing anything, so either
+        all settings take effect or none do. Returns a Future for the CONFIG:
+        line the device reports afterwards.
+        """
+        for key in settings:
+            if key not in CONFIG_FIELDS:
+                raise ValueError(f"Unknown configuration key: {key}")
+        fields = ','.join(f"{CONFIG_FIELDS[key]}={int(value)}" for key, value in settings.items())
+        return self.send_command(f"SET_CONFIG={fields}")
+
+    def apply_preset(self, name):
+        """Apply one of CONFIG_PRESETS"""
+        return self.apply_config(**CONFIG_PRESETS[name])
+
+    def config_diff(self, desired=None):
+        """Keys of the desired configuration whose value the device does not have"""
+        desired = self.desired_config if desired is None else desired
+        return {key: value for key, value in desired.items() if self.device_config.get(key) != value}
+
+    def reconcile(self, **settings):
+        """Bring the device to the desired configuration, sending only what differs
+
+        settings (keys of CONFIG_FIELDS) are merged into desired_config. If the
+        device's configuration has not been read since connecting, CONFIG is
+        requested first. The changed keys go out as one SET_CONFIG; nothing is
+        sent when the device already matches. Returns a Future resolving with
+        the dict of keys that were sent.
+        """
+        for key in settings:
+            if key not in CONFIG_FIELDS:
+                raise ValueError(f"Unknown configuration key: {key}")
+        self.desired_config.update({key: int(value) for key, value in settings.items()})
+
+        result = Future()
+        if self.config_verified:
+            self._send_config_diff(result)
+        else:
+            config = self.request_config()
+            config.add_done_callback(lambda done: self._send_config_diff(result, done))
+        return result
+
+    def _send_config_diff(self, result, config=None):
+        try:
+            if config is not None:
+                config.result()  # Propagate a failed CONFIG request
+            diff = self.config_diff()
+            if not diff:
+                self.status("Device configuration up to date")
+                result.set_result({})
+                return
+            self.status(f"Reconciling configuration: {diff}")
+            future = self.apply_config(**diff)
+        except Exception as e:
+            result.set_exception(e)
+            return
+
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                result.set_exception(error)
+            else:
+                result.set_result(diff)
+        future.add_done_callback(done)
+
+    def request_config(self):
+        """Ask the device to report its configuration"""
+        return self.send_command("CONFIG")
+
+    def set_binary_format(self, enabled):
+        """Switch the device between packed binary frames and DATA: text lines"""
+        return self.send_command("SET_FORMAT=BIN" if enabled else "SET_FORMAT=TEXT")
+
+    def start_streaming(self):
+        # Time spent stopped is not a gap
+        self.loss.restart_stream()
+        self.decoder.last_seq = None
+        future = self.send_command("START")
+        self.streaming = True
+        return future
+
+    def stop_streaming(self):
+        self.streaming = False
+        return self.send_command("STOP")
+
+    # ------------------------------------------------------------------
+    # Logging
+    # ------------------------------------------------------------------
+    def set_log_file(self, filename):
+        """Select the log file and write its header
+
+        Names ending in .icms record a columnar session, anything else CSV.
+        """
+        self.close_log()
+        if is_session_path(filename):
+            create_session(filename, self.device_config)
+        else:
+            LogWriter(filename, write_header=True).close()
+        self.log_file = filename
+
+    @property
+    def log_enabled(self):
+        return self._log_enabled
+
+    @log_enabled.setter
+    def log_enabled(self, enabled):
+        self._log_enabled = bool(enabled)
+        if not enabled:
+            self.close_log()
+
+    @property
+    def log_backlog(self):
+        """Samples handed to the log writer but not yet written"""
+        return self.log_writer.backlog if self.log_writer else 0
+
+    def write_to_log(self, batch):
+        """Queue a batch of samples for the background log writer"""
+        if self.log_writer is None:
+            self.log_loss_baseline = self.loss.snapshot()
+            try:
+                if is_session_path(self.log_file):
+                    self.log_writer = SessionWriter(self.log_file, self.device_config, on_error=self.status,
+                                                    loss=self.log_loss)
+                else:
+                    self.log_writer = LogWriter(self.log_file, on_error=self.status)
+            except Exception as e:
+                self.status(f"Logging error: {str(e)}")
+                self._log_enabled = False
+                return
+        self.log_writer.write(batch)
+
+    def close_log(self):
+        """Flush and close the log file; logging resumes in append mode if still enabled"""
+        log_writer, self.log_writer = self.log_writer, None
+        if log_writer:
+            log_writer.close()
+            self.status(f"Log {self.log_file} closed: {format_loss(self.log_loss())}")
+
+    def log_loss(self):
+        """Loss counters since the current log file was opened"""
+        return self.loss.since(self.log_loss_baseline or {})
+
+    # ------------------------------------------------------------------
+    # Reader thread
+    # ------------------------------------------------------------------
+    def read_serial_data(self):
+        """Read everything available in bulk and hand complete lines over in batches"""
+        while self.connected and self.serial_connection:
+            try:
+                serial_connection = self.serial_connection
+                # Blocks for the first byte (up to read_timeout), then takes
+                # everything that has already arrived in the same read
+                data = serial_connection.read(self.read_chunk_size)
+                if not data:
+                    continue
+                arrival = time.time()
+
+                decoder = self.decoder
+                gaps, duplicates, crc_errors = \
+                    decoder.sequence_gaps, decoder.sequence_duplicates, decoder.crc_errors
+                lines, frames = decoder.feed(data, arrival)
+                if lines:
+                    self.handle_lines(lines, arrival)
+                if len(frames):
+                    self.dispatch_samples(frames)
+                if len(frames) or decoder.crc_errors != crc_errors:
+                    self.loss.check_frames(frames['timestamp'], decoder.sequence_gaps - gaps,
+                                           decoder.sequence_duplicates - duplicates,
+                                           decoder.crc_errors - crc_errors)
+
+            except Exception as e:
+                if self.connected:
+                    self.status(f"Read error: {str(e)}")
+                    # If we get repeated errors, disconnect to prevent hanging
+                    if "access is denied" in str(e).lower():
+                        self.status("Serial port access error - disconnecting")
+                        self.connected = False
+                break
+
+        self.status("Serial reading thread stopped")
+
+    def handle_lines(self, lines, host_time=None):
+        """Parse DATA lines into one sample batch and forward everything else
+
+        host_time is when the lines arrived (now if not given).
+        """
+        if host_time is None:
+            host_time = time.time()
+        self.line_count += len(lines)
+        data_lines = []
+        for line in lines:
+            if line.startswith("DATA:"):
+                data_lines.append(line)
+                continue
+
+            if line.startswith("CONFIG:"):
+                try:
+                    self.device_config.update(parse_config_line(line))
+                    self.config_verified = True
+                    self.streaming = bool(self.device_config.get('streaming', self.streaming))
+                except ValueError:
+                    self.status(f"Config parsing error - Line was: {line}")
+            self.commands.handle_line(line)
+            for callback in list(self._line_listeners):
+                callback(line)
+
+        if data_lines:
+            batch, malformed = parse_data_lines(data_lines, host_time)
+            if malformed:
+                # Only show occasional parsing errors
+                if self.malformed_count // 50 != (self.malformed_count + malformed) // 50 \
+                        or self.malformed_count == 0:
+                    self.status(f"Skipped {malformed} malformed DATA line(s), "
+                                f"{self.malformed_count + malformed} in total")
+                self.malformed_count += malformed
+            if len(batch):
+                self.dispatch_samples(batch)
+            # After dispatching, so a log opened by this batch counts all of it
+            self.loss.check_timestamps(batch['timestamp'], malformed, self.device_config.get('sample_rate'))
+
+    def dispatch_samples(self, batch):
+        """Log a batch of samples and hand it to every sample listener
+
+        The batch's host times are replaced by the clock model's estimate of
+        when each sample was taken.
+        """
+        batch['time'] = self.clock.update(batch['timestamp'], batch['time'])
+        self.sample_count += len(batch)
+        if self.log_enabled and self.log_file:
+            self.write_to_log(batch)
+        for callback in list(self._sample_listeners):
+            callback(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless ICM20948 acquisition")
+    parser.add_argument('--port', required=True,
+                        help="Serial port (COM3, /dev/ttyUSB0) or URL (socket://host:port, "
+                             "rfcomm://AA:BB:CC:DD:EE:FF, pty:///dev/pts/N)")
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--log', help="File to log samples to (.csv, or .icms for a session)")
+    parser.add_argument('--sample-rate', type=int, help="Set the device sample rate (Hz)")
+    parser.add_argument('--duration', type=float, default=0, help="Seconds to record (0 = until Ctrl+C)")
+    args = parser.parse_args()
+
+    engine = AcquisitionEngine(args.port, args.baud)
+    engine.add_status_listener(print)
+    engine.add_line_listener(lambda line: print(f"ESP32: {line}"))
+
+    if args.log:
+        engine.set_log_file(args.log)
+        engine.log_enabled = True
+
+    engine.start()
+    try:
+        if args.sample_rate:
+            engine.reconcile(sample_rate=args.sample_rate).result()
+        engine.start_streaming().result()
+
+        start_time = time.time()
+        last_report = start_time
+        last_count = 0
+        while engine.connected:
+            time.sleep(0.2)
+            now = time.time()
+            if now - last_report >= 1.0:
+                rate = (engine.sample_count - last_count) / (now - last_report)
+                print(f"Samples: {engine.sample_count} ({rate:.0f}/s), {format_loss(engine.loss.snapshot())}")
+                last_report, last_count = now, engine.sample_count
+            if args.duration and now - start_time >= args.duration:
+                break
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        if engine.connected:
+            try:
+                engine.stop_streaming()
+            except Exception:
+                pass
+        engine.stop()
+        print(f"Capture: {format_loss(engine.loss.snapshot())}")
+
+
+if __name__ == "__main__":
+    main()
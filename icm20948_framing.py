@@ -0,0 +1,44 @@
+"""
+Incremental line framing for the ESP32 serial stream
+
+The reader pulls whatever bytes are available in one large read and feeds
+them to a LineFramer, which returns every complete line in the chunk and keeps
+the trailing partial line for the next read.
+"""
+
+
+class LineFramer:
+    """Split a byte stream into text lines across arbitrary read boundaries"""
+
+    def __init__(self, max_line_length=4096):
+        self.buffer = bytearray()
+        self.max_line_length = max_line_length
+        self.overflow_count = 0  # Partial lines discarded for exceeding max_line_length
+
+    def feed(self, data):
+        """Add raw bytes and return the list of complete, non-empty lines"""
+        buffer = self.buffer
+        buffer += data
+
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            # No line end yet - guard against garbage with no newline growing forever
+            if len(buffer) > self.max_line_length:
+                self.overflow_count += 1
+                del buffer[:]
+            return []
+
+        chunk = bytes(buffer[:end])
+        del buffer[:end + 1]
+
+        try:
+            text = chunk.decode('utf-8')
+        except UnicodeDecodeError:
+            # Fallback to latin-1 which can decode any byte sequence
+            text = chunk.decode('latin-1')
+
+        return [line for line in map(str.strip, text.split('\n')) if line]
+
+    def reset(self):
+        """Drop any buffered partial line (e.g. after reconnecting)"""
+        del self.buffer[:]
@@ -0,0 +1,154 @@
+"""
+Background log writers
+
+Sample batches are queued by the acquisition thread and written by a
+dedicated thread that keeps its files open, handles whole batches at once and
+flushes on a size/time policy, so logging never blocks parsing or the GUI.
+BackgroundWriter owns the thread and the policy; subclasses supply the file
+format (LogWriter for CSV, SessionWriter in icm20948_session for sessions).
+"""
+
+import queue
+import threading
+import time
+
+from icm20948_samples import CSV_HEADER, format_csv_rows
+
+
+class BackgroundWriter:
+    """Queue sample batches and write them from a background thread
+
+    Subclasses implement write_batches(batches) -> bytes written, flush() and
+    close_files(), and call start() at the end of __init__ if self.threaded.
+    With threaded=False no thread is started and the caller drives
+    write_batches() and flush() itself (used by the benchmarks).
+    """
+
+    def __init__(self, flush_bytes=256 * 1024, flush_interval=1.0, on_error=None, threaded=True):
+        self.threaded = threaded
+        self.flush_bytes = flush_bytes        # Flush once this much is written since the last flush
+        self.flush_interval = flush_interval  # ... or once this many seconds have passed
+        self.on_error = on_error
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.backlog = 0           # Samples queued but not yet written
+        self.samples_written = 0
+        self.bytes_written = 0
+        self.flush_count = 0
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def write(self, batch):
+        """Queue a SAMPLE_DTYPE batch for writing (never blocks)"""
+        if len(batch) == 0 or self.error:
+            return
+        with self.lock:
+            self.backlog += len(batch)
+        self.queue.put(batch)
+
+    def close(self):
+        """Write everything still queued, flush and close the files"""
+        if not self.threaded:
+            self.close_files()
+        elif self.thread and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def stats(self):
+        return {
+            'backlog': self.backlog,
+            'samples_written': self.samples_written,
+            'bytes_written': self.bytes_written,
+            'flushes': self.flush_count,
+        }
+
+    def write_batches(self, batches):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    def close_files(self):
+        raise NotImplementedError
+
+    def run(self):
+        unflushed = 0
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            try:
+                batches = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batches = []
+
+            # Take everything else that is already waiting in one go
+            while True:
+                try:
+                    batches.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if any(batch is None for batch in batches):
+                running = False
+                batches = [batch for batch in batches if batch is not None]
+
+            count = sum(len(batch) for batch in batches)
+            if count and not self.error:
+                try:
+                    written = self.write_batches(batches)
+                    unflushed += written
+                    self.bytes_written += written
+                    self.samples_written += count
+                except Exception as e:
+                    self.report_error(e)
+            with self.lock:
+                self.backlog -= count
+
+            now = time.monotonic()
+            if unflushed and (unflushed >= self.flush_bytes or now - last_flush >= self.flush_interval
+                              or not running):
+                try:
+                    self.flush()
+                    self.flush_count += 1
+                except Exception as e:
+                    self.report_error(e)
+                unflushed = 0
+                last_flush = now
+
+        try:
+            self.close_files()
+        except Exception as e:
+            self.report_error(e)
+
+    def report_error(self, error):
+        self.error = error
+        if self.on_error:
+            self.on_error(f"Logging error: {str(error)}")
+
+
+class LogWriter(BackgroundWriter):
+    """Append sample batches to a CSV file from a background thread"""
+
+    def __init__(self, filename, write_header=False, buffer_size=1024 * 1024, **kwargs):
+        super().__init__(**kwargs)
+        self.filename = filename
+        self.file = open(filename, 'w' if write_header else 'a', newline='', buffering=buffer_size)
+        if write_header:
+            self.file.write(','.join(CSV_HEADER) + '\n')
+        if self.threaded:
+            self.start()
+
+    def write_batches(self, batches):
+        text = ''.join(format_csv_rows(batch) for batch in batches)
+        self.file.write(text)
+        return len(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def close_files(self):
+        self.file.close()
@@ -0,0 +1,243 @@
+"""
+Sample loss accounting for the acquisition pipeline
+
+Every sample the device produced ends up in one of these buckets:
+
+    received     parsed and handed to the sample listeners
+    lost         missing from the stream: never sent, lost on the link or
+                 overrun in the OS serial buffer. 'corrupt' is the part
+                 explained by damaged data just before the gap (malformed DATA
+                 lines, frames failing the CRC), 'missing' the rest
+    duplicates   repeated samples (the timestamp or sequence did not advance)
+    dropped      received but later discarded by a consumer, e.g. the GUI
+                 queue dropping its oldest batches, per consumer name
+
+malformed and crc_errors count the damaged lines and frames themselves.
+
+Binary frames carry a 16-bit sequence number, so their losses are exact.
+DATA lines only have the device millis() timestamp, which may jitter by
+more than a sample interval. The firmware samples every 1000 // sample_rate
+ms, so every sample is placed on that grid (anchored on the first
+TIMESTAMP_WINDOW samples after a (re)start) and its offset is how many grid
+slots it is ahead of its position in the stream. The median offset of the
+last TIMESTAMP_WINDOW samples moving at least TIMESTAMP_TOLERANCE slots
+away from the level already accounted for is a change of whole slots: up
+by n is n missing samples, down by n is n duplicates. Jitter of single
+samples does not move the median. Above 1 kHz several samples share a
+millisecond and text streams are not checked. A large backwards step is a
+device restart, not a loss.
+"""
+
+import collections
+import threading
+
+import numpy as np
+
+RESTART_JUMP_MS = 100  # Backwards timestamp step that means millis() restarted
+TIMESTAMP_WINDOW = 15      # Samples the grid anchor and the median offset are taken over
+TIMESTAMP_TOLERANCE = 0.75  # Grid slots the median offset must move to count
+COUNTERS = ('received', 'lost_missing', 'lost_corrupt', 'duplicates',
+            'malformed', 'crc_errors', 'restarts')
+
+
+def sample_interval_ms(sample_rate):
+    """Firmware sample interval in whole milliseconds, or None if it cannot be resolved"""
+    if not sample_rate:
+        return None
+    interval = 1000 // int(sample_rate)
+    return interval if interval >= 1 else None
+
+
+class LossTracker:
+    """Live counters for one stream; snapshot()/since() give per-session figures"""
+
+    def __init__(self):
+        self.lock = threading.Lock()  # Consumers report drops from their own threads
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            for name in COUNTERS:
+                setattr(self, name, 0)
+            self.dropped = collections.Counter()
+            self.last_timestamp = None
+            self.damaged = 0  # Damaged lines/frames not yet matched with a gap
+        self.restart_grid()
+
+    def restart_stream(self):
+        """Forget continuity (new START or connection); the pause is not a loss"""
+        self.last_timestamp = None
+        self.damaged = 0
+        self.restart_grid()
+
+    def restart_grid(self):
+        """Start placing DATA timestamps on a new sample grid"""
+        self.interval = None   # Grid spacing (ms)
+        self.anchor = None     # Grid time of stream position 0 (ms)
+        self.position = 0      # Samples received since the anchor
+        self.calibration = []  # First offsets from the grid, to centre the anchor
+        self.offsets = np.zeros(0)  # Last TIMESTAMP_WINDOW - 1 offsets (grid slots)
+        self.level = 0         # Grid slots accounted for as missing (minus duplicates)
+
+    @property
+    def lost(self):
+        return self.lost_missing + self.lost_corrupt
+
+    def add_lost(self, gaps, damaged):
+        """Record the gaps of a batch, attributing them to damaged data first
+
+        Every damaged line or frame is a sample that shows up as a gap before
+        the next sample arriving intact, which may be in a later read.
+        """
+        self.damaged += damaged
+        corrupt = min(gaps, self.damaged)
+        self.damaged -= corrupt
+        with self.lock:
+            self.lost_corrupt += corrupt
+            self.lost_missing += gaps - corrupt
+
+    def check_timestamps(self, timestamps, malformed=0, sample_rate=None):
+        """Account for a batch of parsed DATA lines and the lines rejected with it"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        with self.lock:
+            self.received += len(timestamps)
+            self.malformed += malformed
+        if not len(timestamps):
+            self.add_lost(0, malformed)
+            return
+
+        steps = self.steps(timestamps)
+        restarts = np.flatnonzero(steps < -RESTART_JUMP_MS)
+        if len(restarts):
+            # Continuity starts over with the new boot
+            with self.lock:
+                self.restarts += len(restarts)
+            self.restart_grid()
+            timestamps = timestamps[restarts[-1]:]
+            steps = steps[restarts[-1]:]
+
+        if sample_rate and int(sample_rate) > 1000:
+            # Several samples share a millisecond: the timestamps cannot show
+            # gaps or repeats, only sequence numbers (binary frames) can
+            interval = None
+        else:
+            interval = sample_interval_ms(sample_rate) or self.interval or self.estimate_interval(steps)
+        gaps = duplicates = 0
+        if interval:
+            gaps, duplicates = self.place_on_grid(timestamps, interval)
+        with self.lock:
+            self.duplicates += duplicates
+        self.add_lost(gaps, malformed)
+
+    def place_on_grid(self, timestamps, interval):
+        """(missing, duplicate) samples implied by a batch of DATA timestamps"""
+        if interval != self.interval or self.anchor is None:
+            self.restart_grid()
+            self.interval = interval
+            self.anchor = float(timestamps[0])
+        positions = self.position + np.arange(len(timestamps))
+        self.position += len(timestamps)
+        offsets = (timestamps - self.anchor) / interval - positions
+        if len(self.calibration) < TIMESTAMP_WINDOW:
+            # Centre the grid on the first samples rather than on one jittered timestamp
+            self.calibration.extend(offsets[:TIMESTAMP_WINDOW - len(self.calibration)].tolist())
+            shift = float(np.median(self.calibration))
+            self.anchor += shift * interval
+            offsets -= shift
+            self.offsets -= shift
+            self.calibration = [value - shift for value in self.calibration]
+
+        # Median of the last TIMESTAMP_WINDOW offsets at every sample (fewer at the start)
+        history = np.concatenate((self.offsets, offsets))
+        self.offsets = history[-(TIMESTAMP_WINDOW - 1):]
+        if len(history) >= TIMESTAMP_WINDOW:
+            windows = np.lib.stride_tricks.sliding_window_view(history, TIMESTAMP_WINDOW)
+            medians = np.median(windows[-len(offsets):], axis=1)
+        else:
+            medians = np.array([np.median(history[:end]) for end in range(len(history) - len(offsets) + 1,
+                                                                       len(history) + 1)])
+
+        missing = duplicates = 0
+        while True:
+            moved = np.flatnonzero(np.abs(medians - self.level) >= TIMESTAMP_TOLERANCE)
+            if not len(moved):
+                break
+            change = int(np.round(medians[moved[0]] - self.level))
+            missing += max(change, 0)
+            duplicates += max(-change, 0)
+            self.level += change
+            medians = medians[moved[0] + 1:]
+        return missing, duplicates
+
+    def check_frames(self, timestamps, gaps=0, duplicates=0, crc_errors=0):
+        """Account for a batch of binary frames; gaps and duplicates come from the sequence numbers"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        restarts = 0
+        if len(timestamps):
+            restarts = int(np.count_nonzero(self.steps(timestamps) < -RESTART_JUMP_MS))
+        with self.lock:
+            self.received += len(timestamps)
+            self.crc_errors += crc_errors
+            self.duplicates += duplicates
+            self.restarts += restarts
+        self.add_lost(gaps, crc_errors)
+
+    def steps(self, timestamps):
+        if self.last_timestamp is not None:
+            steps = np.diff(timestamps, prepend=self.last_timestamp)
+        else:
+            steps = np.diff(timestamps)
+        self.last_timestamp = int(timestamps[-1])
+        return steps
+
+    @staticmethod
+    def estimate_interval(steps):
+        """Sample interval from the data when the device configuration is unknown"""
+        positive = steps[steps > 0]
+        if len(positive) < 8:
+            return None
+        return int(np.median(positive))
+
+    def record_drop(self, consumer, count):
+        """A consumer discarded `count` received samples"""
+        with self.lock:
+            self.dropped[consumer] += count
+
+    def snapshot(self):
+        """Current counters as a dict"""
+        with self.lock:
+            stats = {name: getattr(self, name) for name in COUNTERS}
+            stats['dropped'] = dict(self.dropped)
+        stats['lost'] = stats['lost_missing'] + stats['lost_corrupt']
+        stats['complete'] = is_complete(stats)
+        return stats
+
+    def since(self, baseline):
+        """Counters accumulated since an earlier snapshot()"""
+        stats = self.snapshot()
+        for name in COUNTERS + ('lost',):
+            stats[name] -= baseline.get(name, 0)
+        before = baseline.get('dropped', {})
+        stats['dropped'] = {name: count - before.get(name, 0)
+                            for name, count in stats['dropped'].items() if count > before.get(name, 0)}
+        stats['complete'] = is_complete(stats)
+        return stats
+
+
+def is_complete(stats):
+    """True if no sample was lost, damaged, repeated or dropped"""
+    return not (stats['lost'] or stats['malformed'] or stats['crc_errors']
+                or stats['duplicates'] or any(stats['dropped'].values()))
+
+
+def format_loss(stats):
+    """One-line summary of a snapshot()"""
+    text = (f"received {stats['received']}, lost {stats['lost']} "
+            f"(missing {stats['lost_missing']}, corrupt {stats['lost_corrupt']}), "
+            f"malformed {stats['malformed']}, CRC errors {stats['crc_errors']}, "
+            f"duplicates {stats['duplicates']}")
+    for consumer, count in stats['dropped'].items():
+        text += f", dropped by {consumer} {count}"
+    if stats['restarts']:
+        text += f", device restarts {stats['restarts']}"
+    return text + (" - complete" if stats['complete'] else "")
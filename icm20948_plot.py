@@ -0,0 +1,153 @@
+"""
+Blitting renderer for the real-time sensor plots
+
+The figure, axes, titles, legends and Line2D artists are built once. Each
+refresh only swaps the line data, restores the cached background and blits the
+lines. Axis limits are recomputed (with a full redraw) only when the data
+leaves the current limits or shrinks well inside them.
+
+Windows longer than the axes are wide are decimated (see icm20948_decimate)
+to about points_per_pixel points per horizontal pixel, so a 5 minute window
+costs as much to draw as a 2 second one. Longer spans come from the
+HistoryPyramid levels (icm20948_pyramid) as min/max blocks.
+"""
+
+import numpy as np
+
+from icm20948_decimate import decimate_indices, envelope_bins
+
+# (title, fields, colors, line width) for each of the four panels
+PLOT_PANELS = [
+    ('Accelerometer (m/s²)', ('accel_x', 'accel_y', 'accel_z'), ('r', 'g', 'b'), 1),
+    ('Gyroscope (rad/s)', ('gyro_x', 'gyro_y', 'gyro_z'), ('r', 'g', 'b'), 1),
+    ('Magnetometer (µT)', ('mag_x', 'mag_y', 'mag_z'), ('r', 'g', 'b'), 1),
+    ('Temperature (°C)', ('temp',), ('orange',), 2),
+]
+
+
+class PlotRenderer:
+    """Owns the 2x2 sensor plot and redraws it with blitting"""
+
+    def __init__(self, figure, canvas, margin=0.1, decimation='minmax', points_per_pixel=2):
+        self.figure = figure
+        self.canvas = canvas
+        self.margin = margin  # Headroom added around the data when rescaling
+        self.decimation = decimation  # 'minmax', 'lttb' or None to draw every sample
+        self.points_per_pixel = points_per_pixel
+        self.background = None
+        self.axes = []
+        self.lines = {}  # field -> Line2D
+
+        for index, (title, fields, colors, width) in enumerate(PLOT_PANELS):
+            ax = figure.add_subplot(2, 2, index + 1)
+            for field, color in zip(fields, colors):
+                label = field.rsplit('_', 1)[-1].upper() if len(fields) > 1 else None
+                line, = ax.plot([], [], color=color, label=label, linewidth=width,
+                                alpha=0.8, animated=True)
+                self.lines[field] = line
+            ax.set_title(title, fontsize=10)
+            ax.set_xlabel('Time (s)', fontsize=8)
+            if len(fields) > 1:
+                ax.legend(fontsize=8, loc='upper left')
+            ax.grid(True, alpha=0.3)
+            ax.set_xlim(-1.0, 0.0)
+            ax.set_ylim(-1.0, 1.0)
+            self.axes.append((ax, fields))
+
+        # Every full draw (first show, resize, rescale) refreshes the cached background
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        """Cache the static background and draw the animated lines over it"""
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for ax, fields in self.axes:
+            for field in fields:
+                ax.draw_artist(self.lines[field])
+
+    def update(self, window, origin=None):
+        """Show a window of samples given as column arrays (e.g. SampleRingBuffer.last())
+
+        HistoryPyramid blocks (columns with <field>_min/_max) are drawn as
+        the lower and upper edge of their min/max envelope. origin is the device timestamp at x = 0 (the
+        window's newest sample by default).
+        """
+        timestamps = window['timestamp']
+        if len(timestamps) < 2:
+            return
+
+        # Time axis (device clock) in seconds relative to the origin (the newest sample when live)
+        x = (timestamps - (timestamps[-1] if origin is None else origin)) / 1000.0
+        if self.decimation == 'lttb':
+            x = x.astype(np.float32)
+        rescale = False
+
+        for ax, fields in self.axes:
+            points = int(ax.bbox.width * self.points_per_pixel)
+            lo = hi = None
+            for field in fields:
+                if f'{field}_min' in window:
+                    # Lower and upper edge of the envelope, split by a NaN. Much
+                    # cheaper to rasterize than a vertical stroke per block
+                    starts, y_lo, y_hi = envelope_bins(window[f'{field}_min'], window[f'{field}_max'], points)
+                    y = np.concatenate((y_lo, [np.nan], y_hi))
+                    self.lines[field].set_data(np.concatenate((x[starts], [np.nan], x[starts])), y)
+                elif self.decimation and len(window[field]) > points:
+                    # Min/max decimation keeps the extremes, so the limits below still hold
+                    keep = decimate_indices(window[field], points, self.decimation, x)
+                    y = window[field][keep]
+                    self.lines[field].set_data(x[keep], y)
+                else:
+                    y = window[field]
+                    self.lines[field].set_data(x, y)
+                finite = y[np.isfinite(y)]
+                if len(finite):
+                    field_lo, field_hi = float(finite.min()), float(finite.max())
+                    lo = field_lo if lo is None else min(lo, field_lo)
+                    hi = field_hi if hi is None else max(hi, field_hi)
+            if lo is not None and self.rescale_needed(ax, x[0], x[-1], lo, hi):
+                self.rescale(ax, x[0], x[-1], lo, hi)
+                rescale = True
+
+        if rescale or self.background is None:
+            # Full redraw; on_draw recaptures the background and draws the lines
+            self.canvas.draw_idle()
+            return
+
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.canvas.blit(self.figure.bbox)
+
+    def max_points(self):
+        """Points per trace the widest axes can show (see points_per_pixel)"""
+        return int(max(ax.bbox.width for ax, _ in self.axes) * self.points_per_pixel)
+
+    def padding(self, lo, hi):
+        return max((hi - lo) * self.margin, 0.05 * max(abs(lo), abs(hi)), 1e-3)
+
+    def rescale_needed(self, ax, x_start, x_end, lo, hi):
+        """True if the data left the limits or fills less than a quarter of them"""
+        x_lo, x_hi = ax.get_xlim()
+        span = x_end - x_start
+        if span > 0 and (x_start < x_lo or x_end > x_hi or x_hi - x_end > self.margin * span
+                         or span < 0.5 * (x_hi - x_lo)):
+            return True
+        y_lo, y_hi = ax.get_ylim()
+        if lo < y_lo or hi > y_hi:
+            return True
+        return (y_hi - y_lo) > 4 * (hi - lo + 2 * self.padding(lo, hi))
+
+    def rescale(self, ax, x_start, x_end, lo, hi):
+        span = x_end - x_start
+        if span > 0:
+            ax.set_xlim(x_start - self.margin * span, x_end)
+        pad = self.padding(lo, hi)
+        ax.set_ylim(lo - pad, hi + pad)
+
+    def clear(self):
+        """Remove all data from the plots"""
+        for line in self.lines.values():
+            line.set_data([], [])
+        self.canvas.draw_idle()
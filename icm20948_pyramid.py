@@ -0,0 +1,177 @@
+"""
+Multi-resolution sample history for zoomable plots
+
+HistoryPyramid keeps the recent raw samples in a SampleRingBuffer and, next
+to them, coarser levels built as the samples arrive: level 1 holds one block
+per `factor` samples, level 2 one per factor^2 and so on. A block has the
+minimum, maximum and mean of each channel and the timestamps of its first
+sample (BLOCK_DTYPE; the mean is stored under the plain field name).
+
+Each level is a ring buffer of its own, so coarse levels reach much further
+back than the raw samples: with the defaults (16x, 3 levels of 65536 blocks)
+level 1 covers about 17 minutes at 1 kHz, level 2 about 4.5 hours and level
+3 about 3 days. window() answers "this span, about this many points" from the
+finest level that covers the span with a bounded number of entries, so
+drawing an hour costs the same as drawing a second and never touches the raw
+samples.
+
+Blocks are computed from the column views of the finer level's ring
+buffer, in chunks of at least fold_chunk samples, so appending costs about
+the same as a plain SampleRingBuffer. window() folds whatever is pending
+first. Only complete blocks are published; the newest partial block of each
+level (up to factor^n - 1 samples) shows up on the finer levels only.
+
+Lookups search the device timestamps, so the history starts over when the
+device restarts (its millis() jumps back).
+"""
+
+import numpy as np
+
+from icm20948_buffer import SampleRingBuffer, last_restart
+from icm20948_samples import AXIS_FIELDS
+
+BLOCK_DTYPE = np.dtype(
+    [('timestamp', np.int64),   # Device millis() of the block's first sample
+     ('time', np.float64)] +    # Host time of the block's first sample
+    [(f'{name}{suffix}', np.float32) for name in AXIS_FIELDS for suffix in ('', '_min', '_max')]
+)
+
+
+class HistoryPyramid:
+    """Raw sample history plus min/max/mean levels at factor^1, factor^2, ... samples per block"""
+
+    def __init__(self, capacity, factor=16, levels=3, level_capacity=65536, fold_chunk=256):
+        if factor < 2:
+            raise ValueError("factor must be at least 2")
+        self.factor = factor
+        self.fold_chunk = fold_chunk  # Raw samples collected before the levels are updated
+        self.raw = SampleRingBuffer(capacity)
+        self.levels = [SampleRingBuffer(level_capacity, BLOCK_DTYPE) for _ in range(levels)]
+        self.clear()
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def buffers(self):
+        """Raw buffer followed by the block levels, finest first"""
+        return [self.raw] + self.levels
+
+    def clear(self):
+        for buffer in self.buffers:
+            buffer.clear()
+        # Entries appended to each buffer since clear(), and how many of them
+        # have been folded into blocks of the next level
+        self.appended = [0] * len(self.buffers)
+        self.folded = [0] * len(self.levels)
+
+    # ------------------------------------------------------------------
+    # Raw samples (SampleRingBuffer interface)
+    # ------------------------------------------------------------------
+    def last(self, count=None):
+        return self.raw.last(count)
+
+    def last_seconds(self, seconds, field='time'):
+        return self.raw.last_seconds(seconds, field)
+
+    def to_array(self, count=None):
+        return self.raw.to_array(count)
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self.buffers)
+
+    # ------------------------------------------------------------------
+    # Building the levels
+    # ------------------------------------------------------------------
+    def append(self, samples):
+        """Append a batch of samples; the levels are updated every fold_chunk samples"""
+        samples = np.atleast_1d(samples)
+        if not len(samples):
+            return
+        previous = int(self.raw.last(1)['timestamp'][0]) if len(self.raw) else None
+        restart = last_restart(samples['timestamp'], previous)
+        if restart is not None:
+            # A new device boot: earlier timestamps belong to another timeline
+            self.clear()
+            samples = samples[restart:]
+        self.raw.append(samples)
+        self.appended[0] += len(samples)
+        if self.appended[0] - self.folded[0] >= self.fold_chunk:
+            self.fold()
+
+    def fold(self):
+        """Turn every complete block of pending entries into an entry of the next level"""
+        for index, level in enumerate(self.levels):
+            buffer = self.buffers[index]
+            # Entries that fell out of the buffer before being folded are gone
+            pending = min(self.appended[index] - self.folded[index], len(buffer))
+            whole = pending - pending % self.factor
+            if not whole:
+                break
+            columns = buffer.last(pending)
+            level.append(self.reduce({name: column[:whole] for name, column in columns.items()}, index == 0))
+            self.folded[index] = self.appended[index] - (pending - whole)
+            self.appended[index + 1] += whole // self.factor
+
+    def reduce(self, columns, raw):
+        """One block per `factor` consecutive entries (samples if raw, else blocks)"""
+        count = len(columns['timestamp']) // self.factor
+        shape = (count, self.factor)
+        blocks = np.empty(count, dtype=BLOCK_DTYPE)
+        blocks['timestamp'] = columns['timestamp'][::self.factor]
+        blocks['time'] = columns['time'][::self.factor]
+        for name in AXIS_FIELDS:
+            values = columns[name].reshape(shape)
+            lo = values if raw else columns[f'{name}_min'].reshape(shape)
+            hi = values if raw else columns[f'{name}_max'].reshape(shape)
+            # fmin/fmax skip NaN samples unless a whole block is NaN
+            blocks[f'{name}_min'] = np.fmin.reduce(lo, axis=1)
+            blocks[f'{name}_max'] = np.fmax.reduce(hi, axis=1)
+            # Blocks are whole, so the mean of the means is exact
+            blocks[name] = np.add.reduce(values, axis=1) / self.factor
+        return blocks
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def window(self, span_ms, points, end=None):
+        """Columns covering the `span_ms` milliseconds of device time up to `end`
+
+        end defaults to the newest sample. Returns (level, columns): level 0
+        columns are raw samples, higher levels are BLOCK_DTYPE columns. The
+        finest level whose history reaches back far enough and that has at
+        most points * factor / 2 entries in the span is chosen (the coarsest
+        level if none does), which still leaves at least one entry per point
+        pair for the caller to decimate.
+        """
+        if not len(self.raw):
+            return 0, self.raw.last()
+        self.fold()
+        if end is None:
+            end = int(self.raw.last(1)['timestamp'][0])
+        start = end - span_ms
+        limit = max(points * self.factor // 2, 2)
+
+        choice = None
+        for level, buffer in enumerate(self.buffers):
+            columns = buffer.last()
+            timestamps = columns['timestamp']
+            if not len(timestamps):
+                break
+            lo = np.searchsorted(timestamps, start, side='left')
+            hi = np.searchsorted(timestamps, end, side='right')
+            choice = level, {name: column[lo:hi] for name, column in columns.items()}
+            # Not full yet: the level holds everything since the last clear()
+            covers = timestamps[0] <= start or len(buffer) < buffer.capacity
+            if covers and hi - lo <= limit:
+                break
+        return choice
+
+    def stats(self):
+        return {
+            'factor': self.factor,
+            'raw': len(self.raw),
+            'levels': [len(level) for level in self.levels],
+            'bytes': self.nbytes,
+        }
@@ -0,0 +1,282 @@
+"""
+Bounded batch queue with selectable backpressure
+
+Hands (kind, item) pairs from the engine's reader thread to a consumer (the
+Tk thread, a headless iterator) within sample, byte and item limits. What
+happens when a put would exceed them is the queue's policy:
+
+    block        the producer waits for room (up to block_timeout, then the
+                 item is dropped); nothing is lost but the reader stalls
+    drop_oldest  the oldest queued items are discarded (live views)
+    drop_newest  the incoming item is discarded
+    spill        the item is appended to a temporary file and read back in
+                 order once there is room again; nothing is lost and memory
+                 stays bounded (logging-critical consumers)
+
+Items are sample batches (SAMPLE_DTYPE arrays, counted by samples and bytes)
+or anything else (text lines, status messages, counted by their length).
+Dropped items are passed to on_drop(kind, item). stats() reports the
+high-water marks along with drop, spill and blocking counters.
+"""
+
+import collections
+import os
+import pickle
+import queue
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+POLICIES = ('block', 'drop_oldest', 'drop_newest', 'spill')
+# Spill record prefix: pickle length, then the item's samples and bytes so
+# unspill() can check for room without unpickling
+SPILL_HEADER = struct.Struct('<IIQ')
+
+
+def item_size(item):
+    """(samples, bytes) an item counts against the limits"""
+    if isinstance(item, np.ndarray):
+        return len(item), item.nbytes
+    if isinstance(item, (str, bytes)):
+        return 0, len(item)
+    return 0, 64
+
+
+class BatchQueue:
+    """Thread-safe FIFO of (kind, item) with a backpressure policy (see module docstring)"""
+
+    def __init__(self, policy='drop_oldest', max_items=1000, max_samples=None, max_bytes=None,
+                 block_timeout=None, spill_dir=None, on_drop=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy} (expected one of {', '.join(POLICIES)})")
+        self.policy = policy
+        self.max_items = max_items
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.block_timeout = block_timeout  # None waits as long as it takes
+        self.spill_dir = spill_dir          # Directory for the spill file (system temp by default)
+        self.on_drop = on_drop
+
+        self.cond = threading.Condition()
+        self.items = collections.deque()  # (kind, item, samples, bytes)
+        self.samples = 0
+        self.bytes = 0
+        self.closed = False
+
+        # Spill file: SPILL_HEADER-prefixed pickles appended at the end and
+        # read back from spill_read_pos
+        self.spill_file = None
+        self.spill_read_pos = 0
+        self.spill_items = 0
+        self.spill_bytes = 0
+
+        # Metrics
+        self.put_count = 0
+        self.high_items = 0
+        self.high_samples = 0
+        self.high_bytes = 0
+        self.dropped_items = 0
+        self.dropped_samples = 0
+        self.spilled_items = 0
+        self.spill_high_bytes = 0
+        self.blocked_time = 0.0
+
+    def __len__(self):
+        return len(self.items) + self.spill_items
+
+    def qsize(self):
+        return len(self)
+
+    def empty(self):
+        return len(self) == 0
+
+    def has_room(self, samples, nbytes):
+        # An item larger than the limits is still admitted into an empty queue
+        if not self.items:
+            return True
+        if self.max_items and len(self.items) >= self.max_items:
+            return False
+        if self.max_samples and self.samples + samples > self.max_samples:
+            return False
+        if self.max_bytes and self.bytes + nbytes > self.max_bytes:
+            return False
+        return True
+
+    # ------------------------------------------------------------------
+    # Producer
+    # ------------------------------------------------------------------
+    def put(self, kind, item):
+        """Queue an item under the current policy; returns False if it was dropped"""
+        samples, nbytes = item_size(item)
+        dropped = []
+        with self.cond:
+            if self.closed:
+                return False
+            self.put_count += 1
+            # While anything is spilled, later items follow it to disk to
+            # keep the order (even if the policy was changed meanwhile)
+            if self.spill_items or (self.policy == 'spill' and not self.has_room(samples, nbytes)):
+                self.spill(kind, item)
+                return True
+
+            accepted = True
+            if not self.has_room(samples, nbytes):
+                if self.policy == 'block':
+                    accepted = self.wait_for_room(samples, nbytes)
+                elif self.policy == 'drop_oldest':
+                    while self.items and not self.has_room(samples, nbytes):
+                        dropped.append(self.pop())
+                else:
+                    accepted = False
+            if accepted:
+                self.push(kind, item, samples, nbytes)
+                self.cond.notify_all()
+            else:
+                dropped.append((kind, item, samples, nbytes))
+            for entry in dropped:
+                self.dropped_items += 1
+                self.dropped_samples += entry[2]
+
+        for kind_, item_, _, _ in dropped:
+            if self.on_drop:
+                self.on_drop(kind_, item_)
+        return accepted
+
+    def wait_for_room(self, samples, nbytes):
+        start = time.monotonic()
+        deadline = None if self.block_timeout is None else start + self.block_timeout
+        while not self.closed and not self.has_room(samples, nbytes):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            self.cond.wait(remaining if remaining is not None else 0.5)
+        self.blocked_time += time.monotonic() - start
+        return not self.closed and self.has_room(samples, nbytes)
+
+    def push(self, kind, item, samples, nbytes):
+        self.items.append((kind, item, samples, nbytes))
+        self.samples += samples
+        self.bytes += nbytes
+        self.high_items = max(self.high_items, len(self.items))
+        self.high_samples = max(self.high_samples, self.samples)
+        self.high_bytes = max(self.high_bytes, self.bytes)
+
+    def pop(self):
+        entry = self.items.popleft()
+        self.samples -= entry[2]
+        self.bytes -= entry[3]
+        return entry
+
+    # ------------------------------------------------------------------
+    # Spill file
+    # ------------------------------------------------------------------
+    def spill(self, kind, item):
+        if self.spill_file is None:
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+            self.spill_file = tempfile.TemporaryFile(prefix='icm20948_spill_', dir=self.spill_dir)
+        data = pickle.dumps((kind, item), protocol=pickle.HIGHEST_PROTOCOL)
+        self.spill_file.seek(0, os.SEEK_END)
+        self.spill_file.write(SPILL_HEADER.pack(len(data), *item_size(item)))
+        self.spill_file.write(data)
+        self.spill_items += 1
+        self.spill_bytes += SPILL_HEADER.size + len(data)
+        self.spilled_items += 1
+        self.spill_high_bytes = max(self.spill_high_bytes, self.spill_bytes)
+        self.cond.notify_all()
+
+    def unspill(self):
+        """Move spilled items back into memory while they fit"""
+        while self.spill_items:
+            if self.max_items and len(self.items) >= self.max_items:
+                return
+            self.spill_file.seek(self.spill_read_pos)
+            size, samples, nbytes = SPILL_HEADER.unpack(self.spill_file.read(SPILL_HEADER.size))
+            if not self.has_room(samples, nbytes):
+                return
+            kind, item = pickle.loads(self.spill_file.read(size))
+            self.spill_read_pos += SPILL_HEADER.size + size
+            self.spill_items -= 1
+            self.spill_bytes -= SPILL_HEADER.size + size
+            self.push(kind, item, samples, nbytes)
+        # Fully drained: start the file over
+        if self.spill_read_pos:
+            self.spill_file.seek(0)
+            self.spill_file.truncate()
+            self.spill_read_pos = 0
+
+    # ------------------------------------------------------------------
+    # Consumer
+    # ------------------------------------------------------------------
+    def get(self, timeout=None):
+        """Remove and return the oldest (kind, item); raises queue.Empty after timeout"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: len(self) or self.closed, timeout):
+                raise queue.Empty
+            if not len(self):
+                raise queue.Empty
+            return self.take()
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+    def drain(self, max_items=None):
+        """Remove and return up to max_items queued (kind, item) pairs without waiting"""
+        entries = []
+        with self.cond:
+            while len(self) and (max_items is None or len(entries) < max_items):
+                entries.append(self.take())
+        return entries
+
+    def take(self):
+        if not self.items:
+            self.unspill()
+        kind, item, _, _ = self.pop()
+        if self.spill_items:
+            self.unspill()  # Refill the room just freed
+        self.cond.notify_all()
+        return kind, item
+
+    def clear(self):
+        with self.cond:
+            self.items.clear()
+            self.samples = self.bytes = 0
+            if self.spill_items:
+                self.spill_items = self.spill_bytes = 0
+                self.spill_file.seek(0)
+                self.spill_file.truncate()
+                self.spill_read_pos = 0
+            self.cond.notify_all()
+
+    def close(self):
+        """Wake blocked producers and consumers and delete the spill file"""
+        with self.cond:
+            self.closed = True
+            if self.spill_file is not None:
+                self.spill_file.close()
+                self.spill_file = None
+                self.spill_items = self.spill_bytes = 0
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                'policy': self.policy,
+                'items': len(self.items),
+                'samples': self.samples,
+                'bytes': self.bytes,
+                'high_items': self.high_items,
+                'high_samples': self.high_samples,
+                'high_bytes': self.high_bytes,
+                'put': self.put_count,
+                'dropped_items': self.dropped_items,
+                'dropped_samples': self.dropped_samples,
+                'spilled_items': self.spilled_items,
+                'spill_pending': self.spill_items,
+                'spill_bytes': self.spill_bytes,
+                'spill_high_bytes': self.spill_high_bytes,
+                'blocked_s': self.blocked_time,
+            }
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Session replay through the live acquisition pipeline
+
+ReplayPort stands in for the serial port: it re-encodes a recorded session
+(CSV from the logger/export, or an .icms session) as DATA: lines or binary
+frames and releases them on the recording's own device-time schedule, at real
+time, N times faster, or as fast as the pipeline can take them. Plugged into
+AcquisitionEngine.start(connection=...), the recording goes through the same
+decode -> parse -> buffer -> plot -> log path as a live device.
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from icm20948_binary import FRAME_SIZE, encode_frames, make_flags
+from icm20948_samples import AXIS_FIELDS, SAMPLE_DTYPE, format_data_lines
+from icm20948_session import Session, is_session_path, open_session
+
+TEXT_BYTES_PER_SAMPLE = 80  # Rough DATA: line length, used to size reads
+
+
+def load_csv_session(filename):
+    """Load a CSV log/export as a Session"""
+    values = np.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+    columns = {}
+    for column, name in enumerate(SAMPLE_DTYPE.names):
+        columns[name] = values[:, column].astype(SAMPLE_DTYPE[name])
+    return Session(filename, {'device_config': {}}, columns)
+
+
+def load_replay_source(filename):
+    """Open a recording for replay (.icms session or CSV)"""
+    if is_session_path(filename):
+        return open_session(filename)
+    return load_csv_session(filename)
+
+
+class ReplayPort:
+    """Serial-port lookalike that plays back a recorded session
+
+    speed is the playback rate relative to real time; 0 means as fast as the
+    reader takes the data. Playback waits for START like the firmware does,
+    unless autostart is set.
+    """
+
+    def __init__(self, session, speed=1.0, binary=False, loop=False, autostart=False,
+                 timeout=0.05):
+        self.session = session
+        self.speed = speed
+        self.binary = binary
+        self.loop = loop
+        self.timeout = timeout
+        self.write_timeout = 1.0
+        self.port = f"replay://{session.path}"
+        self.baudrate = 0
+        self.is_open = True
+
+        self.lock = threading.Lock()
+        self.pending = bytearray()       # Encoded bytes not yet read
+        self.position = 0                # Next sample to encode
+        self.streaming = autostart
+        self.play_start = None
+        self.schedule_start = 0.0
+        self.samples_sent = 0
+
+        # Replay clock in device milliseconds: gaps are kept, device resets
+        # (timestamps going backwards) are treated as no gap
+        timestamps = np.asarray(session['timestamp'], dtype=np.int64)
+        steps = np.clip(np.diff(timestamps), 0, None) if len(timestamps) > 1 else np.zeros(0, np.int64)
+        self.schedule = np.concatenate(([0], np.cumsum(steps)))
+
+        config = session.device_config
+        self.flags = make_flags(config.get('accel_range', 3), config.get('gyro_range', 3))
+        self.bytes_per_sample = FRAME_SIZE if binary else TEXT_BYTES_PER_SAMPLE
+
+    # ------------------------------------------------------------------
+    # Serial interface used by AcquisitionEngine
+    # ------------------------------------------------------------------
+    @property
+    def in_waiting(self):
+        with self.lock:
+            return len(self.pending) + (self.due() - self.position) * self.bytes_per_sample
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while self.is_open:
+            with self.lock:
+                if not self.pending:
+                    self.encode_due(size)
+                if self.pending:
+                    data = bytes(self.pending[:size])
+                    del self.pending[:size]
+                    return data
+                wait = self.time_to_next()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, wait))
+        return b''
+
+    def write(self, data):
+        for command in data.decode('utf-8', errors='ignore').split('\n'):
+            command = command.strip().upper()
+            if command:
+                self.handle_command(command)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self.lock:
+            del self.pending[:]
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    # ------------------------------------------------------------------
+    # Playback
+    # ------------------------------------------------------------------
+    def due(self):
+        """Number of samples whose replay time has been reached"""
+        if not self.streaming or self.play_start is None:
+            return self.position
+        if not self.speed:
+            return len(self.schedule)
+        elapsed_ms = (time.monotonic() - self.play_start) * 1000.0 * self.speed + self.schedule_start
+        return int(np.searchsorted(self.schedule, elapsed_ms, side='right'))
+
+    def time_to_next(self):
+        """Seconds until the next sample is due"""
+        if not self.streaming or self.position >= len(self.schedule) or not self.speed:
+            return self.timeout or 0.05
+        elapsed_ms = (time.monotonic() - self.play_start) * 1000.0 * self.speed + self.schedule_start
+        return max((self.schedule[self.position] - elapsed_ms) / 1000.0 / self.speed, 0.0005)
+
+    def encode_due(self, size):
+        """Encode the due samples (at most about `size` bytes) into pending"""
+        due = self.due()
+        if due <= self.position:
+            if self.streaming and self.position >= len(self.schedule):
+                self.finish()
+            return
+        stop = min(due, self.position + max(1, size // self.bytes_per_sample))
+        samples = self.session.to_array(self.position, stop)
+        if self.binary:
+            values = np.column_stack([samples[name] for name in AXIS_FIELDS])
+            seqs = np.arange(self.position, stop)
+            self.pending += encode_frames(seqs, samples['timestamp'], values, self.flags)
+        else:
+            self.pending += format_data_lines(samples).encode('ascii')
+        self.samples_sent += stop - self.position
+        self.position = stop
+
+    def finish(self):
+        """End of the recording: loop or stop streaming"""
+        if self.loop and len(self.schedule):
+            self.position = 0
+            self.play_start = time.monotonic()
+            self.schedule_start = 0.0
+            return
+        self.streaming = False
+        self.respond("Replay finished")
+        self.respond("Stopped streaming")
+
+    def respond(self, line):
+        self.pending += (line + '\r\n').encode('utf-8')
+
+    def handle_command(self, command):
+        with self.lock:
+            self.respond(f"DEBUG: Processing command: '{command}'")
+            if command == "START":
+                self.respond("DEBUG: START command received")
+                if self.position >= len(self.schedule):
+                    self.position = 0
+                self.streaming = True
+                # Resume from the current position
+                self.play_start = time.monotonic()
+                self.schedule_start = float(self.schedule[self.position]) if len(self.schedule) else 0.0
+                self.respond("Started streaming")
+            elif command == "STOP":
+                self.respond("DEBUG: STOP command received")
+                self.streaming = False
+                self.respond("Stopped streaming")
+            elif command == "CONFIG":
+                self.respond(self.config_line())
+            elif command.startswith("SET_FORMAT="):
+                self.binary = command.endswith("BIN")
+                self.bytes_per_sample = FRAME_SIZE if self.binary else TEXT_BYTES_PER_SAMPLE
+                self.respond(f"Data format set to {'BIN' if self.binary else 'TEXT'}")
+            else:
+                # Recorded data cannot be reconfigured
+                self.respond(f"Replay ignores command: {command}")
+
+    def config_line(self):
+        config = self.session.device_config
+        keys = [('ACCEL_RANGE', 'accel_range', 3), ('GYRO_RANGE', 'gyro_range', 3),
+                ('MAG_RATE', 'mag_rate', 2), ('SAMPLE_RATE', 'sample_rate', 100),
+                ('EN_ACCEL', 'enable_accel', 1), ('EN_GYRO', 'enable_gyro', 1),
+                ('EN_MAG', 'enable_mag', 1), ('EN_TEMP', 'enable_temp', 1)]
+        fields = [f"{key}={int(config.get(name, default))}" for key, name, default in keys]
+        fields.append(f"STREAMING={int(self.streaming)}")
+        fields.append(f"BINARY={int(self.binary)}")
+        return "CONFIG:" + ",".join(fields)
+
+
+def main():
+    from icm20948_engine import AcquisitionEngine
+
+    parser = argparse.ArgumentParser(description="Replay a recording through the acquisition pipeline")
+    parser.add_argument('recording', help="Session (.icms) or CSV log/export")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="Playback speed (1 = real time, 10 = 10x, 0 = as fast as possible)")
+    parser.add_argument('--binary', action='store_true', help="Replay as binary frames instead of DATA: lines")
+    parser.add_argument('--log', help="Log the replayed samples (.csv or .icms)")
+    args = parser.parse_args()
+
+    session = load_replay_source(args.recording)
+    print(f"Replaying {len(session)} samples from {args.recording}")
+
+    engine = AcquisitionEngine()
+    if args.log:
+        engine.set_log_file(args.log)
+        engine.log_enabled = True
+
+    port = ReplayPort(session, speed=args.speed, binary=args.binary)
+    engine.start(connection=port)
+    start_time = time.perf_counter()
+    engine.start_streaming()
+    try:
+        while engine.sample_count + engine.malformed_count < len(session) and engine.connected:
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    elapsed = time.perf_counter() - start_time
+    engine.stop()
+
+    print(f"Processed {engine.sample_count} samples in {elapsed:.3f} s "
+          f"({engine.sample_count / max(elapsed, 1e-9):.0f} samples/s), "
+          f"malformed: {engine.malformed_count}")
+
+
+if __name__ == "__main__":
+    main()
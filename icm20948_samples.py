@@ -0,0 +1,100 @@
+"""
+Sample record layout and batch parsing for ICM20948 DATA lines
+
+Samples travel through the pipeline as NumPy structured arrays with
+SAMPLE_DTYPE (one record per sample) instead of one nested dict per sample.
+"""
+
+import time
+
+import numpy as np
+
+# Sensor channels in the order the firmware sends them after the timestamp
+AXIS_FIELDS = ('accel_x', 'accel_y', 'accel_z',
+               'gyro_x', 'gyro_y', 'gyro_z',
+               'mag_x', 'mag_y', 'mag_z',
+               'temp')
+
+SAMPLE_DTYPE = np.dtype(
+    [('timestamp', np.int64),   # Device millis()
+     ('time', np.float64)] +    # Host time.time()
+    [(name, np.float32) for name in AXIS_FIELDS]
+)
+
+DATA_FIELD_COUNT = 1 + len(AXIS_FIELDS)  # timestamp + 10 channels
+
+CSV_HEADER = ['Timestamp', 'System_Time', 'Accel_X', 'Accel_Y', 'Accel_Z',
+              'Gyro_X', 'Gyro_Y', 'Gyro_Z', 'Mag_X', 'Mag_Y', 'Mag_Z', 'Temperature']
+
+# One CSV row per record, columns in SAMPLE_DTYPE order
+CSV_ROW_FORMAT = '%d,%.6f,' + ','.join(['%.7g'] * len(AXIS_FIELDS))
+
+# Firmware DATA: line (timestamp and channels, same precision as src/main.cpp)
+DATA_LINE_FORMAT = 'DATA:%d,' + ','.join(['%.3f'] * (len(AXIS_FIELDS) - 1)) + ',%.1f'
+
+
+def empty_samples(size=0):
+    """Return a zeroed sample array of the given length"""
+    return np.zeros(size, dtype=SAMPLE_DTYPE)
+
+
+def parse_data_line(line):
+    """Parse one DATA: line into a tuple of the 11 fields, or None if malformed"""
+    # Format: DATA:timestamp,ax,ay,az,gx,gy,gz,mx,my,mz,temp
+    try:
+        parts = line.split(':', 1)[1].split(',')
+        if len(parts) != DATA_FIELD_COUNT:
+            return None
+        return (int(parts[0]),) + tuple(float(part) for part in parts[1:])
+    except (IndexError, ValueError):
+        return None
+
+
+def parse_data_lines(lines, host_time=None):
+    """Parse a block of DATA: lines in one vectorized pass
+
+    Returns (samples, malformed) where samples is a SAMPLE_DTYPE array and
+    malformed is the number of lines that were skipped.
+    """
+    if host_time is None:
+        host_time = time.time()
+
+    # Cheap per-line screen in C: correct prefix and field count
+    payloads = [line[5:] for line in lines
+                if line.startswith('DATA:') and line.count(',') == DATA_FIELD_COUNT - 1]
+
+    values = None
+    if payloads:
+        try:
+            values = np.loadtxt(payloads, delimiter=',', dtype=np.float64,
+                                comments=None, ndmin=2)
+        except ValueError:
+            # A bad field somewhere in the block - isolate it line by line
+            rows = [row for row in map(parse_data_line, lines) if row is not None]
+            values = np.array(rows, dtype=np.float64).reshape(-1, DATA_FIELD_COUNT)
+
+    if values is None or len(values) == 0:
+        return empty_samples(), len(lines)
+
+    samples = np.empty(len(values), dtype=SAMPLE_DTYPE)
+    samples['timestamp'] = values[:, 0]
+    samples['time'] = host_time
+    for column, name in enumerate(AXIS_FIELDS, start=1):
+        samples[name] = values[:, column]
+
+    return samples, len(lines) - len(samples)
+
+
+def format_csv_rows(samples):
+    """Format a sample array as CSV text (no header), one line per sample"""
+    if len(samples) == 0:
+        return ''
+    return '\n'.join(CSV_ROW_FORMAT % row for row in samples.tolist()) + '\n'
+
+
+def format_data_lines(samples):
+    """Format a sample array as firmware DATA: lines (CRLF terminated)"""
+    if len(samples) == 0:
+        return ''
+    rows = np.column_stack([samples['timestamp']] + [samples[name] for name in AXIS_FIELDS])
+    return '\r\n'.join(DATA_LINE_FORMAT % tuple(row) for row in rows.tolist()) + '\r\n'
@@ -0,0 +1,322 @@
+"""
+Columnar session recordings (.icms)
+
+A session is a directory holding one raw little-endian file per sample field
+plus a JSON header:
+
+    capture.icms/
+        session.json      format version, column dtypes, device CONFIG, counts,
+                          sample loss counters
+        timestamp.bin     int64 device millis()
+        time.bin          float64 host time
+        accel_x.bin ...   float32 channels, one file per SAMPLE_DTYPE field
+        index.bin         sparse time index: (timestamp, sample offset) int64
+                          pairs, one every index_stride samples
+
+Samples are appended to every column file in chunks (one write per batch),
+so recording is cheap and loading a capture is a handful of np.fromfile
+calls instead of a CSV parse. open_session() memory-maps the columns instead,
+and the time index lets slice_time() jump to any device time by reading only
+the pages it needs. CSV remains available through export_csv().
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from icm20948_logger import BackgroundWriter
+from icm20948_loss import format_loss
+from icm20948_samples import CSV_HEADER, SAMPLE_DTYPE, format_csv_rows
+
+SESSION_SUFFIX = '.icms'
+SESSION_FORMAT = 'icm20948-session'
+SESSION_VERSION = 1
+HEADER_NAME = 'session.json'
+INDEX_NAME = 'index.bin'
+INDEX_STRIDE = 1024  # Samples between time index entries
+INDEX_DTYPE = np.dtype([('timestamp', '<i8'), ('offset', '<i8')])
+
+
+def is_session_path(path):
+    return str(path).lower().endswith(SESSION_SUFFIX)
+
+
+def column_path(path, name):
+    return os.path.join(path, name + '.bin')
+
+
+def read_header(path):
+    with open(os.path.join(path, HEADER_NAME)) as f:
+        header = json.load(f)
+    if header.get('format') != SESSION_FORMAT:
+        raise ValueError(f"{path} is not an ICM20948 session")
+    if header.get('version', 0) > SESSION_VERSION:
+        raise ValueError(f"Session version {header['version']} is newer than this reader")
+    return header
+
+
+def write_header(path, header):
+    # Write then rename so a crash never leaves a truncated header behind
+    temp_name = os.path.join(path, HEADER_NAME + '.tmp')
+    with open(temp_name, 'w') as f:
+        json.dump(header, f, indent=2)
+    os.replace(temp_name, os.path.join(path, HEADER_NAME))
+
+
+def create_session(path, device_config=None):
+    """Create an empty session directory (truncating an existing session at path)"""
+    os.makedirs(path, exist_ok=True)
+    header = {
+        'format': SESSION_FORMAT,
+        'version': SESSION_VERSION,
+        'created': time.time(),
+        'columns': {name: SAMPLE_DTYPE[name].str for name in SAMPLE_DTYPE.names},
+        'device_config': dict(device_config or {}),
+        'sample_count': 0,
+        'index_stride': INDEX_STRIDE,
+    }
+    for name in SAMPLE_DTYPE.names:
+        open(column_path(path, name), 'wb').close()
+    open(os.path.join(path, INDEX_NAME), 'wb').close()
+    write_header(path, header)
+    return header
+
+
+class SessionWriter(BackgroundWriter):
+    """Append sample batches to a session directory from a background thread
+
+    device_config is read again when the writer closes, so the header holds
+    the configuration the device reported last. loss, if given, is called at
+    close and its dict (icm20948_loss counters) is stored in the header.
+    """
+
+    def __init__(self, path, device_config=None, loss=None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.device_config = device_config
+        self.loss = loss
+        if not os.path.exists(os.path.join(path, HEADER_NAME)):
+            create_session(path, device_config)
+        self.header = read_header(path)
+        self.index_stride = self.header.get('index_stride', INDEX_STRIDE)
+        self.recover()
+        self.files = {name: open(column_path(path, name), 'ab') for name in SAMPLE_DTYPE.names}
+        self.index_file = open(os.path.join(path, INDEX_NAME), 'ab')
+        if self.threaded:
+            self.start()
+
+    def recover(self):
+        """Line the files up with the complete samples on disk before appending
+
+        sample_count in the header is only updated at close, so after a crash
+        the columns are the truth: all are cut to the shortest one and the
+        time index is rebuilt for that many samples.
+        """
+        count = session_length(self.path, self.header)
+        for name, dtype in self.header['columns'].items():
+            with open(column_path(self.path, name), 'r+b') as f:
+                f.truncate(count * np.dtype(dtype).itemsize)
+        dtype = np.dtype(self.header['columns']['timestamp'])
+        timestamps = np.zeros(0, dtype=dtype)
+        if count:
+            timestamps = np.memmap(column_path(self.path, 'timestamp'), dtype=dtype, mode='r', shape=(count,))
+        index = build_index(timestamps, self.header)
+        with open(os.path.join(self.path, INDEX_NAME), 'wb') as f:
+            f.write(index.tobytes())
+        self.header['sample_count'] = count
+
+    def write_batches(self, batches):
+        samples = batches[0] if len(batches) == 1 else np.concatenate(batches)
+        written = 0
+        # One contiguous write per column per chunk
+        for name, f in self.files.items():
+            column = np.ascontiguousarray(samples[name])
+            f.write(column.tobytes())
+            written += column.nbytes
+
+        # Index every sample whose offset is a multiple of the stride
+        offset = self.header['sample_count']
+        stride = self.index_stride
+        first = -(-offset // stride) * stride
+        offsets = np.arange(first, offset + len(samples), stride, dtype=np.int64)
+        if len(offsets):
+            entries = np.empty(len(offsets), dtype=INDEX_DTYPE)
+            entries['offset'] = offsets
+            entries['timestamp'] = samples['timestamp'][offsets - offset]
+            self.index_file.write(entries.tobytes())
+            written += entries.nbytes
+
+        self.header['sample_count'] += len(samples)
+        return written
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+        self.index_file.flush()
+
+    def close_files(self):
+        for f in self.files.values():
+            f.close()
+        self.index_file.close()
+        if self.device_config:
+            self.header['device_config'] = dict(self.device_config)
+        if self.loss:
+            self.header['loss'] = self.loss()
+        self.header['closed'] = time.time()
+        write_header(self.path, self.header)
+
+
+class Session:
+    """A session's column arrays (in memory or memory-mapped) plus its header
+
+    Time lookups use the device timestamp (milliseconds) and assume it
+    increases through the session.
+    """
+
+    def __init__(self, path, header, columns, index=None):
+        self.path = path
+        self.header = header
+        self.columns = columns
+        self.index = build_index(columns['timestamp'], header) if index is None else index
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def device_config(self):
+        return self.header.get('device_config', {})
+
+    @property
+    def loss(self):
+        """Loss counters recorded while the session was logged (empty if none)"""
+        return self.header.get('loss', {})
+
+    def to_array(self, start=0, stop=None):
+        """Copy samples [start:stop] into one SAMPLE_DTYPE array"""
+        window = self.slice(start, stop)
+        samples = np.empty(len(window['timestamp']), dtype=SAMPLE_DTYPE)
+        for name in SAMPLE_DTYPE.names:
+            samples[name] = window[name]
+        return samples
+
+    def slice(self, start=0, stop=None):
+        """Column views of samples [start:stop] (no copy)"""
+        return {name: column[start:stop] for name, column in self.columns.items()}
+
+    def index_of(self, timestamp):
+        """Offset of the first sample at or after the given device time (ms)"""
+        timestamps = self.columns['timestamp']
+        index = self.index
+        # Narrow to one stride using the sparse index, then search only that block
+        block = np.searchsorted(index['timestamp'], timestamp, side='left')
+        lo = int(index['offset'][block - 1]) if block > 0 else 0
+        hi = int(index['offset'][block]) if block < len(index) else len(timestamps)
+        return lo + int(np.searchsorted(timestamps[lo:hi], timestamp, side='left'))
+
+    def slice_time(self, t0, t1):
+        """Column views of the samples with t0 <= timestamp < t1 (device ms, no copy)"""
+        return self.slice(self.index_of(t0), self.index_of(t1))
+
+
+def session_length(path, header):
+    """Complete samples on disk (the shortest column wins after a crash mid-write)"""
+    return min(os.path.getsize(column_path(path, name)) // np.dtype(dtype).itemsize
+               for name, dtype in header['columns'].items())
+
+
+def build_index(timestamps, header):
+    """Sparse time index computed from the timestamp column"""
+    stride = header.get('index_stride', INDEX_STRIDE)
+    index = np.empty((len(timestamps) + stride - 1) // stride, dtype=INDEX_DTYPE)
+    index['offset'] = np.arange(len(index), dtype=np.int64) * stride
+    index['timestamp'] = timestamps[::stride]
+    return index
+
+
+def read_index(path, header, count):
+    """Read index.bin, dropping entries past the complete samples; None if absent"""
+    index_name = os.path.join(path, INDEX_NAME)
+    if not os.path.exists(index_name):
+        return None
+    index = np.fromfile(index_name, dtype=INDEX_DTYPE)
+    expected = (count + header.get('index_stride', INDEX_STRIDE) - 1) // header.get('index_stride', INDEX_STRIDE)
+    if len(index) < expected:
+        return None  # Incomplete (e.g. written by an older version) - rebuild instead
+    return index[:expected]
+
+
+def load_session(path):
+    """Load a whole session into memory"""
+    header = read_header(path)
+    count = session_length(path, header)
+    columns = {name: np.fromfile(column_path(path, name), dtype=np.dtype(dtype), count=count)
+               for name, dtype in header['columns'].items()}
+    return Session(path, header, columns, read_index(path, header, count))
+
+
+def open_session(path):
+    """Open a session with memory-mapped columns
+
+    Nothing is read until it is accessed, so opening and slicing a
+    multi-GB recording touches only the pages that are used.
+    """
+    header = read_header(path)
+    count = session_length(path, header)
+    columns = {}
+    for name, dtype in header['columns'].items():
+        dtype = np.dtype(dtype)
+        if count:
+            columns[name] = np.memmap(column_path(path, name), dtype=dtype, mode='r', shape=(count,))
+        else:
+            columns[name] = np.zeros(0, dtype=dtype)
+    return Session(path, header, columns, read_index(path, header, count))
+
+
+def write_session(path, samples, device_config=None):
+    """Write a SAMPLE_DTYPE array as a new session in one go"""
+    create_session(path, device_config)
+    writer = SessionWriter(path, device_config)
+    writer.write(samples)
+    writer.close()
+    if writer.error:
+        raise writer.error
+
+
+def export_csv(path, csv_filename, chunk_size=100000):
+    """Export a session to CSV in chunks"""
+    session = open_session(path)
+    with open(csv_filename, 'w', newline='') as f:
+        f.write(','.join(CSV_HEADER) + '\n')
+        for start in range(0, len(session), chunk_size):
+            f.write(format_csv_rows(session.to_array(start, start + chunk_size)))
+    return len(session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or export an ICM20948 session")
+    parser.add_argument('session', help="Session directory (.icms)")
+    parser.add_argument('--csv', help="Export the session to this CSV file")
+    args = parser.parse_args()
+
+    session = open_session(args.session)
+    print(f"{args.session}: {len(session)} samples")
+    if len(session):
+        duration = (session['timestamp'][-1] - session['timestamp'][0]) / 1000.0
+        print(f"Device time span: {duration:.3f} s")
+    print(f"Device config: {session.device_config}")
+    if session.loss:
+        print(f"Loss: {format_loss(session.loss)}")
+
+    if args.csv:
+        count = export_csv(args.session, args.csv)
+        print(f"Exported {count} samples to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
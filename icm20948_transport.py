@@ -0,0 +1,278 @@
+"""
+Transports for the ESP32 link: USB serial, TCP sockets, Bluetooth RFCOMM and ptys
+
+Every transport has the same port-like interface, so the acquisition
+engine does not care how the bytes arrive. read(size) waits at most `timeout`
+for the first byte and then returns everything already available (up to
+size) without waiting for more. open_transport() picks the transport from
+the port string:
+
+    COM3, /dev/ttyUSB0, rfc2217://...   SerialTransport (pyserial serial_for_url)
+    socket://localhost:9090              SocketTransport (e.g. esp32_simulator.py)
+    rfcomm://AA:BB:CC:DD:EE:FF[/channel] RfcommTransport (Linux, no virtual COM port)
+    pty:///dev/pts/5                     PtyTransport (pseudo-terminal, e.g. simulator --pty)
+"""
+
+import errno
+import os
+import select
+import socket
+import struct
+
+import serial
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # Windows
+    fcntl = termios = None
+
+
+def bytes_available(fd):
+    """Bytes readable without blocking on fd (FIONREAD), or None if unsupported"""
+    if fcntl is None:
+        return None
+    try:
+        buf = fcntl.ioctl(fd, termios.FIONREAD, b'\0\0\0\0')
+    except OSError:
+        return None
+    return struct.unpack('i', buf)[0]
+
+
+class Transport:
+    """Port-like base class; subclasses implement the raw I/O
+
+    resets_on_open tells the engine whether opening the link reboots the
+    ESP32 (USB serial DTR/RTS), i.e. whether to wait for it to settle.
+    """
+
+    resets_on_open = False
+
+    def __init__(self, port, timeout=0.05, write_timeout=2.0):
+        self.port = port
+        self.baudrate = None
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+
+    @property
+    def is_open(self):
+        raise NotImplementedError
+
+    @property
+    def in_waiting(self):
+        raise NotImplementedError
+
+    def read(self, size=1):
+        raise NotImplementedError
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        """Discard everything already received"""
+        while self.in_waiting:
+            if not self.read(65536):
+                break
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        raise NotImplementedError
+
+
+class SerialTransport(Transport):
+    """USB/UART serial port (or any pyserial URL) with bulk reads"""
+
+    resets_on_open = True
+
+    def __init__(self, port, baudrate=115200, timeout=0.05, write_timeout=2.0):
+        super().__init__(port, timeout, write_timeout)
+        self.baudrate = baudrate
+        self.serial = serial.serial_for_url(port, baudrate=baudrate, timeout=timeout,
+                                            write_timeout=write_timeout, bytesize=8,
+                                            parity='N', stopbits=1)
+        # Only a real serial port toggles DTR/RTS and reboots the ESP32
+        self.resets_on_open = '://' not in port
+
+    @property
+    def is_open(self):
+        return self.serial.is_open
+
+    @property
+    def in_waiting(self):
+        return self.serial.in_waiting
+
+    def read(self, size=1):
+        # Block (up to timeout) for the first byte only, then take what has arrived
+        data = self.serial.read(min(max(self.serial.in_waiting, 1), size))
+        if data and len(data) < size:
+            waiting = self.serial.in_waiting
+            if waiting:
+                data += self.serial.read(min(waiting, size - len(data)))
+        return data
+
+    def write(self, data):
+        self.serial.write_timeout = self.write_timeout
+        return self.serial.write(data)
+
+    def flush(self):
+        self.serial.flush()
+
+    def reset_input_buffer(self):
+        self.serial.reset_input_buffer()
+
+    def reset_output_buffer(self):
+        self.serial.reset_output_buffer()
+
+    def close(self):
+        self.serial.close()
+
+
+class SocketTransport(Transport):
+    """TCP stream (socket://host:port), e.g. the ESP32 simulator or a serial server"""
+
+    def __init__(self, port, address, family=socket.AF_INET, proto=0, timeout=0.05,
+                 write_timeout=2.0, connect_timeout=10.0):
+        super().__init__(port, timeout, write_timeout)
+        self.sock = socket.socket(family, socket.SOCK_STREAM, proto)
+        try:
+            self.sock.settimeout(connect_timeout)
+            self.sock.connect(address)
+            if family in (socket.AF_INET, socket.AF_INET6):
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sock.settimeout(write_timeout)
+        except Exception:
+            self.sock.close()
+            raise
+        self._open = True
+
+    @property
+    def is_open(self):
+        return self._open
+
+    @property
+    def in_waiting(self):
+        if not self._open:
+            return 0
+        available = bytes_available(self.sock.fileno())
+        if available is not None:
+            return available
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return 1 if readable else 0
+
+    def read(self, size=1):
+        if not self._open:
+            raise serial.SerialException("Connection is closed")
+        readable, _, _ = select.select([self.sock], [], [], self.timeout or 0)
+        if not readable:
+            return b''
+        data = self.sock.recv(size)
+        if not data:
+            self._open = False
+            raise serial.SerialException("Connection closed by peer")
+        return data
+
+    def write(self, data):
+        self.sock.settimeout(self.write_timeout)
+        try:
+            self.sock.sendall(data)
+        except socket.timeout:
+            raise serial.SerialTimeoutException("Write timeout")
+        return len(data)
+
+    def close(self):
+        if self._open:
+            self._open = False
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.sock.close()
+
+
+class RfcommTransport(SocketTransport):
+    """Bluetooth SPP over a native RFCOMM socket (Linux), bypassing the virtual COM port"""
+
+    def __init__(self, port, address, channel=1, **kwargs):
+        if not hasattr(socket, 'AF_BLUETOOTH') or not hasattr(socket, 'BTPROTO_RFCOMM'):
+            raise serial.SerialException("RFCOMM sockets are not supported on this platform")
+        super().__init__(port, (address, channel), socket.AF_BLUETOOTH, socket.BTPROTO_RFCOMM, **kwargs)
+
+
+class PtyTransport(Transport):
+    """Pseudo-terminal opened directly (raw mode, bulk os.read)"""
+
+    def __init__(self, port, path, timeout=0.05, write_timeout=2.0):
+        super().__init__(port, timeout, write_timeout)
+        if termios is None:
+            raise serial.SerialException("Pseudo-terminals are not supported on this platform")
+        import tty
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            tty.setraw(self.fd)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    @property
+    def is_open(self):
+        return self.fd is not None
+
+    @property
+    def in_waiting(self):
+        if self.fd is None:
+            return 0
+        return bytes_available(self.fd) or 0
+
+    def read(self, size=1):
+        if self.fd is None:
+            raise serial.SerialException("Pseudo-terminal is closed")
+        readable, _, _ = select.select([self.fd], [], [], self.timeout or 0)
+        if not readable:
+            return b''
+        try:
+            return os.read(self.fd, size)
+        except BlockingIOError:
+            return b''
+        except OSError as e:
+            if e.errno == errno.EIO:
+                # Other side of the pty went away
+                raise serial.SerialException("Pseudo-terminal closed by peer")
+            raise
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            _, writable, _ = select.select([], [self.fd], [], self.write_timeout)
+            if not writable:
+                raise serial.SerialTimeoutException("Write timeout")
+            view = view[os.write(self.fd, view):]
+        return len(data)
+
+    def reset_input_buffer(self):
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def open_transport(port, baudrate=115200, timeout=0.05, write_timeout=2.0):
+    """Open the transport for a port name or URL (see module docstring)"""
+    if port.startswith('socket://'):
+        host, _, tcp_port = port[len('socket://'):].rstrip('/').rpartition(':')
+        if not host or not tcp_port.isdigit():
+            raise ValueError(f"Expected socket://host:port, got {port}")
+        return SocketTransport(port, (host, int(tcp_port)), timeout=timeout, write_timeout=write_timeout)
+    if port.startswith('rfcomm://'):
+        address, _, channel = port[len('rfcomm://'):].partition('/')
+        return RfcommTransport(port, address, int(channel or 1), timeout=timeout,
+                               write_timeout=write_timeout)
+    if port.startswith('pty://'):
+        return PtyTransport(port, port[len('pty://'):], timeout=timeout, write_timeout=write_timeout)
+    return SerialTransport(port, baudrate, timeout=timeout, write_timeout=write_timeout)
@@ -19,8 +19,26 @@ struct ICMConfig {
   bool enable_mag = true;
   bool enable_temp = true;
   bool streaming = false;
+  bool binary_format = false; // SET_FORMAT=BIN sends packed frames instead of DATA: lines
 } config;
 
+// Binary sample frame (SET_FORMAT=BIN), little-endian, 31 bytes:
+// sync 0xA5 0x5A, uint16 sequence, uint32 millis, uint8 flags
+// (bits 0-1 accel range, 2-3 gyro range, 4-7 accel/gyro/mag/temp enabled),
+// int16 accel xyz / gyro xyz (sensor LSBs at the current range),
+// int16 mag xyz (0.15 uT/LSB), int16 temp (0.01 C), CRC-16/CCITT-FALSE over
+// everything after the sync marker.
+struct __attribute__((packed)) BinaryFrame {
+  uint8_t sync[2];
+  uint16_t seq;
+  uint32_t timestamp;
+  uint8_t flags;
+  int16_t values[10];
+  uint16_t crc;
+};
+
+uint16_t frameSequence = 0;
+
 unsigned long lastSampleTime = 0;
 unsigned long sampleInterval = 10; // Default 100Hz (10ms interval)
 
@@ -55,6 +73,65 @@ void scanI2C() {
   SerialBT.println(result);
 }
 
+uint16_t crc16(const uint8_t *data, size_t length) {
+  uint16_t crc = 0xFFFF;
+  while (length--) {
+    crc ^= (uint16_t)(*data++) << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+int16_t toLsb(float value, float lsb) {
+  float scaled = value / lsb;
+  if (scaled > 32767.0f) return 32767;
+  if (scaled < -32768.0f) return -32768;
+  return (int16_t)lroundf(scaled);
+}
+
+void sendBinaryFrame(sensors_event_t &accel, sensors_event_t &gyro,
+                     sensors_event_t &mag, sensors_event_t &temp) {
+  const float accelLsb = 9.80665f * (2 << config.accel_range) / 32768.0f;  // m/s^2
+  const float gyroLsb = (250 << config.gyro_range) * DEG_TO_RAD / 32768.0f; // rad/s
+
+  BinaryFrame frame;
+  frame.sync[0] = 0xA5;
+  frame.sync[1] = 0x5A;
+  frame.seq = frameSequence++;
+  frame.timestamp = millis();
+  frame.flags = (config.accel_range & 3) | (config.gyro_range & 3) << 2 |
+                config.enable_accel << 4 | config.enable_gyro << 5 |
+                config.enable_mag << 6 | config.enable_temp << 7;
+
+  memset(frame.values, 0, sizeof(frame.values));
+  if (config.enable_accel) {
+    frame.values[0] = toLsb(accel.acceleration.x, accelLsb);
+    frame.values[1] = toLsb(accel.acceleration.y, accelLsb);
+    frame.values[2] = toLsb(accel.acceleration.z, accelLsb);
+  }
+  if (config.enable_gyro) {
+    frame.values[3] = toLsb(gyro.gyro.x, gyroLsb);
+    frame.values[4] = toLsb(gyro.gyro.y, gyroLsb);
+    frame.values[5] = toLsb(gyro.gyro.z, gyroLsb);
+  }
+  if (config.enable_mag) {
+    frame.values[6] = toLsb(mag.magnetic.x, 0.15f);
+    frame.values[7] = toLsb(mag.magnetic.y, 0.15f);
+    frame.values[8] = toLsb(mag.magnetic.z, 0.15f);
+  }
+  if (config.enable_temp) {
+    frame.values[9] = toLsb(temp.temperature, 0.01f);
+  }
+
+  const uint8_t *bytes = (const uint8_t *)&frame;
+  frame.crc = crc16(bytes + 2, sizeof(frame) - 4);
+
+  Serial.write(bytes, sizeof(frame));
+  SerialBT.write(bytes, sizeof(frame));
+}
+
 // Apply configuration to sensor
 void applyConfiguration() {
   Serial.println("Applying configuration...");
@@ -87,12 +164,53 @@ void sendConfiguration() {
   cfg += "EN_GYRO=" + String(config.enable_gyro) + ",";
   cfg += "EN_MAG=" + String(config.enable_mag) + ",";
   cfg += "EN_TEMP=" + String(config.enable_temp) + ",";
-  cfg += "STREAMING=" + String(config.streaming);
+  cfg += "STREAMING=" + String(config.streaming) + ",";
+  cfg += "BINARY=" + String(config.binary_format);
   
   Serial.println(cfg);
   SerialBT.println(cfg);
 }
 
+// Batched configuration: SET_CONFIG=ACCEL_RANGE=3,GYRO_RANGE=3,SAMPLE_RATE=500
+// Every field is validated before anything changes, then all of them are
+// applied together, so the sensor never runs with a mix of old and new
+// settings. Fields use the CONFIG names; omitted fields keep their values.
+void setConfiguration(String fields) {
+  ICMConfig next = config;
+  int start = 0;
+  while (start < (int)fields.length()) {
+    int end = fields.indexOf(',', start);
+    if (end < 0) end = fields.length();
+    String field = fields.substring(start, end);
+    start = end + 1;
+
+    int eq = field.indexOf('=');
+    String key = eq > 0 ? field.substring(0, eq) : field;
+    String text = eq > 0 ? field.substring(eq + 1) : "";
+    int value = text.toInt();
+    bool valid = text.length() > 0;
+    bool flag = text == "0" || text == "1";  // EN_* fields take 0 or 1 only
+
+    if (key == "ACCEL_RANGE" && valid && value >= 0 && value <= 3) next.accel_range = value;
+    else if (key == "GYRO_RANGE" && valid && value >= 0 && value <= 3) next.gyro_range = value;
+    else if (key == "MAG_RATE" && valid && value >= 0 && value <= 8) next.mag_data_rate = value;
+    else if (key == "SAMPLE_RATE" && valid && value >= 1 && value <= 1000) next.sample_rate = value;
+    else if (key == "EN_ACCEL" && flag) next.enable_accel = value == 1;
+    else if (key == "EN_GYRO" && flag) next.enable_gyro = value == 1;
+    else if (key == "EN_MAG" && flag) next.enable_mag = value == 1;
+    else if (key == "EN_TEMP" && flag) next.enable_temp = value == 1;
+    else {
+      Serial.println("Invalid configuration: " + field);
+      SerialBT.println("Invalid configuration: " + field);
+      return;
+    }
+  }
+
+  config = next;
+  applyConfiguration();
+  sendConfiguration();
+}
+
 // Process incoming commands
 void processCommand(String command) {
   command.trim();
@@ -168,6 +286,22 @@ void processCommand(String command) {
     Serial.println("Temperature " + String(config.enable_temp ? "enabled" : "disabled"));
     SerialBT.println("Temperature " + String(config.enable_temp ? "enabled" : "disabled"));
   }
+  else if (command.startsWith("SET_CONFIG=")) {
+    setConfiguration(command.substring(11));
+  }
+  else if (command.startsWith("SET_FORMAT=")) {
+    String format = command.substring(11);
+    if (format == "BIN" || format == "TEXT") {
+      config.binary_format = (format == "BIN");
+      frameSequence = 0;
+      Serial.println("Data format set to " + format);
+      SerialBT.println("Data format set to " + format);
+    }
+    else {
+      Serial.println("Invalid configuration: FORMAT=" + format);
+      SerialBT.println("Invalid configuration: FORMAT=" + format);
+    }
+  }
   else if (command == "HELP") {
     Serial.println("Available commands:");
     Serial.println("  SCAN - Scan I2C bus");
@@ -182,12 +316,16 @@ void processCommand(String command) {
     Serial.println("  ENABLE_GYRO=<0/1> - Enable/disable gyroscope");
     Serial.println("  ENABLE_MAG=<0/1> - Enable/disable magnetometer");
     Serial.println("  ENABLE_TEMP=<0/1> - Enable/disable temperature");
+    Serial.println("  SET_CONFIG=<KEY=VALUE,...> - Apply several settings at once");
+    Serial.println("    (keys as in CONFIG: ACCEL_RANGE, GYRO_RANGE, MAG_RATE, SAMPLE_RATE, EN_*)");
+    Serial.println("  SET_FORMAT=<BIN/TEXT> - Binary frames or DATA: text lines");
     Serial.println("  HELP - Show this help");
     
     SerialBT.println("Available commands:");
     SerialBT.println("  SCAN, CONFIG, START, STOP, SET_ACCEL_RANGE=<0-3>");
     SerialBT.println("  SET_GYRO_RANGE=<0-3>, SET_MAG_RATE=<0-8>");
     SerialBT.println("  SET_SAMPLE_RATE=<1-1000>, ENABLE_ACCEL/GYRO/MAG/TEMP=<0/1>");
+    SerialBT.println("  SET_CONFIG=<KEY=VALUE,...>, SET_FORMAT=<BIN/TEXT>");
     SerialBT.println("  HELP - Show help");
   }
   else {
@@ -248,8 +386,9 @@ void loop() {
   // Always yield to prevent watchdog issues
   yield();
   
-  // Check for commands from Serial
-  while (Serial.available()) {
+  // Check for commands from Serial (one command per pass, so commands
+  // sent back to back are not merged into one string)
+  while (!stringComplete && Serial.available()) {
     char inChar = (char)Serial.read();
     inputString += inChar;
     if (inChar == '\n') {
@@ -258,7 +397,7 @@ void loop() {
   }
   
   // Check for commands from Bluetooth
-  while (SerialBT.available()) {
+  while (!stringComplete && SerialBT.available()) {
     char inChar = (char)SerialBT.read();
     inputString += inChar;
     if (inChar == '\n') {
@@ -288,43 +427,47 @@ void loop() {
     // Try to get sensor data quickly
     icm.getEvent(&accel, &gyro, &temp, &mag);
     
-    // Build data string efficiently
-    String dataString = "DATA:";
-    dataString += String(millis()) + ",";
-    
-    if (config.enable_accel) {
-      dataString += String(accel.acceleration.x, 3) + ",";  // Reduced precision for speed
-      dataString += String(accel.acceleration.y, 3) + ",";
-      dataString += String(accel.acceleration.z, 3) + ",";
+    if (config.binary_format) {
+      sendBinaryFrame(accel, gyro, mag, temp);
     } else {
-      dataString += "0,0,0,";
-    }
+      // Build data string efficiently
+      String dataString = "DATA:";
+      dataString += String(millis()) + ",";
     
-    if (config.enable_gyro) {
-      dataString += String(gyro.gyro.x, 3) + ",";
-      dataString += String(gyro.gyro.y, 3) + ",";
-      dataString += String(gyro.gyro.z, 3) + ",";
-    } else {
-      dataString += "0,0,0,";
-    }
+      if (config.enable_accel) {
+        dataString += String(accel.acceleration.x, 3) + ",";  // Reduced precision for speed
+        dataString += String(accel.acceleration.y, 3) + ",";
+        dataString += String(accel.acceleration.z, 3) + ",";
+      } else {
+        dataString += "0,0,0,";
+      }
     
-    if (config.enable_mag) {
-      dataString += String(mag.magnetic.x, 3) + ",";
-      dataString += String(mag.magnetic.y, 3) + ",";
-      dataString += String(mag.magnetic.z, 3) + ",";
-    } else {
-      dataString += "0,0,0,";
-    }
+      if (config.enable_gyro) {
+        dataString += String(gyro.gyro.x, 3) + ",";
+        dataString += String(gyro.gyro.y, 3) + ",";
+        dataString += String(gyro.gyro.z, 3) + ",";
+      } else {
+        dataString += "0,0,0,";
+      }
     
-    if (config.enable_temp) {
-      dataString += String(temp.temperature, 1);
-    } else {
-      dataString += "0";
-    }
+      if (config.enable_mag) {
+        dataString += String(mag.magnetic.x, 3) + ",";
+        dataString += String(mag.magnetic.y, 3) + ",";
+        dataString += String(mag.magnetic.z, 3) + ",";
+      } else {
+        dataString += "0,0,0,";
+      }
     
-    // Send data quickly without waiting
-    Serial.println(dataString);
-    SerialBT.println(dataString);
+      if (config.enable_temp) {
+        dataString += String(temp.temperature, 1);
+      } else {
+        dataString += "0";
+      }
+    
+      // Send data quickly without waiting
+      Serial.println(dataString);
+      SerialBT.println(dataString);
+    }
   }
   
   // Small delay and yield to prevent blocking
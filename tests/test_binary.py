@@ -0,0 +1,70 @@
+"""StreamDecoder: binary frames, text lines and damage between them"""
+
+import numpy as np
+
+from icm20948_binary import FRAME_SIZE, StreamDecoder, encode_frames, make_flags
+
+FLAGS = make_flags(1, 2)
+
+
+def frames(seqs, first_timestamp=1000):
+    seqs = np.asarray(seqs)
+    values = np.column_stack([np.linspace(-1, 1, len(seqs))] * 9 + [np.full(len(seqs), 25.0)])
+    return encode_frames(seqs, first_timestamp + np.arange(len(seqs)), values, FLAGS)
+
+
+def decode(decoder, chunks):
+    lines, samples = [], []
+    for chunk in chunks:
+        new_lines, new_samples = decoder.feed(chunk, host_time=0.0)
+        lines.extend(new_lines)
+        samples.append(new_samples)
+    return lines, np.concatenate(samples)
+
+
+def test_frames_split_across_reads():
+    data = frames(range(50))
+    # Cut at every awkward place: inside the sync marker, the header, the CRC
+    cuts = [1, 5, FRAME_SIZE - 1, FRAME_SIZE + 2, 400, 401, len(data) - 3]
+    chunks = [data[a:b] for a, b in zip([0] + cuts, cuts + [len(data)])]
+    decoder = StreamDecoder()
+    lines, samples = decode(decoder, chunks)
+    assert lines == []
+    assert samples['timestamp'].tolist() == list(range(1000, 1050))
+    assert decoder.sequence_gaps == decoder.crc_errors == 0
+
+
+def test_corrupt_frame_is_counted_and_skipped():
+    data = bytearray(frames(range(20)))
+    data[5 * FRAME_SIZE + 12] ^= 0xFF  # Inside frame 5's payload
+    decoder = StreamDecoder()
+    lines, samples = decode(decoder, [bytes(data)])
+    assert lines == []
+    assert len(samples) == 19
+    assert decoder.crc_errors == 1
+    assert decoder.sequence_gaps == 1
+
+
+def test_text_lines_between_frames():
+    data = (b"Started streaming\r\n" + frames(range(10))
+            + b"DEBUG: Processing command: 'CONFIG'\r\n" + frames(range(10, 20), 1010))
+    decoder = StreamDecoder()
+    lines, samples = decode(decoder, [data[i:i + 7] for i in range(0, len(data), 7)])
+    assert lines == ["Started streaming", "DEBUG: Processing command: 'CONFIG'"]
+    assert len(samples) == 20
+    assert decoder.sequence_gaps == decoder.crc_errors == decoder.discarded_bytes == 0
+
+
+def test_damaged_text_line_drops_only_that_line():
+    data = b"first\r\nsec\xa5ond\r\nthird\r\n" + frames(range(3))
+    decoder = StreamDecoder()
+    lines, samples = decode(decoder, [data])
+    assert lines == ["first", "third"]
+    assert len(samples) == 3
+
+
+def test_sequence_gaps_and_wrap():
+    decoder = StreamDecoder()
+    decode(decoder, [frames([65533, 65534, 65535, 0, 1, 3, 3])])
+    assert decoder.sequence_gaps == 1
+    assert decoder.sequence_duplicates == 1
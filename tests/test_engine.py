@@ -0,0 +1,104 @@
+"""AcquisitionEngine against an in-memory port (no hardware)"""
+
+import queue
+import time
+
+import numpy as np
+import pytest
+
+from icm20948_binary import encode_frames, make_flags
+from icm20948_engine import AcquisitionEngine
+
+
+class FakePort:
+    """Transport stand-in: read() returns the chunks put into `incoming`"""
+
+    resets_on_open = False
+
+    def __init__(self):
+        self.incoming = queue.Queue()
+        self.written = queue.Queue()
+        self.is_open = True
+
+    def read(self, size=1):
+        try:
+            return self.incoming.get(timeout=0.01)
+        except queue.Empty:
+            return b''
+
+    def write(self, data):
+        self.written.put(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def frames(first_seq, first_timestamp, count):
+    seqs = np.arange(first_seq, first_seq + count)
+    timestamps = first_timestamp + np.arange(count)
+    return encode_frames(seqs, timestamps, np.zeros((count, 10)), make_flags(0, 0))
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def engine():
+    engine = AcquisitionEngine('fake')
+    engine.serial_connection = FakePort()
+    engine._start_threads()
+    yield engine
+    engine.stop()
+
+
+def acknowledge(engine, command, response):
+    sent = engine.serial_connection.written.get(timeout=2.0)
+    assert sent == (command + '\r\n').encode()
+    engine.serial_connection.incoming.put(
+        f"DEBUG: Processing command: '{command}'\n{response}\n".encode())
+
+
+def test_set_format_ack_restarts_frame_sequence(engine):
+    port = engine.serial_connection
+    port.incoming.put(frames(40000, 1000, 10))
+    wait_for(lambda: engine.decoder.last_seq == 40009)
+
+    # The firmware starts again at sequence 0 after SET_FORMAT
+    future = engine.set_binary_format(True)
+    acknowledge(engine, 'SET_FORMAT=BIN', 'Data format set to BIN')
+    future.result(timeout=2.0)
+    port.incoming.put(frames(0, 1010, 10))
+    wait_for(lambda: engine.decoder.last_seq == 9)
+
+    stats = engine.loss.snapshot()
+    assert stats['received'] == 20
+    assert stats['lost'] == 0
+    assert engine.decoder.sequence_gaps == 0
+
+
+def test_acknowledged_commands_update_desired_config(engine):
+    future = engine.configure(sample_rate=500)[0]
+    acknowledge(engine, 'SET_SAMPLE_RATE=500', 'Sample rate set to 500 Hz')
+    future.result(timeout=2.0)
+
+    future = engine.apply_config(accel_range=2, enable_mag=0)
+    acknowledge(engine, 'SET_CONFIG=ACCEL_RANGE=2,EN_MAG=0',
+                'CONFIG:ACCEL_RANGE=2,GYRO_RANGE=0,MAG_RATE=2,SAMPLE_RATE=500,'
+                'EN_ACCEL=1,EN_GYRO=1,EN_MAG=0,EN_TEMP=1,STREAMING=0,BINARY=0')
+    future.result(timeout=2.0)
+
+    # A rejected command leaves the desired configuration alone
+    future = engine.configure(gyro_range=3)[0]
+    acknowledge(engine, 'SET_GYRO_RANGE=3', 'Invalid configuration: GYRO_RANGE')
+    with pytest.raises(Exception):
+        future.result(timeout=2.0)
+
+    wait_for(lambda: engine.desired_config.get('accel_range') == 2)
+    assert engine.desired_config == {'sample_rate': 500, 'accel_range': 2, 'enable_mag': 0}
@@ -0,0 +1,91 @@
+"""LossTracker accounting for DATA timestamps and binary frames"""
+
+import numpy as np
+
+from icm20948_loss import LossTracker
+
+
+def feed(tracker, timestamps, batch=37, sample_rate=200):
+    for start in range(0, len(timestamps), batch):
+        tracker.check_timestamps(timestamps[start:start + batch], sample_rate=sample_rate)
+
+
+def test_steady_stream_is_complete():
+    tracker = LossTracker()
+    feed(tracker, 1000 + 5 * np.arange(2000))
+    stats = tracker.snapshot()
+    assert stats['received'] == 2000
+    assert stats['complete']
+
+
+def test_dropped_samples_are_counted():
+    tracker = LossTracker()
+    timestamps = np.delete(1000 + 5 * np.arange(2000), [100, 500, 501, 502, 1500])
+    feed(tracker, timestamps)
+    stats = tracker.snapshot()
+    assert stats['lost'] == 5
+    assert stats['duplicates'] == 0
+
+
+def test_jitter_is_not_loss():
+    rng = np.random.default_rng(0)
+    timestamps = 1000 + 5 * np.arange(5000) + np.round(rng.normal(0, 2.0, 5000)).astype(np.int64)
+    tracker = LossTracker()
+    feed(tracker, timestamps)
+    stats = tracker.snapshot()
+    assert stats['lost'] == 0
+    assert stats['duplicates'] == 0
+
+
+def test_jitter_with_drops():
+    rng = np.random.default_rng(1)
+    timestamps = 1000 + 5 * np.arange(5000)
+    drops = np.sort(rng.choice(np.arange(20, 4980), 20, replace=False))
+    # Spread out, so every gap is seen on its own
+    drops = drops[np.concatenate(([True], np.diff(drops) > 20))]
+    timestamps = np.delete(timestamps, drops)
+    timestamps = timestamps + np.round(rng.normal(0, 2.0, len(timestamps))).astype(np.int64)
+    tracker = LossTracker()
+    feed(tracker, timestamps)
+    assert tracker.snapshot()['lost'] == len(drops)
+
+
+def test_malformed_lines_explain_the_gap():
+    tracker = LossTracker()
+    timestamps = 1000 + 5 * np.arange(100)
+    tracker.check_timestamps(timestamps[:50], sample_rate=200)
+    tracker.check_timestamps(timestamps[51:], malformed=1, sample_rate=200)
+    stats = tracker.snapshot()
+    assert stats['lost'] == stats['lost_corrupt'] == 1
+    assert stats['malformed'] == 1
+
+
+def test_device_restart_is_not_loss():
+    tracker = LossTracker()
+    feed(tracker, 600000 + 5 * np.arange(500))
+    feed(tracker, 5 * np.arange(500))
+    stats = tracker.snapshot()
+    assert stats['restarts'] == 1
+    assert stats['lost'] == 0
+    assert stats['duplicates'] == 0
+
+
+def test_restart_stream_forgets_the_pause():
+    tracker = LossTracker()
+    feed(tracker, 1000 + 5 * np.arange(100))
+    tracker.restart_stream()
+    feed(tracker, 60000 + 5 * np.arange(100))
+    assert tracker.snapshot()['complete']
+
+
+def test_frames_and_since():
+    tracker = LossTracker()
+    tracker.check_frames(np.arange(10), gaps=2, crc_errors=1)
+    baseline = tracker.snapshot()
+    tracker.check_frames(np.arange(10, 20), duplicates=1)
+    stats = tracker.since(baseline)
+    assert stats['received'] == 10
+    assert stats['lost'] == 0
+    assert stats['duplicates'] == 1
+    total = tracker.snapshot()
+    assert (total['lost_corrupt'], total['lost_missing']) == (1, 1)
@@ -0,0 +1,107 @@
+"""BatchQueue backpressure policies"""
+
+import queue
+import threading
+
+import numpy as np
+import pytest
+
+from icm20948_queue import BatchQueue
+from icm20948_samples import SAMPLE_DTYPE
+
+
+def batch(first, count=10):
+    samples = np.zeros(count, dtype=SAMPLE_DTYPE)
+    samples['timestamp'] = first + np.arange(count)
+    return samples
+
+
+def firsts(entries):
+    return [int(item['timestamp'][0]) if kind == 'samples' else item for kind, item in entries]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BatchQueue('fifo')
+
+
+def test_drop_oldest_keeps_the_newest():
+    dropped = []
+    q = BatchQueue('drop_oldest', max_items=3, on_drop=lambda kind, item: dropped.append(item))
+    for i in range(5):
+        assert q.put('samples', batch(i * 10))
+    assert firsts(q.drain()) == [20, 30, 40]
+    assert firsts(('samples', item) for item in dropped) == [0, 10]
+    assert q.stats()['dropped_samples'] == 20
+
+
+def test_drop_newest_keeps_the_oldest():
+    q = BatchQueue('drop_newest', max_samples=25)
+    assert q.put('samples', batch(0))
+    assert q.put('samples', batch(10))
+    assert not q.put('samples', batch(20))
+    assert firsts(q.drain()) == [0, 10]
+    assert q.stats()['dropped_items'] == 1
+
+
+def test_oversized_item_enters_an_empty_queue():
+    q = BatchQueue('drop_newest', max_samples=5)
+    assert q.put('samples', batch(0, 50))
+    assert len(q) == 1
+
+
+def test_block_waits_for_the_consumer():
+    q = BatchQueue('block', max_items=2)
+    q.put('line', 'a')
+    q.put('line', 'b')
+    producer = threading.Thread(target=q.put, args=('line', 'c'))
+    producer.start()
+    producer.join(0.1)
+    assert producer.is_alive()
+    assert q.get(timeout=1.0) == ('line', 'a')
+    producer.join(1.0)
+    assert firsts(q.drain()) == ['b', 'c']
+
+
+def test_block_timeout_drops():
+    q = BatchQueue('block', max_items=1, block_timeout=0.05)
+    q.put('line', 'a')
+    assert not q.put('line', 'b')
+    assert q.stats()['dropped_items'] == 1
+    assert q.stats()['blocked_s'] > 0
+
+
+def test_spill_keeps_everything_in_order(tmp_path):
+    q = BatchQueue('spill', max_items=3, max_samples=25, spill_dir=str(tmp_path))
+    expected = []
+    for i in range(40):
+        q.put('samples', batch(i * 10))
+        q.put('line', f'line {i}')
+        expected += [i * 10, f'line {i}']
+    stats = q.stats()
+    assert stats['items'] <= 3 and stats['samples'] <= 25
+    assert stats['spill_pending'] == len(q) - stats['items'] > 0
+
+    received = []
+    while len(received) < 30:
+        received.append(q.get(timeout=1.0))
+        # Producers keep appending behind the spilled items
+        q.put('line', f'late {len(received)}')
+        expected.append(f'late {len(received)}')
+    received += q.drain()
+    assert firsts(received) == expected
+    assert q.stats()['spill_bytes'] == 0
+    with pytest.raises(queue.Empty):
+        q.get_nowait()
+
+
+def test_close_wakes_the_consumer():
+    q = BatchQueue('spill', max_items=1)
+    q.put('line', 'a')
+    q.put('line', 'b')
+    q.close()
+    assert not q.put('line', 'c')
+    # What is in memory can still be taken; the spill file is gone
+    assert q.get(timeout=1.0) == ('line', 'a')
+    with pytest.raises(queue.Empty):
+        q.get(timeout=1.0)
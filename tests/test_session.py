@@ -0,0 +1,69 @@
+"""Session recording, time lookups and crash recovery"""
+
+import os
+
+import numpy as np
+
+from icm20948_samples import SAMPLE_DTYPE
+from icm20948_session import (INDEX_DTYPE, INDEX_NAME, SessionWriter, column_path, create_session,
+                              open_session, write_session)
+
+
+def samples(count, first=0):
+    data = np.zeros(count, dtype=SAMPLE_DTYPE)
+    data['timestamp'] = first + 2 * np.arange(count)
+    data['time'] = data['timestamp'] / 1000.0
+    data['accel_x'] = np.arange(count)
+    return data
+
+
+def test_round_trip_and_time_slice(tmp_path):
+    path = str(tmp_path / 'capture.icms')
+    data = samples(5000)
+    write_session(path, data, {'sample_rate': 500})
+    session = open_session(path)
+    assert len(session) == 5000
+    assert session.device_config == {'sample_rate': 500}
+    np.testing.assert_array_equal(session.to_array(), data)
+    window = session.slice_time(3001, 4001)
+    assert window['timestamp'][0] == 3002
+    assert window['timestamp'][-1] == 4000
+
+
+def test_appending_writer_continues_the_session(tmp_path):
+    path = str(tmp_path / 'capture.icms')
+    write_session(path, samples(1500))
+    writer = SessionWriter(path)
+    writer.write(samples(1500, first=3000))
+    writer.close()
+    session = open_session(path)
+    assert len(session) == 3000
+    assert session.index_of(3000) == 1500
+
+
+def test_recovery_of_a_truncated_column(tmp_path):
+    path = str(tmp_path / 'capture.icms')
+    create_session(path)
+    writer = SessionWriter(path)
+    writer.write(samples(3000))
+    writer.close()
+    # A crash mid-write: one column is short by a sample and a half
+    name = column_path(path, 'accel_x')
+    with open(name, 'r+b') as f:
+        f.truncate(os.path.getsize(name) - 6)
+
+    session = open_session(path)
+    assert len(session) == 2998
+    assert session.index_of(2 * 2997) == 2997
+
+    # Reopening for writing cuts every column to the complete samples
+    writer = SessionWriter(path)
+    writer.write(samples(10, first=10000))
+    writer.close()
+    session = open_session(path)
+    assert len(session) == 3008
+    assert session.header['sample_count'] == 3008
+    np.testing.assert_array_equal(session['accel_x'][2990:3000], [2990, 2991, 2992, 2993, 2994, 2995, 2996, 2997, 0, 1])
+    index = np.fromfile(os.path.join(path, INDEX_NAME), dtype=INDEX_DTYPE)
+    assert index['offset'][-1] < 3008
+    assert session.index_of(10000) == 2998